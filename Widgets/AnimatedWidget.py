@@ -27,19 +27,58 @@ class AnimatedWidget():
         """
         pass
 
+    def extend_data(self, color_vectors=None, plot_data=None, trigger=None):
+        """
+        Called when frames or plot rows are appended to the loaded data
+        e.g. in watch mode. Widget should take the new data in place.
+        @param color_vectors are the newly appended raw frames
+        @param plot_data is the whole, extended plot DataFrame
+        @param trigger is the whole, extended trigger list
+        """
+        pass
+
+    def replace_data(self, color_vectors):
+        """
+        Called when already loaded frames were moved to another buffer,
+        e.g. when a growing shared memory block is reallocated.
+        Widget should drop references to the previous frames.
+        @param color_vectors are all the frames the widget has got so far
+        """
+        pass
+
+    def recolor(self, options):
+        """
+        Called when only color options of the widget changed.
+        Widget able to recolor its data in place should do so
+        @param options are the new options
+        @return True if applied, otherwise the widget is built again
+        """
+        return False
+
     def receivedOptions(self):
         self.normalize = self.options[0]
         self.subsampling = int(self.options[1])
         if self.subsampling == 0:
             self.subsampling = 1
         self.layer = self.options[2]
+        if getattr(self, 'read_plan', None) is not None:
+            # frames and header are already reduced by the plan
+            self.subsampling, self.layer = self.read_plan.remaining(
+                                                self.subsampling, self.layer)
         self.scale = int(self.options[3])
         self.vector_set = self.options[4]
         self.color_policy_type = self.options[5]
         self.hyperContrast = self.options[6]
+        try:
+            # only 3d widgets choose color format and lookup table
+            self.color_format = self.options[7]
+            self.color_lut = self.options[8]
+        except IndexError:
+            self.color_format = 'float32'
+            self.color_lut = False
         try:    
             # only arrows have resolution
-            self.resolution = self.options[7]
+            self.resolution = self.options[9]
         except IndexError:
             pass
 
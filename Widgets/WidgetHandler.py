@@ -10,6 +10,7 @@ class WidgetHandler:
         self._groupBox = None
         self._layout = None
         self._widget = None
+        self._alias = None
         self._visible = True
         self.groupBox = QtWidgets.QGroupBox( \
             "Window " + str(self._number + 1), self._parent)
@@ -51,6 +52,15 @@ class WidgetHandler:
     def widget(self, value):
         self._widget = value
 
+    @property
+    def alias(self):
+        """Alias of the widget shown in the pane, None if there is none"""
+        return self._alias
+
+    @alias.setter
+    def alias(self, value):
+        self._alias = value
+
     def deleteWidget(self):
         self._widget.setParent(None)
 
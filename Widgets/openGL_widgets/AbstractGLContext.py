@@ -15,6 +15,7 @@ import numpy as np
 from cython_modules.color_policy import multi_iteration_normalize
 from cython_modules.cython_parse import getLayerOutline, genCubes
 from processing.ColorPolicy import ColorPolicy
+from processing.color_engine import ColorEngine
 from pattern_types.Patterns import AbstractGLContextDecorators
 
 from util_tools.buildVerifier import BuildVerifier
@@ -26,6 +27,9 @@ import pygame
 class AbstractGLContext(QOpenGLWidget, AnimatedWidget):
     PYGAME_INCLUDED = False
     ANY_GL_WIDGET_IN_VIEW = 0
+    GL_COLOR_TYPES = {'float32': gl.GL_FLOAT,
+                      'float16': gl.GL_HALF_FLOAT,
+                      'uint8': gl.GL_UNSIGNED_BYTE}
 
     def __init__(self, parent=None):
         super(AbstractGLContext, self).__init__(parent)
@@ -72,6 +76,16 @@ class AbstractGLContext(QOpenGLWidget, AnimatedWidget):
         """
         Some calculations that take place before object gets rendered
         """
+        self.create_color_engine()
+        self.colorX = self.engine.view('original_color')
+        self.occupancy = self.engine.view('occupancy')
+
+    def create_color_engine(self):
+        """
+        Colors are computed per frame, when the frame is first shown,
+        color_vectors and other per frame attributes are views of
+        the engine cache
+        """
         # get vector outline
         self.vectors_list = getLayerOutline(self.file_header)
         self.auto_center()
@@ -80,18 +94,110 @@ class AbstractGLContext(QOpenGLWidget, AnimatedWidget):
         xc = int(self.file_header['xnodes'])
         yc = int(self.file_header['ynodes'])
         zc = int(self.file_header['znodes'])
-        # change drawing function
-        self.color_vectors, self.vectors_list, self.colorX = \
-                    ColorPolicy.standard_procedure(self.vectors_list,
-                                                   self.color_vectors,
-                                                   self.iterations,
-                                                   self.subsampling,
-                                                   xc, yc, zc,
-                                                   self.layer,
-                                                   self.vector_set,
-                                                   color_policy_type=self.color_policy_type,
-                                                   hyperContrast=self.hyperContrast)            
-        
+        self.engine = ColorEngine(self.color_vectors, self.vectors_list,
+                                  xc, yc, zc,
+                                  self.subsampling,
+                                  self.layer,
+                                  self.vector_set,
+                                  color_policy_type=self.color_policy_type,
+                                  hyperContrast=self.hyperContrast,
+                                  derive=self.derive_frame,
+                                  color_format=self.color_format,
+                                  derive_color=self.derive_color_frame,
+                                  color_lut=self.color_lut)
+        self.vectors_list = self.engine.outline
+        self.color_vectors = self.engine.view('color')
+
+    def derive_frame(self, entry, outline):
+        """
+        Further per frame arrays (e.g. vertex buffers) computed and cached
+        together with the colors of a frame
+        @param entry is a dict of 'original_color', 'occupancy', colors
+                     are only given to derive_color_frame
+        @param outline is the padded outline, (N, 4)
+        @return dict of arrays added to the entry
+        """
+        return {}
+
+    def derive_color_frame(self, entry, outline):
+        """
+        As derive_frame, for arrays that depend on colors of the frame,
+        these are computed again after recolor
+        """
+        return {}
+
+    def recolor(self, options):
+        """
+        Applies new color options (vectors, color policy, hyper contrast,
+        lookup table)
+        to the loaded data, geometry and normalized vectors are reused
+        @param options list as returned by the options window
+        @return False if options other than colors changed,
+                the widget has to be built again then
+        """
+        # fields 4-6 are vectors, color policy and hyper contrast, 8 is
+        # lookup table, color format (7) changes buffers so it needs
+        # a new widget
+        if list(options[:4]) + list(options[7:8]) + list(options[9:]) != \
+                            list(self.options[:4]) + \
+                            list(self.options[7:8]) + list(self.options[9:]):
+            return False
+        self.options = options
+        self.receivedOptions()
+        self.engine.recolor(self.vector_set,
+                            color_policy_type=self.color_policy_type,
+                            hyperContrast=self.hyperContrast,
+                            color_lut=self.color_lut)
+        self.engine.prewarm(self.i)
+        self.update()
+        return True
+
+    def frame_colors(self):
+        """
+        Colors of the current frame with one entry per vertex, ready
+        for upload. Only one color per cell is kept for each frame,
+        it is repeated color_repeat times into a reused staging buffer
+        """
+        colors = self.color_vectors[self.i]
+        size = len(colors)*self.color_repeat*colors.shape[1]
+        if getattr(self, 'color_staging', None) is None or \
+                                        len(self.color_staging) != size or \
+                                        self.color_staging.dtype != colors.dtype:
+            self.color_staging = np.empty(size, dtype=colors.dtype)
+        return ColorPolicy.expand_vbo_colors(colors, self.color_repeat,
+                                             self.color_staging)
+
+    def color_buffer_bytes(self):
+        """
+        Size of the per vertex color buffer of a frame
+        """
+        colors = self.color_vectors[0]
+        return len(colors)*self.color_repeat*colors.shape[1]*colors.itemsize
+
+    def color_pointer(self, vertex_step=1):
+        """
+        Sets glColorPointer for the color format in use
+        @param vertex_step takes color of every vertex_step-th vertex
+        """
+        dtype, components = ColorPolicy.COLOR_FORMATS[self.color_format]
+        stride = 0 if vertex_step == 1 else \
+                        vertex_step*components*np.dtype(dtype).itemsize
+        gl.glColorPointer(components, self.GL_COLOR_TYPES[self.color_format],
+                          stride, None)
+
+    def extend_data(self, color_vectors=None, plot_data=None, trigger=None):
+        """
+        Appended frames are only passed to the color engine, their colors
+        are computed when shown, geometry is left as it is
+        """
+        if color_vectors is None or not len(color_vectors):
+            return
+        self.engine.extend(color_vectors)
+        self.iterations += len(color_vectors)
+
+    def replace_data(self, color_vectors):
+        self.engine.replace(color_vectors)
+
     def handleOptionalData(self):
         super().handleOptionalData()
         # must handle iterations since these are optional
@@ -204,6 +310,9 @@ class AbstractGLContext(QOpenGLWidget, AnimatedWidget):
         self.i = value      
         self.i %= self.iterations
         self.record = record
+        if getattr(self, 'engine', None) is not None:
+            # next frames are colored while this one is drawn
+            self.engine.prewarm(self.i)
 
     def keyPressEvent(self, event):
         """
@@ -7,7 +7,6 @@ from pattern_types.Patterns import AbstractGLContextDecorators
 
 from processing.ColorPolicy import ColorPolicy
 from ctypes import c_void_p
-from processing.multiprocessing_parse import asynchronous_pool_order
 from cython_modules.color_policy import multi_iteration_normalize, process_vector_to_vbo
 from cython_modules.cython_parse import getLayerOutline
 import math
@@ -42,34 +41,19 @@ class ArrowGLContext(AbstractGLContext, QWidget):
         self.prerendering_calculation()
 
     def prerendering_calculation(self):
-        # get vector outline
-        self.vectors_list = getLayerOutline(self.file_header)
-        self.auto_center()
-        # adjust spacing
-        xc = int(self.file_header['xnodes'])
-        yc = int(self.file_header['ynodes'])
-        zc = int(self.file_header['znodes'])
-        # change drawing function
-        self.color_vectors, self.vectors_list, self.original_color = \
-                    ColorPolicy.standard_procedure(self.vectors_list,
-                                                   self.color_vectors,
-                                                   self.iterations,
-                                                   self.subsampling,
-                                                   xc, yc, zc,
-                                                   self.layer,
-                                                   self.vector_set,
-                                                   color_policy_type=self.color_policy_type,
-                                                   hyperContrast=self.hyperContrast)
-        # multi_iteration_normalize(self.colorX)
-        self.structure_vbo = self.regenerate_structure(self.original_color)
+        self.create_color_engine()
+        self.original_color = self.engine.view('original_color')
+        # arrows of a frame are built with its colors, see derive_frame
+        self.structure_vbo = self.engine.view('structure_vbo')
+        self.n = len(self.vectors_list)
         self.index_required = self.SIDES*2
         self.indices = self.generate_index()
-        self.color_vectors = ColorPolicy.apply_vbo_format(self.color_vectors, 
-                                                          k=(self.index_required))
+        # colors are kept per cell and expanded on upload
+        self.color_repeat = self.index_required
         self.buffers = None
         # pad the color
         self.color_vertices = len(self.vectors_list)
-        self.color_buffer_len = len(self.color_vectors[0])
+        self.color_buffer_len = self.color_buffer_bytes()
 
         self.__FLOAT_BYTE_SIZE__ = 8
 
@@ -102,8 +86,7 @@ class ArrowGLContext(AbstractGLContext, QWidget):
         # color buffer
         gl.glBindBuffer(gl.GL_ARRAY_BUFFER, buffers[1])
         gl.glBufferData(gl.GL_ARRAY_BUFFER,
-                        np.array(self.color_vectors[self.i],
-                        dtype='float32').flatten(),
+                        self.frame_colors(),
                         gl.GL_DYNAMIC_DRAW)
 
         # # index buffer
@@ -131,9 +114,8 @@ class ArrowGLContext(AbstractGLContext, QWidget):
             # later move to set_i function so that reference changes
             # does not cause buffer rebinding
             gl.glBufferSubData(gl.GL_ARRAY_BUFFER, 0, 
-                               self.color_buffer_len*4,
-                               np.array(self.color_vectors[self.i],
-                               dtype='float32').flatten())
+                               self.color_buffer_len,
+                               self.frame_colors())
         self.draw_vbo()
 
     @AbstractGLContextDecorators.recording_decorator
@@ -145,7 +127,7 @@ class ArrowGLContext(AbstractGLContext, QWidget):
         # bind color buffer
         gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, self.buffers[2])
         gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.buffers[1])
-        gl.glColorPointer(3, gl.GL_FLOAT, 0, None)
+        self.color_pointer()
 
         # bind vertex buffer - cylinder
         # stride is one  vertex
@@ -170,20 +152,15 @@ class ArrowGLContext(AbstractGLContext, QWidget):
         gl.glDisableClientState(gl.GL_COLOR_ARRAY)
         gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
 
-    def regenerate_structure(self, colors_list):
-        col_len = len(colors_list)
-        iterative_vbo = np.ndarray((col_len, 
-                                    len(self.vectors_list)*self.SIDES*4,3), 
-                                    dtype='float32')
-        for i in range(0, self.iterations):
-            iterative_vbo[i, :] = process_vector_to_vbo(colors_list[i],
-                                                        self.vectors_list, 
-                                                        self.CYLINDER_CO_ROT,
-                                                        self.CONE_CO_ROT,
-                                                        self.T_ROTATION,
-                                                        self.HEIGHT,
-                                                        self.SIDES)
-        self.n = len(self.vectors_list)
-        return iterative_vbo
-
-
+    def derive_frame(self, entry, outline):
+        """
+        arrow vertices of a frame, rotated by its normalized vectors
+        """
+        structure = process_vector_to_vbo(entry['original_color'],
+                                          outline,
+                                          self.CYLINDER_CO_ROT,
+                                          self.CONE_CO_ROT,
+                                          self.T_ROTATION,
+                                          self.HEIGHT,
+                                          self.SIDES)
+        return {'structure_vbo': structure}
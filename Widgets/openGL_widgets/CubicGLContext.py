@@ -35,10 +35,9 @@ class CubicGLContext(AbstractGLContext, QWidget):
                     self.file_header['ybase']*1e9*self.subsampling,
                     self.file_header['zbase']*1e9)
             self.vectors_list, self.vertices = genCubes(self.vectors_list, dims)
-            self.color_vectors = ColorPolicy.apply_vbo_format(self.color_vectors)
-            # TODO: temporary fix, dont know why x4, should not be multiplied
-            # at all!
-            self.buffer_len = len(self.color_vectors[0])*4
+            # each cube has 24 vertices, colors are expanded on upload
+            self.color_repeat = 24
+            self.buffer_len = self.color_buffer_bytes()
         elif self.function_select == 'slow':
             self.drawing_function = self.slower_cubic_draw
 
@@ -53,8 +52,7 @@ class CubicGLContext(AbstractGLContext, QWidget):
         # color buffer
         gl.glBindBuffer(gl.GL_ARRAY_BUFFER, buffers[1])
         gl.glBufferData(gl.GL_ARRAY_BUFFER,
-                        np.array(self.color_vectors[self.i],
-                        dtype='float32').flatten(),
+                        self.frame_colors(),
                         gl.GL_DYNAMIC_DRAW)
         return buffers
 
@@ -66,8 +64,7 @@ class CubicGLContext(AbstractGLContext, QWidget):
             # later move to set_i function so that reference changes
             # does not cause buffer rebinding
             gl.glBufferSubData(gl.GL_ARRAY_BUFFER, 0, self.buffer_len,
-                               np.array(self.color_vectors[self.i],
-                               dtype='float32').flatten())
+                               self.frame_colors())
         self.draw_vbo()
 
     @AbstractGLContextDecorators.recording_decorator
@@ -80,7 +77,7 @@ class CubicGLContext(AbstractGLContext, QWidget):
         # bind color buffer
 
         gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.buffers[1])
-        gl.glColorPointer(3, gl.GL_FLOAT, 0, ctypes.c_void_p(0))
+        self.color_pointer()
 
         gl.glDrawArrays(gl.GL_QUADS, 0, int(self.vertices))
 
@@ -15,7 +15,6 @@ import numpy as np
 import OpenGL.GLU as glu
 import OpenGL.GL as gl
 import math as mt
-from multiprocessing import Pool
 import time as tm
 
 
@@ -28,18 +27,25 @@ class VectorGLContext(AbstractGLContext, QWidget):
 
     def prerendering_calculation(self):
         super().prerendering_calculation()
-        self.interleaved = ColorPolicy.apply_vbo_interleave_format(self.vectors_list,
-                                                                   self.color_vectors)
+        self.interleaved = self.engine.view('interleaved')
         self.buffers = None
-        ## pad the color
-        self.color_vectors = ColorPolicy.apply_vbo_format(self.color_vectors, k=2)
+        # colors are kept per cell and expanded to both line ends on upload
+        self.color_repeat = 2
         self.color_vertices = len(self.vectors_list)
         self.vertices = self.color_vertices*2
-        self.color_buffer_len = len(self.color_vectors[0])*4
-        self.inter_buffer_len = len(self.interleaved[0])*4
+        self.color_buffer_len = self.color_buffer_bytes()
+        self.inter_buffer_len = self.interleaved[0].nbytes
 
         self.__FLOAT_BYTE_SIZE__ = 8
 
+    def derive_color_frame(self, entry, outline):
+        # line ends are placed by the colors
+        interleaved = ColorPolicy.apply_vbo_interleave_format(
+                                        outline,
+                                        entry['color'][np.newaxis],
+                                        entry['occupancy'][np.newaxis])
+        return {'interleaved': interleaved[0]}
+
     @AbstractGLContextDecorators.recording_decorator
     def slow_arrow_draw(self):
         gl.glLineWidth(2*self.scale)
@@ -55,7 +61,7 @@ class VectorGLContext(AbstractGLContext, QWidget):
         gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
 
         gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.buffers[1])
-        gl.glColorPointer(3, gl.GL_FLOAT, 0, None)
+        self.color_pointer()
 
         # draw the lines
         gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.buffers[0])
@@ -64,7 +70,8 @@ class VectorGLContext(AbstractGLContext, QWidget):
 
         # now the points
         gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.buffers[1])
-        gl.glColorPointer(3, gl.GL_FLOAT, 3*self.__FLOAT_BYTE_SIZE__, None)
+        # one color per vector, skip the color of the line end
+        self.color_pointer(vertex_step=2)
 
         # stride is 3 bytes (3 floats) VVVCCCVVVCCC etc...
         # VVVACCCAVVVACCCA etc. in case of 4f
@@ -91,8 +98,7 @@ class VectorGLContext(AbstractGLContext, QWidget):
 
             gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.buffers[1])
             gl.glBufferSubData(gl.GL_ARRAY_BUFFER, 0, self.color_buffer_len,
-                               np.array(self.color_vectors[self.i],
-                               dtype='float32').flatten())
+                               self.frame_colors())
 
         self.standard_vbo_draw()
 
@@ -109,7 +115,6 @@ class VectorGLContext(AbstractGLContext, QWidget):
         # color buffer
         gl.glBindBuffer(gl.GL_ARRAY_BUFFER, buffers[1])
         gl.glBufferData(gl.GL_ARRAY_BUFFER,
-                        np.array(self.color_vectors[self.i],
-                        dtype='float32').flatten(),
+                        self.frame_colors(),
                         gl.GL_DYNAMIC_DRAW)
         return buffers
@@ -67,6 +67,16 @@ class Canvas(AbstractCanvas):
         self.plot_axis.set_title('{}/{}'.format(self.i, self.internal_iterations))
 
 
+    def extend_data(self, color_vectors=None, plot_data=None, trigger=None):
+        if plot_data is None:
+            return
+        self.plot_data = plot_data
+        self.trigger = trigger
+        self.fig.clf()
+        self.createPlotCanvas()
+        self.replot()
+        self.plot_axis.get_figure().canvas.draw()
+
     @AbstractGLContextDecorators.recording_decorator
     def replot(self):
         if self.synchronizedPlot == False and not self.one_onePlot:
@@ -57,6 +57,16 @@ class Canvas2Dupgraded(AbstractCanvas):
                                     width=self.options['marker_size']),
                                     name="data1", clear=True)
 
+    def extend_data(self, color_vectors=None, plot_data=None, trigger=None):
+        if plot_data is None:
+            return
+        self.plot_data = plot_data
+        self.trigger = trigger
+        self.construct_triggered_plot()
+        self.graph_data = self.plot_data[self.title].tolist()
+        self.internal_iterations = len(self.graph_data)
+        self.createPlotCanvas()
+
     def on_resize_geometry_reset(self, geom):
         """
         when another widget is promoted, this window must resize too
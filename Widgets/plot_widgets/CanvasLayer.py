@@ -2,11 +2,10 @@ from matplotlib import cm
 import numpy as np
 from pattern_types.Patterns import AbstractGLContextDecorators
 from Widgets.plot_widgets.AbstractCanvas import AbstractCanvas
-from processing.multiprocessing_parse import asynchronous_pool_order
+from processing.executor_service import ExecutorService
 from cython_modules.color_policy import multi_iteration_normalize, \
                                         multi_iteration_dot_product, \
                                         calculate_layer_colors
-from copy import deepcopy
 
 class CanvasLayer(AbstractCanvas):
     def __init__(self, data_dict, parent=None):
@@ -34,8 +33,15 @@ class CanvasLayer(AbstractCanvas):
         self.title = 'Displayed layer {}'.format(self.layer)
         self.i = self.current_state
 
-        copy_color_vectors = deepcopy(self.color_vectors)
+        # pick the layer first so that only this layer is read and copied
+        layer_size = self.xc*self.yc
+        copy_color_vectors = np.array(self.color_vectors[:,
+                                        self.layer*layer_size:
+                                        (self.layer+1)*layer_size, :],
+                                      dtype=np.float32)
         self.colors, dx, dy = self.reshape_data(copy_color_vectors)
+        # colors are computed, loaded frames are not referenced any longer
+        self.color_vectors = None
 
         self.fig.suptitle(self.title)
         self.plot_axis = self.fig.add_subplot(111)
@@ -52,6 +58,22 @@ class CanvasLayer(AbstractCanvas):
         self.plot_axis.set_autoscale_on(False)
         self.plot_axis.set_title('{}/{}'.format(self.i, self.iterations))
 
+    def extend_data(self, color_vectors=None, plot_data=None, trigger=None):
+        if color_vectors is None or not len(color_vectors):
+            return
+        layer_size = self.xc*self.yc
+        iterations = self.iterations
+        self.iterations = len(color_vectors)
+        copy_color_vectors = np.array(color_vectors[:,
+                                        self.layer*layer_size:
+                                        (self.layer+1)*layer_size, :],
+                                      dtype=np.float32)
+        colors, _, _ = self.reshape_data(copy_color_vectors)
+        self.colors = np.concatenate((self.colors,
+                                      colors.reshape(self.iterations,
+                                                     layer_size)))
+        self.iterations += iterations
+
     @AbstractGLContextDecorators.recording_decorator
     def replot(self):
         self.plot_axis.hpl.set_array(self.colors[self.i])
@@ -61,20 +83,20 @@ class CanvasLayer(AbstractCanvas):
         """
         reshaping the data so that plotting might happen faster
         """
+        occupancy = None
         if self.normalize:
-            multi_iteration_normalize(copy_color_vectors)
+            occupancy = multi_iteration_normalize(copy_color_vectors,
+                                                  occupancy=True)
         # dot product
-        copy_color_vectors = np.array(copy_color_vectors)
-        copy_color_vectors = copy_color_vectors.reshape(self.iterations,
-                                                        self.zc, self.yc,
-                                                        self.xc, 3)
-        copy_color_vectors = copy_color_vectors[:, self.layer, :, :, :]
         copy_color_vectors = copy_color_vectors.reshape(self.iterations,
                                                             self.xc*self.yc, 3)
-        copy_color_vectors = asynchronous_pool_order(calculate_layer_colors,
-                                                     (self.vector_set,),
-                                                     copy_color_vectors)
-        copy_color_vectors = np.array(copy_color_vectors, dtype=np.float)
+        copy_color_vectors = ExecutorService.map(calculate_layer_colors,
+                                                 copy_color_vectors,
+                                                 (self.vector_set,))
+        copy_color_vectors = np.array(copy_color_vectors, dtype=np.float64)
+        if occupancy is not None:
+            # empty cells are shown as zero angle
+            copy_color_vectors[occupancy == 0] = 0
         try:
             assert copy_color_vectors.shape == (self.iterations, self.xc, self.yc)
         except AssertionError:
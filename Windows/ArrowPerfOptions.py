@@ -22,6 +22,7 @@ class ArrowPerfOptions(QWidget, Ui_Dialog, GeneralPerf):
         self.resolution = 16
         self.subsampling = 1
         self.general_initialization()
+        self.colorOptions(self.verticalLayout_4)
         self.basicOptions()
         self.show()
 
@@ -76,6 +77,10 @@ class ArrowPerfOptions(QWidget, Ui_Dialog, GeneralPerf):
         self.resolution = self.horizontalSlider_4.value()
         self.label_8.setText("Resolution {}".format(self.resolution))
 
+    def load_options(self, options):
+        super().load_options(options)
+        self.horizontalSlider_4.setValue(options[9])
+
     def optionsVerifier(self):
         # order as follows: color scheme, subsampling, layer
         # checkBox_5 is normalize
@@ -87,6 +92,8 @@ class ArrowPerfOptions(QWidget, Ui_Dialog, GeneralPerf):
                             self.parseVectors(),
                             self.color_selection,
                             self.checkBox_6.isChecked(),
+                            self.comboBox_format.currentText(),
+                            self.checkBox_lut.isChecked(),
                             self.resolution]
         else:
             optionsList = [ self.checkBox_5.isChecked(),
@@ -96,5 +103,7 @@ class ArrowPerfOptions(QWidget, Ui_Dialog, GeneralPerf):
                             self.parseVectors(),
                             self.color_selection,
                             self.checkBox_6.isChecked(),
+                            self.comboBox_format.currentText(),
+                            self.checkBox_lut.isChecked(),
                             self.resolution]
         return optionsList
@@ -1,6 +1,8 @@
 import re 
 import numpy as np
+from PyQt5.QtWidgets import QComboBox, QCheckBox
 from util_tools.PopUp import PopUpWrapper
+from processing.ColorPolicy import ColorPolicy
 
 
 
@@ -13,6 +15,22 @@ class GeneralPerf:
         self.comboBox.activated[str].connect(self.changeColorPolicy)
         self.changeColorPolicy(self.color_selection)
 
+    def colorOptions(self, layout):
+        """
+        adds choice of the format colors are kept and uploaded in,
+        uint8 (RGBA8) takes a third and float16 half of float32 memory,
+        and of coloring by a direction lookup table
+        @param layout is the layout holding the color policy combo box
+        """
+        self.comboBox_format = QComboBox(self)
+        self.comboBox_format.addItems(list(ColorPolicy.COLOR_FORMATS))
+        self.comboBox_format.setToolTip("Color format")
+        layout.addWidget(self.comboBox_format)
+        self.checkBox_lut = QCheckBox("Color lookup table?", self)
+        self.checkBox_lut.setToolTip("Colors are looked up by quantized "
+                                     "direction, not with hyper contrast")
+        layout.addWidget(self.checkBox_lut)
+
     def layerChange(self):
         val = self.horizontalSlider_2.value()
         self.label_3.setText("Layer: {}".format(val))
@@ -53,6 +71,33 @@ class GeneralPerf:
         else:
             return False
 
+    def load_options(self, options):
+        """
+        fills the window with options of an existing widget
+        so that only these changed by user differ
+        @param options list as returned by optionsVerifier
+        """
+        normalize, subsampling, layer, size, vectors, policy, contrast = \
+                                                                options[:7]
+        self.checkBox_5.setChecked(normalize)
+        self.horizontalSlider.setValue(subsampling)
+        if layer == 'all':
+            self.checkBox.setChecked(True)
+        else:
+            self.checkBox.setChecked(False)
+            self.horizontalSlider_2.setValue(layer)
+        self.horizontalSlider_3.setValue(size)
+        self.comboBox.setCurrentText(policy)
+        self.changeColorPolicy(policy)
+        # vectors are normalized, entries are signs of components
+        for lineEdit, vector in zip((self.lineEdit, self.lineEdit_2,
+                                     self.lineEdit_3), vectors):
+            lineEdit.setText(str([int(np.sign(x)) for x in vector]))
+        self.checkBox_6.setChecked(contrast)
+        if len(options) > 8:
+            self.comboBox_format.setCurrentText(options[7])
+            self.checkBox_lut.setChecked(options[8])
+
     def setEventHandler(self, handler):
         self.eventHandler = handler
 
@@ -20,6 +20,7 @@ class PerfOptions(QWidget, Ui_Dialog, GeneralPerf):
             self.checkBox.setChecked(True)
 
         self.general_initialization()
+        self.colorOptions(self.verticalLayout_3)
         self.initial_options(object_type)
 
         self.basicOptions()
@@ -75,7 +76,9 @@ class PerfOptions(QWidget, Ui_Dialog, GeneralPerf):
                             self.horizontalSlider_3.value(),
                             self.parseVectors(),
                             self.color_selection,
-                            self.checkBox_6.isChecked()]
+                            self.checkBox_6.isChecked(),
+                            self.comboBox_format.currentText(),
+                            self.checkBox_lut.isChecked()]
         else:
             optionsList = [ self.checkBox_5.isChecked(),
                             self.subsampling,
@@ -83,7 +86,9 @@ class PerfOptions(QWidget, Ui_Dialog, GeneralPerf):
                             self.horizontalSlider_3.value(),
                             self.parseVectors(),
                             self.color_selection,
-                            self.checkBox_6.isChecked()]
+                            self.checkBox_6.isChecked(),
+                            self.comboBox_format.currentText(),
+                            self.checkBox_lut.isChecked()]
         return optionsList
 
 
@@ -16,6 +16,7 @@ class ProgressBar(QtCore.QObject):
         self.i = 0
         self.counter = 0
         self.breakPoints = {}
+        self.mode = None
 
     def changeProgress(self):
         # print("progress...")
@@ -64,7 +65,26 @@ class ProgressBar(QtCore.QObject):
         self.mode = "smart"
 
 
+    def realProgress(self, done, total, msg=None):
+        """
+        shows actual progress instead of the timer driven one
+        :param done: units of work finished
+        :param total: all units of work
+        :param msg: optional label text
+        """
+        self.mode = "real"
+        if total:
+            self.gui.progressBar.setValue(int(100*done/total))
+        if msg is not None:
+            self.gui.progressLabel.setText(msg)
+        if done >= total:
+            self.gui.close()
+
     def close(self):
+        if self.mode not in ("dumb", "smart"):
+            # no timer is running to close the window
+            self.gui.close()
+            return
         self.counter = 1000
         self.i = 101
         self.gui.progressLabel.setText("Finishing...")
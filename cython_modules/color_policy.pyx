@@ -3,6 +3,8 @@ import math
 
 cimport numpy as np
 cimport cython
+from cython.parallel cimport prange
+from libc.math cimport fabs, sqrtf
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
@@ -15,24 +17,82 @@ def atomic_dot_product(np.ndarray[np.float32_t, ndim=1] color_vector,
     """
     return [np.dot(color_vector, vector) for vector in relative_vector_set]
 
-@cython.boundscheck(False)
-@cython.wraparound(False)
-def multi_iteration_dot_product(np.ndarray[np.float32_t, ndim=2] color_iteration,
-                                np.ndarray[np.float32_t, ndim=2] vec_set):
+# scratch memory of multi_iteration_dot_product, iterations are
+# transformed in chunks of at most this size
+DOT_PRODUCT_CHUNK_BYTES = 64*1024*1024
+
+def multi_iteration_dot_product(np.ndarray color_iterations,
+                                np.ndarray[np.float32_t, ndim=2] vec_set,
+                                chunk_bytes=DOT_PRODUCT_CHUNK_BYTES):
     """
     dot product to be performed on an array of color matrices and 
     a selected vector set (each vector for each of 3 dimensions)
+    color = 0.5*(color @ vec_set.T + 1) computed as a single matrix product
+    per chunk of iterations, 0.5 is folded into the matrix which does not
+    change rounding as scaling by 2 is exact
+    @param color_iterations: float32 array of shape (N, 3) (single
+                             iteration) or (iterations, N, 3), overwritten
+                             with colors
+    @param vec_set: vectors of R, G and B components, shape (3, 3)
+    @param chunk_bytes: bound on the scratch buffer
+    @return color_iterations
     """
-    cdef:
-        int i
-        int ci = color_iteration.shape[0]
-    for i in range(0, ci):
-        color_iteration[i] = [0.5*(np.dot(color_iteration[i], vector)+1) for vector in vec_set]
-    return color_iteration
+    if color_iterations.dtype != np.float32:
+        raise TypeError("color array must be float32, was {}".format(
+                                                    color_iterations.dtype))
+    if color_iterations.ndim == 2:
+        color_view = color_iterations[np.newaxis]
+    elif color_iterations.ndim == 3:
+        color_view = color_iterations
+    else:
+        raise ValueError("color array must have 2 or 3 dimensions")
+    transform = np.ascontiguousarray(0.5*vec_set.T, dtype=np.float32)
+    iterations = color_view.shape[0]
+    frame_bytes = max(1, color_view[0].nbytes)
+    chunk = max(1, min(iterations, chunk_bytes//frame_bytes))
+    scratch = np.empty((chunk,) + color_view.shape[1:], dtype=np.float32)
+    for start in range(0, iterations, chunk):
+        stop = min(start + chunk, iterations)
+        product = scratch[:stop - start]
+        np.matmul(color_view[start:stop], transform, out=product)
+        product += 0.5
+        color_view[start:stop] = product
+    return color_iterations
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def multi_iteration_cross_color(np.ndarray[np.float32_t, ndim=2] color_iteration,
+@cython.cdivision(True)
+cdef void cross_color_kernel(float[:, :, :] color, float[:] user_vector,
+                             float[:] negative_color,
+                             float[:] positive_color) nogil:
+    """
+    colors every cell of every iteration in place, arithmetic follows
+    the former per cell numpy expression so the result is bit-identical:
+    float products summed in double (as numpy's sdot does for 3 elements)
+    and blending with white in double
+    """
+    cdef:
+        Py_ssize_t it, i, k
+        float p0, p1, p2
+        float s
+        double abs_s
+    for it in range(color.shape[0]):
+        for i in prange(color.shape[1]):
+            p0 = color[it, i, 0]*user_vector[0]
+            p1 = color[it, i, 1]*user_vector[1]
+            p2 = color[it, i, 2]*user_vector[2]
+            s = <float>((<double>p0 + <double>p1) + <double>p2)
+            abs_s = fabs(<double>s)
+            if s > 0:
+                for k in range(3):
+                    color[it, i, k] = <float>(abs_s*positive_color[k] +
+                                              (1 - abs_s))
+            else:
+                for k in range(3):
+                    color[it, i, k] = <float>(abs_s*negative_color[k] +
+                                              (1 - abs_s))
+
+def multi_iteration_cross_color(np.ndarray color_iterations,
                                 np.ndarray[np.float32_t, ndim=1] user_vector,
                                 np.ndarray[np.float32_t, ndim=1] negative_color, 
                                 np.ndarray[np.float32_t, ndim=1] positive_color):
@@ -40,20 +100,31 @@ def multi_iteration_cross_color(np.ndarray[np.float32_t, ndim=2] color_iteration
     s is dot product
     positive color is when s > 0
     negative color is when s < 0
+    color is |s|*(positive or negative color) + (1-|s|)*white
+    @param color_iterations: float32 array of shape (N, 3) (single
+                             iteration) or (iterations, N, 3), overwritten
+                             with colors
+    @return color_iterations
     """
+    if color_iterations.dtype != np.float32:
+        raise TypeError("color array must be float32, was {}".format(
+                                                    color_iterations.dtype))
+    if color_iterations.ndim == 2:
+        color_view = color_iterations[np.newaxis]
+    elif color_iterations.ndim == 3:
+        color_view = color_iterations
+    else:
+        raise ValueError("color array must have 2 or 3 dimensions")
     cdef:
-        float s
-        int i
-        int ci = color_iteration.shape[0]
-    white = np.array([1, 1, 1], np.float32)
-    for i in range(0, ci):
-        s = np.dot(color_iteration[i], user_vector)
-        abs_s = np.abs(s)
-        if s > 0:
-            color_iteration[i] = abs_s*positive_color + (1-abs_s)*white
-        else:
-            color_iteration[i] = abs_s*negative_color + (1-abs_s)*white
-    return color_iteration
+        float[:, :, :] color_memview = color_view
+        float[:] user_memview = user_vector
+        float[:] negative_memview = negative_color
+        float[:] positive_memview = positive_color
+    # frames may be colored concurrently from other threads
+    with nogil:
+        cross_color_kernel(color_memview, user_memview, negative_memview,
+                           positive_memview)
+    return color_iterations
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
@@ -66,48 +137,227 @@ def atomic_normalization(np.ndarray[np.float32_t, ndim=2] color_vector):
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def multi_iteration_normalize(np.ndarray[np.float32_t, ndim=3] color_iterations):
+@cython.cdivision(True)
+cdef void normalize_kernel(float[:, :, :] color,
+                           unsigned char[:, :] occupancy,
+                           bint with_occupancy) nogil:
     """
-    normalization to be performed on an array of color matrices
+    normalizes every cell of every iteration in place, cells of zero
+    (or NaN) norm are set to zero vector and marked as empty
     """
     cdef:
-        int i
-        int ci = color_iterations.shape[0]
-    for i in range(0, ci):
-        color_iterations[i] = color_iterations[i]/np.linalg.norm(color_iterations[i], 
-                                                    axis=1, keepdims=True)
-    #np.nan_to_num(color_iterations, copy=False)
-    #return color_iterations
+        Py_ssize_t it, i
+        float norm
+        unsigned char occupied
+    for it in range(color.shape[0]):
+        for i in prange(color.shape[1]):
+            norm = sqrtf((color[it, i, 0]*color[it, i, 0] +
+                          color[it, i, 1]*color[it, i, 1]) +
+                          color[it, i, 2]*color[it, i, 2])
+            occupied = norm > 0
+            if occupied:
+                color[it, i, 0] = color[it, i, 0]/norm
+                color[it, i, 1] = color[it, i, 1]/norm
+                color[it, i, 2] = color[it, i, 2]/norm
+            else:
+                color[it, i, 0] = 0
+                color[it, i, 1] = 0
+                color[it, i, 2] = 0
+            if with_occupancy:
+                occupancy[it, i] = occupied
+
+def multi_iteration_normalize(np.ndarray color_iterations, occupancy=False):
+    """
+    normalization to be performed on an array of color matrices,
+    done in a single pass without a temporary copy, null vectors
+    (vacuum cells) become zero vectors instead of NaN
+    @param color_iterations: float32 array of shape (N, 3) (single
+                             iteration) or (iterations, N, 3)
+    @param occupancy: if True, uint8 mask of non-null cells is returned
+    @return occupancy mask of shape color_iterations.shape[:-1] or None
+    """
+    if color_iterations.dtype != np.float32:
+        raise TypeError("color array must be float32, was {}".format(
+                                                    color_iterations.dtype))
+    if color_iterations.ndim == 2:
+        color_view = color_iterations[np.newaxis]
+    elif color_iterations.ndim == 3:
+        color_view = color_iterations
+    else:
+        raise ValueError("color array must have 2 or 3 dimensions")
+    mask = np.empty(color_view.shape[:2] if occupancy else (0, 0),
+                    dtype=np.uint8)
+    cdef:
+        float[:, :, :] color_memview = color_view
+        unsigned char[:, :] mask_memview = mask
+        bint with_occupancy = occupancy
+    with nogil:
+        normalize_kernel(color_memview, mask_memview, with_occupancy)
+    if occupancy:
+        return mask[0] if color_iterations.ndim == 2 else mask
+
+# fixed hyper contrast gain applied to deviations from the layer mean
+HYPER_CONTRAST_GAIN = 10e5
+# cells per layer sampled to estimate the percentile stretch
+CONTRAST_SAMPLES = 4096
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def hyper_contrast_calculation(np.ndarray[np.float32_t, ndim=3] color, xc, yc, zc):
+@cython.cdivision(True)
+cdef void layer_mean_kernel(float[:, :, :, ::1] color,
+                            double[:, :, ::1] mean) nogil:
+    """
+    channel means of each layer of each frame, accumulated in double
+    """
+    cdef:
+        Py_ssize_t it, z, i
+        double r, g, b
+    for it in range(color.shape[0]):
+        for z in range(color.shape[1]):
+            r = g = b = 0
+            for i in range(color.shape[2]):
+                r += color[it, z, i, 0]
+                g += color[it, z, i, 1]
+                b += color[it, z, i, 2]
+            mean[it, z, 0] = r/color.shape[2]
+            mean[it, z, 1] = g/color.shape[2]
+            mean[it, z, 2] = b/color.shape[2]
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void contrast_kernel(float[:, :, :, ::1] color, float[:, :, ::1] mean,
+                          float[:, :, ::1] gain) nogil:
+    """
+    color = (color - mean)*gain per layer and channel, in place,
+    one pass over each frame
+    """
+    cdef:
+        Py_ssize_t it, z, i, k
+    for it in range(color.shape[0]):
+        for z in range(color.shape[1]):
+            for i in prange(color.shape[2]):
+                for k in range(3):
+                    color[it, z, i, k] = (color[it, z, i, k] -
+                                          mean[it, z, k])*gain[it, z, k]
+
+def hyper_contrast_calculation(np.ndarray color, xc, yc, zc,
+                               percentile=None):
     """
     this function increases contrast for a given color array
     using linear contrast increase algorithm
-    @param color: normalized color array
+    means of all layers and channels are computed at once,
+    then each frame is shifted and scaled in place in a single pass
+    @param color: normalized color array (iterations, zc*yc*xc, 3), float32
     @param xc: number of cells in x direction
     @param yc: number of cells in y direction
     @param zc: number of cells in z direction
+    @param percentile: if given, each layer channel is stretched so that
+                       this percentile of absolute deviations from its
+                       mean becomes 1, estimated from a sample of cells;
+                       otherwise deviations are scaled by HYPER_CONTRAST_GAIN
+    """
+    if color.dtype != np.float32:
+        raise TypeError("color array must be float32, was {}".format(
+                                                                color.dtype))
+    if not color.flags['C_CONTIGUOUS']:
+        raise ValueError("color array must be contiguous")
+    layers = color.reshape(color.shape[0], zc, xc*yc, 3)
+    # same as layers.mean(axis=2), without numpy's slow strided reduction
+    mean = np.empty((color.shape[0], zc, 3), dtype=np.float64)
+    cdef:
+        float[:, :, :, ::1] layer_memview = layers
+        double[:, :, ::1] mean_memview = mean
+        float[:, :, ::1] mean32_memview
+        float[:, :, ::1] gain_memview
+    with nogil:
+        layer_mean_kernel(layer_memview, mean_memview)
+    if percentile is None:
+        gain = np.full(mean.shape, HYPER_CONTRAST_GAIN, dtype=np.float32)
+    else:
+        step = max(1, (xc*yc)//CONTRAST_SAMPLES)
+        deviation = np.abs(layers[:, :, ::step, :] - mean[:, :, np.newaxis, :])
+        spread = np.percentile(deviation, percentile, axis=2)
+        # uniform layer has nothing to stretch
+        gain = np.ones(mean.shape, dtype=np.float32)
+        np.divide(1.0, spread, out=gain, where=spread > 0, casting='unsafe')
+    mean32_memview = mean.astype(np.float32)
+    gain_memview = gain
+    with nogil:
+        contrast_kernel(layer_memview, mean32_memview, gain_memview)
+
+# octahedral grid side, DIRECTION_RESOLUTION**2 directions fit uint16
+DIRECTION_RESOLUTION = 256
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void direction_index_kernel(float[:, ::1] color,
+                                 unsigned short[::1] index,
+                                 int resolution) nogil:
+    """
+    octahedral encoding, unit vector is projected on the octahedron
+    |x| + |y| + |z| = 1 whose lower half is folded onto the square
+    [-1, 1]^2, the square is split in resolution^2 cells
+    """
+    cdef:
+        Py_ssize_t i
+        float x, y, z, norm, fx
+        int ix, iy
+    for i in prange(color.shape[0]):
+        x = color[i, 0]
+        y = color[i, 1]
+        z = color[i, 2]
+        norm = fabs(x) + fabs(y) + fabs(z)
+        if not norm > 0:
+            index[i] = 0
+            continue
+        x = x/norm
+        y = y/norm
+        if z < 0:
+            fx = (1 - fabs(y))*(1 if x >= 0 else -1)
+            y = (1 - fabs(x))*(1 if y >= 0 else -1)
+            x = fx
+        ix = <int>((x + 1)*0.5*resolution)
+        iy = <int>((y + 1)*0.5*resolution)
+        ix = min(max(ix, 0), resolution - 1)
+        iy = min(max(iy, 0), resolution - 1)
+        index[i] = iy*resolution + ix
+
+def direction_indices(np.ndarray color, resolution=DIRECTION_RESOLUTION):
     """
+    quantizes directions to cells of the octahedral grid
+    @param color: float32 array of shape (..., 3), need not be normalized,
+                  null vectors get index 0
+    @param resolution: grid side, at most 256
+    @return uint16 array of shape color.shape[:-1]
+    """
+    if resolution*resolution > 65536:
+        raise ValueError("Resolution {} does not fit uint16".format(resolution))
+    color_view = np.ascontiguousarray(color, dtype=np.float32).reshape(-1, 3)
+    index = np.empty(len(color_view), dtype=np.uint16)
     cdef:
-        int i
-        int iteration
-        int max_it = len(color)
-    for iteration in range(0, max_it):
-        """
-        this is hyper contrast option, enabled via options
-        """
-        for i in range(0, zc):
-            mnR = np.mean(color[iteration, i*xc*yc:(i+1)*xc*yc, 0])
-            mnG = np.mean(color[iteration, i*xc*yc:(i+1)*xc*yc, 1])
-            mnB = np.mean(color[iteration, i*xc*yc:(i+1)*xc*yc, 2])
-            color[iteration, i*xc*yc:(i+1)*xc*yc, 0] -= mnR
-            color[iteration, i*xc*yc:(i+1)*xc*yc, 1] -= mnG
-            color[iteration, i*xc*yc:(i+1)*xc*yc, 2] -= mnB
-            color[iteration, i*xc*yc:(i+1)*xc*yc, 0] *= 10e5
-            color[iteration, i*xc*yc:(i+1)*xc*yc, 1] *= 10e5
-            color[iteration, i*xc*yc:(i+1)*xc*yc, 2] *= 10e5
+        float[:, ::1] color_memview = color_view
+        unsigned short[::1] index_memview = index
+        int grid = resolution
+    with nogil:
+        direction_index_kernel(color_memview, index_memview, grid)
+    return index.reshape(np.shape(color)[:-1])
+
+def direction_grid(resolution=DIRECTION_RESOLUTION):
+    """
+    unit vectors at centers of the octahedral grid cells, in the order
+    of direction_indices
+    @return float32 array of shape (resolution*resolution, 3)
+    """
+    centers = (np.arange(resolution, dtype=np.float64) + 0.5)*2/resolution - 1
+    y, x = np.meshgrid(centers, centers, indexing='ij')
+    z = 1 - np.abs(x) - np.abs(y)
+    lower = z < 0
+    x[lower], y[lower] = (1 - np.abs(y[lower]))*np.where(x[lower] >= 0, 1, -1), \
+                         (1 - np.abs(x[lower]))*np.where(y[lower] >= 0, 1, -1)
+    grid = np.stack((x, y, z), axis=-1).reshape(-1, 3)
+    grid /= np.linalg.norm(grid, axis=1, keepdims=True)
+    return grid.astype(np.float32)
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
@@ -139,7 +389,9 @@ def process_vector_to_vbo(iteration,
         int iteration_len = len(iteration)
         int p = 0
         int j, i
-    local_vbo = np.ndarray((iteration_len*sides*4, 3), dtype=np.float32)
+    # null vectors get a degenerate (zero) arrow, so each vector keeps
+    # its place in the buffer
+    local_vbo = np.zeros((iteration_len*sides*4, 3), dtype=np.float32)
     for j in range(0, iteration_len):
         if iteration[j].any():
             mag = math.sqrt(math.pow(iteration[j,0], 2)
@@ -180,6 +432,8 @@ def process_vector_to_vbo(iteration,
             local_vbo[p+2, :] = origin_circle+rot_matrix.dot(org_cyl_rot+height) 
             local_vbo[p+3, :] = origin_circle+rot_matrix.dot(height*1.5)  
             p+=4     
+        else:
+            p += sides*4
     return local_vbo
 
 def compute_normals_cubes(vertex_values, cube_number):  
@@ -1,7 +1,9 @@
+import io
 import numpy as np
 import pandas as pd
 import struct
 cimport cython
+from processing.compressed_input import open_input, logical_name
 
 
 def getFileHeader(filename):
@@ -13,7 +15,7 @@ def getFileHeader(filename):
     """
     file_header = {}
 
-    with open(filename, 'r') as f:
+    with io.TextIOWrapper(open_input(filename)) as f:
         g = f.readline()
         while g.startswith('#'):
             g = f.readline()
@@ -58,65 +60,114 @@ def parseODTColumn(line):
                 break
     return cols
 
-def getPlotData(filename):
+def getPlotData(filename, columns=None):
     """
     Reads .odt of .txt file
-    @param: filename is .odt file path
+    Headers are parsed with parseODTColumn, numeric body is parsed
+    in bulk by pandas C parser, comment lines are skipped
+    @param: filename is .odt file path, may be compressed or an archive
+            member
+    @param: columns is an optional list of column names to be read,
+            all columns are read if None
     @return: dataFrame and stages number
     """
-    if filename.endswith('.txt'):
-        df = pd.read_table(filename)
+    name = logical_name(filename)
+    if name.endswith('.txt'):
+        with open_input(filename) as f:
+            df = pd.read_table(f, usecols=columns)
         return df, len(df)
-    elif filename.endswith('.odt'):
-        header_lines = 4
-        header = []
-        i = 0
-        with open(filename, 'r') as f:
-            while i < header_lines:
-                lines = f.readline()
-                header.append(lines)
-                i += 1
-            units = f.readline()
-            lines = f.readlines()
-        f.close()
-        cols = header[-1]
-        cols = parseODTColumn(cols)
-        dataset = []
-        lines = [x.strip() for x in lines]
-        lines = [x.split(' ') for x in lines]
-        for line in lines:
-            temp_line = []
-            for el in line:
-                try:
-                    new_el = float(el)
-                    temp_line.append(new_el)
-                except:
-                    pass
-            dataset.append(temp_line)
-        dataset = dataset[:-1]
-        df = pd.DataFrame.from_records(dataset, columns=cols)
-        stages = len(lines) -1
+    elif name.endswith('.odt'):
+        cols = None
+        with io.TextIOWrapper(open_input(filename)) as f:
+            for line in f:
+                if line.startswith('# Columns:'):
+                    cols = parseODTColumn(line)
+                    break
+        if cols is None:
+            raise ValueError("No column specification in {}".format(filename))
+        with open_input(filename) as f:
+            df = pd.read_csv(f, sep=r'\s+', comment='#', header=None,
+                             names=cols, usecols=columns, dtype=np.float64,
+                             engine='c', float_precision='round_trip')
+        if columns is not None:
+            # usecols does not preserve the requested order
+            df = df[list(columns)]
+        stages = len(df)
         return df, stages
     else:
         raise ValueError("Unsupported extension {}".format(filename))
 
 
-@cython.boundscheck(False)
-@cython.wraparound(False)
-def getRawVectors(filename):
+# files larger than this (in bytes) are parsed in chunks of this size
+TEXT_CHUNK_SIZE = 64*1024*1024
+
+def strip_comment_lines(block):
+    """
+    removes every line containing '#' from a block of text
+    comment lines are few (header and footer) so only these are visited
+    @param: block is a bytes object
+    """
+    pieces = []
+    start = 0
+    pos = block.find(b'#')
+    while pos != -1:
+        line_start = block.rfind(b'\n', 0, pos) + 1
+        line_end = block.find(b'\n', pos)
+        line_end = len(block) if line_end == -1 else line_end + 1
+        pieces.append(block[start:line_start])
+        start = line_end
+        pos = block.find(b'#', start)
+    if not pieces:
+        return block
+    pieces.append(block[start:])
+    return b''.join(pieces)
+
+
+def parse_text_block(block):
+    """
+    converts a block of whitespace separated text values into float32
+    vectors with a single vectorized call, lines with '#' are skipped
+    @param: block is a bytes object containing only whole lines
+    @return float32 numpy array of shape (N, 3)
+    """
+    block = strip_comment_lines(block)
+    values = np.fromstring(block, dtype=np.float64, sep=' ')
+    if values.size % 3:
+        raise ValueError("Invalid text data block, {} values".format(
+                                                                values.size))
+    return values.astype(np.float32).reshape(-1, 3)
+
+
+def getRawVectors(filename, chunk_size=None):
     """
     processes a .omf filename into a numpy array of vectors
+    files larger than chunk_size are streamed so that only one chunk of text
+    is held in memory at a time
     @param: .omf text file
-    @return returns raw_vectors from fortran lists
+    @param: chunk_size is the chunk size in bytes, TEXT_CHUNK_SIZE by default
+    @return returns float32 raw_vectors of shape (N, 3)
     """
-    raw_vectors = []
-    with open(filename, 'r') as f:
-        lines = f.readlines()
-    f.close()
-    raw_vectors = [g.strip().split(' ') for g in lines if '#' not in g]
-    raw_vectors = [[float(row[0]), float(row[1]), float(row[2])]
-                        for row in raw_vectors]
-    return np.array(raw_vectors)
+    if chunk_size is None:
+        chunk_size = TEXT_CHUNK_SIZE
+    chunks = []
+    remainder = b''
+    with open_input(filename) as f:
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            block = remainder + block
+            last_line_end = block.rfind(b'\n') + 1
+            remainder = block[last_line_end:]
+            if last_line_end:
+                chunks.append(parse_text_block(block[:last_line_end]))
+    if remainder:
+        chunks.append(parse_text_block(remainder))
+    if not chunks:
+        return np.zeros((0, 3), dtype=np.float32)
+    if len(chunks) == 1:
+        return chunks[0]
+    return np.concatenate(chunks)
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
@@ -161,46 +212,121 @@ def process_header(headers):
   return final_header
 
 
-@cython.boundscheck(False)
-@cython.wraparound(False)
-def binary_format_reader(filename):
+def read_binary_header(f):
   """
-  Reads binary formatted .omf or .ovf files
+  Reads the header of an opened binary .omf or .ovf file and leaves
+  the file positioned at the first data value (just after the check value)
+  @param: f is a file object opened in 'rb' mode
+  @return header dictionary and numpy dtype of the data block
   """
   header_part = ""
-  rawVectorData = None
-  header = None
-  with open(filename, 'rb') as f:
+  x = f.readline()
+  while x != b'# End: Header\n':
+      if x == b'':
+          raise ValueError("Unexpected end of file while reading header")
+      header_part += str(x)
       x = f.readline()
-      while x != b'# End: Header\n':
-          header_part += str(x)
-          x = f.readline()
 
-      header = process_header(header_part)
+  header = process_header(header_part)
 
+  byte_type = f.readline()
+  while byte_type == b'#\n':
       byte_type = f.readline()
-      while byte_type == b'#\n':
-          byte_type = f.readline()
-      # compile struct byte type
-      fmt, buff_size, val = decode_byte_size(byte_type)
-      struct_object = struct.Struct(fmt)
-      test_val = struct_object.unpack(f.read(buff_size))[0]
-      if  test_val != val:
-          raise ValueError("Invalid file format with validation {} value, \
-                              should be {}".format(test_val, val))
+  fmt, buff_size, val = decode_byte_size(byte_type)
+  dtype = decode_byte_order(f.read(buff_size), fmt, val)
+  return header, dtype
+
 
+def binary_format_reader(filename):
+  """
+  Reads binary formatted .omf or .ovf files
+  The whole data block is read at once and decoded with np.frombuffer
+  @return header dictionary and float32 array of shape (N, 3)
+  """
+  rawVectorData = None
+  header = None
+  with open_input(filename) as f:
+      header, dtype = read_binary_header(f)
       k = int(header['xnodes']*header['ynodes']*header['znodes'])
-      rawVectorData = standard_vertex_mode(f, k, struct_object, buff_size)
-      f.close()
+      data_size = 3*k*dtype.itemsize
+      data_block = f.read(data_size)
+      if len(data_block) != data_size:
+          raise ValueError("Truncated data block in {}, expected {} bytes \
+                              got {}".format(filename, data_size,
+                                             len(data_block)))
+      rawVectorData = np.frombuffer(data_block,
+                                    dtype=dtype).astype(np.float32)
+      rawVectorData = rawVectorData.reshape(k, 3)
   assert rawVectorData is not None
   assert header is not None
   return header, rawVectorData
 
 
-def standard_vertex_mode(f, k, struct_object, buff):
-    return np.array([(struct_object.unpack(f.read(buff))[0],
-            struct_object.unpack(f.read(buff))[0],
-            struct_object.unpack(f.read(buff))[0]) for i in range(int(k))])
+def read_vector_header(filename):
+  """
+  Reads the header of binary or text .omf/.ovf file up to the data block
+  without touching the data itself
+  @param: filename is a file path, archive member or an opened file
+  @return header dictionary, data encoding ('Binary 4', 'Binary 8' or
+          'Text'), numpy dtype of binary data (None for text) and
+          byte offset of the first data value
+  """
+  file_header = {}
+  with open_input(filename) as f:
+      line = f.readline()
+      while line and not line.startswith(b'# Begin: Data'):
+          g = line.decode('latin-1').rstrip('\r\n')
+          if ':' in g:
+              x = g.index(':')
+              key = g[2:x]
+              value = g[x + 1:].strip()
+              if key in file_header:
+                  file_header[key] = str(file_header[key]) + ' ' + value
+              else:
+                  try:
+                      file_header[key] = float(value)
+                  except ValueError:
+                      file_header[key] = value
+          line = f.readline()
+      if not line:
+          raise ValueError("No data block found in {}".format(filename))
+      encoding = line.decode('latin-1').strip()[len('# Begin: Data '):]
+      dtype = None
+      if encoding.startswith('Binary'):
+          fmt, buff_size, val = decode_byte_size(
+                            b'# Begin: Data ' + encoding.encode() + b'\n')
+          dtype = decode_byte_order(f.read(buff_size), fmt, val)
+      offset = f.tell()
+  return file_header, encoding, dtype, offset
+
+
+def binary_data_layout(filename):
+  """
+  Reads only the header of binary .omf or .ovf file
+  @return header dictionary, byte offset of the data block and numpy dtype
+          of the data block
+  """
+  header, encoding, dtype, offset = read_vector_header(filename)
+  if dtype is None:
+      raise ValueError("{} is not a binary file".format(filename))
+  return header, offset, dtype
+
+
+def decode_byte_order(check_bytes, fmt, val):
+    """
+    infers byte order of the data block from its check value
+    OVF 2.0 files are little endian, OVF 1.0 files are big endian
+    @param: check_bytes is the raw check value read from file
+    @param: fmt is a struct format character as returned by decode_byte_size
+    @param: val is the expected check value
+    @return numpy dtype with a proper byte order
+    """
+    for byte_order in ('<', '>'):
+        test_val = struct.unpack(byte_order + fmt, check_bytes)[0]
+        if test_val == val:
+            return np.dtype(byte_order + fmt)
+    raise ValueError("Invalid file format with validation {} value, \
+                        should be {}".format(check_bytes, val))
 
 
 def decode_byte_size(byte_format_specification):
@@ -255,7 +381,7 @@ def subsample(xc, yc, zc, subsample=2):
             if yskip%yc == 0:           
                 zskip+=1
                 yskip = 0
-    return np.array(index_mask, dtype=np.int)
+    return np.array(index_mask, dtype=np.int64)
 
 
 def cube(vec, dims=(0.1, 0.1, 0.1)):
@@ -1,3 +1,5 @@
+import os
+import sys
 from distutils.core import setup
 from setuptools import Extension
 from Cython.Build import cythonize
@@ -6,7 +8,26 @@ import numpy
 """
 Use this file if cython is build outside this directory
 """
-ext_modules= cythonize('cython_modules/*.pyx')
+
+# prange kernels of color_policy run in parallel only if built with
+# OpenMP, VISM_OPENMP=0 builds them serial e.g. for compilers without it.
+# cython_parse runs in forked pool workers and is kept without OpenMP
+if os.environ.get('VISM_OPENMP', '1') == '0':
+    openmp_compile, openmp_link = [], []
+elif sys.platform == 'win32':
+    openmp_compile, openmp_link = ['/openmp'], []
+else:
+    openmp_compile, openmp_link = ['-fopenmp'], ['-fopenmp']
+
+ext_modules= cythonize([
+    Extension("cython_modules.cython_parse",
+              ["cython_modules/cython_parse.pyx"]),
+    Extension("cython_modules.color_policy",
+              ["cython_modules/color_policy.pyx"],
+              extra_compile_args=openmp_compile,
+              extra_link_args=openmp_link)
+# sources are written for Python 2 semantics, default of Cython < 3
+], language_level=2)
 
 setup(
     name='External cython build',
@@ -1,4 +1,7 @@
+import os
+import sys
 from distutils.core import setup
+from setuptools import Extension
 from Cython.Build import cythonize
 import numpy
 
@@ -6,8 +9,26 @@ import numpy
 Use this file if cython is build INSIDE this directory
 """
 
+# prange kernels of color_policy run in parallel only if built with
+# OpenMP, VISM_OPENMP=0 builds them serial e.g. for compilers without it.
+# cython_parse runs in forked pool workers and is kept without OpenMP
+if os.environ.get('VISM_OPENMP', '1') == '0':
+    openmp_compile, openmp_link = [], []
+elif sys.platform == 'win32':
+    openmp_compile, openmp_link = ['/openmp'], []
+else:
+    openmp_compile, openmp_link = ['-fopenmp'], ['-fopenmp']
+
+extensions = [
+    Extension("cython_parse", ["cython_parse.pyx"]),
+    Extension("color_policy", ["color_policy.pyx"],
+              extra_compile_args=openmp_compile,
+              extra_link_args=openmp_link)
+]
+
 setup(
     name='Spin python',
-    ext_modules = cythonize(["cython_parse.pyx", "color_policy.pyx"]),
+    # sources are written for Python 2 semantics, default of Cython < 3
+    ext_modules = cythonize(extensions, language_level=2),
     include_dirs=[numpy.get_include()]
 )
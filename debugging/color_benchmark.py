@@ -0,0 +1,207 @@
+"""
+Compares ColorPolicy.standard_procedure with the procedure it replaced -
+the per-iteration loops over the per-cell color kernels, both kept
+verbatim in legacy_standard_procedure and legacy_color_policy.pyx - for
+Standard and RGB policies with and without hyper contrast, on frames of
+a directory of binary .omf/.ovf files tiled to the requested number
+of iterations, asserting that both give the same colors, then both
+policies against coloring by a direction lookup table
+(ColorPolicy.direction_lut)
+
+usage: python3 debugging/color_benchmark.py [directory] [iterations] [repeats]
+"""
+import os
+import sys
+import glob
+import time
+
+import numpy as np
+import pyximport
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+pyximport.install(setup_args={'include_dirs': np.get_include()},
+                  language_level=2)
+from debugging.legacy_color_policy import multi_iteration_dot_product, \
+                                          hyper_contrast_calculation, \
+                                          multi_iteration_cross_color, \
+                                          multi_iteration_normalize
+from cython_modules.cython_parse import binary_format_reader, \
+                                        getLayerOutline, subsample
+from cython_modules.color_policy import direction_indices, \
+                                         HYPER_CONTRAST_GAIN
+from processing.ColorPolicy import ColorPolicy
+
+
+def legacy_pad_4f_vertices(color_iteration, vector_array):
+    """
+    this padding is used to add opacity for each vector in color matrix
+    it is mostly used to hide null/NaN objects
+    """
+    try:
+        assert color_iteration.shape == vector_array.shape
+    except AssertionError:
+        msg = "Color and vector dimensions must match. Not matching with" + \
+                "color {} and vector {}".format(color_iteration.shape,
+                vector_array.shape)
+        raise ValueError(msg)
+
+    vector_array = vector_array.reshape(color_iteration.shape)
+    new_vector_list = np.zeros((vector_array.shape[0], 4))
+    for i in range(vector_array.shape[0]):
+        if color_iteration[i].any():
+            new_vector_list[i]= [*vector_array[i], 1.0]
+        else:
+            new_vector_list[i] = [0.0, 0.0, 0.0, 0.0]
+    return new_vector_list
+
+
+def legacy_standard_procedure(outline, color, iterations, subsampling, xc, yc,
+                              zc, picked_layer='all',
+                              vector_set=[[1, 0, 0], [0, 1, 0], [0, 0, 1]],
+                              color_policy_type='Standard',
+                              hyperContrast=False):
+    """
+    reference implementation - ColorPolicy.standard_procedure before
+    coloring was batched, shape checks left out
+    """
+    color = np.array(color)
+    outline = np.array(outline)
+    if type(picked_layer) == int or zc == 1:
+        # if single layer is picked modify memory data
+        layer_thickness = xc*yc
+        if zc != 1:
+            zc = 1
+            picked_layer = picked_layer*layer_thickness
+            color = color[:, picked_layer:picked_layer+layer_thickness, :]
+            outline = outline[picked_layer:picked_layer+layer_thickness]
+    if subsampling > 1:
+        index_list = subsample(xc, yc, zc, subsample=subsampling)
+        if xc > 1: xc = xc//subsampling if xc%subsampling == 0 else xc//subsampling +1
+        if yc > 1: yc = yc//subsampling if yc%subsampling == 0 else yc//subsampling +1
+        if zc > 1: zc = zc//subsampling if zc%subsampling == 0 else zc//subsampling +1
+        color = color[:, index_list, :]
+        outline = outline[index_list, :]
+
+    outline = legacy_pad_4f_vertices(color[0], outline)
+
+    # copy original color for arrows
+    multi_iteration_normalize(color)
+    original_color = np.copy(color)
+
+    if hyperContrast:
+        hyper_contrast_calculation(color, xc, yc, zc)
+    vector_set = np.array(vector_set).astype(np.float32)
+    if color_policy_type == 'Standard':
+        for i in range(0, iterations):
+            color[i, :, :] = multi_iteration_cross_color(color[i],
+                                                         vector_set[0],
+                                                         vector_set[2],
+                                                         vector_set[1])
+    else:
+        for i in range(0, iterations):
+            color[i, :, :] = multi_iteration_dot_product(color[i], vector_set)
+    color = np.array(color)
+    outline = np.array(outline)
+    return color, outline, original_color
+
+
+def time_procedure(procedure, repeats, *args, **kwargs):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = procedure(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def assert_same_colors(legacy, current, hyperContrast):
+    """
+    null vectors are NaN in legacy colors and zero in current ones,
+    colors of all other cells must match, with hyper contrast up to
+    the rounding of layer means that the gain amplifies - legacy means
+    are accumulated in float32, current ones in double
+    """
+    legacy_color, legacy_outline, legacy_original = legacy
+    color, outline, original = current
+    occupied = legacy_outline[:, 3] == 1
+    assert np.array_equal(legacy_outline.astype(np.float32), outline)
+    assert np.array_equal(legacy_original[:, occupied],
+                          original[:, occupied])
+    if hyperContrast:
+        tolerance = HYPER_CONTRAST_GAIN*4*np.finfo(np.float32).eps
+        assert np.allclose(legacy_color[:, occupied], color[:, occupied],
+                           rtol=0, atol=tolerance)
+    else:
+        assert np.array_equal(legacy_color[:, occupied], color[:, occupied])
+
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else \
+                                    os.path.join('examples', '0200nm')
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    files = sorted(glob.glob(os.path.join(directory, '*.omf')) +
+                   glob.glob(os.path.join(directory, '*.ovf')))
+    if not files:
+        raise ValueError("No binary vector files in {}".format(directory))
+
+    header = binary_format_reader(files[0])[0]
+    xc, yc, zc = (int(header[key]) for key in ('xnodes', 'ynodes', 'znodes'))
+    outline = np.array(getLayerOutline(header))
+    frames = [binary_format_reader(files[i % len(files)])[1]
+              for i in range(iterations)]
+    color = np.array(frames, dtype=np.float32)
+    # legacy layer means are NaN wherever a layer has null vectors,
+    # so hyper contrast is compared on frames with null vectors filled
+    filled = np.copy(color)
+    filled[~np.any(filled != 0, axis=-1)] = [0, 0, 1]
+    vector_set = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+
+    print("iterations: {}, cells per iteration: {}".format(*color.shape[:2]))
+    for policy in ('Standard', 'RGB policy'):
+        for hyperContrast in (False, True):
+            args = (outline, filled if hyperContrast else color, iterations,
+                    1, xc, yc, zc, 'all', vector_set, policy, hyperContrast)
+            legacy_time, legacy = time_procedure(legacy_standard_procedure,
+                                                 repeats, *args)
+            current_time, current = time_procedure(
+                                                ColorPolicy.standard_procedure,
+                                                repeats, *args)
+            assert_same_colors(legacy, current, hyperContrast)
+            print("{}{}".format(policy, ", hyper contrast" if hyperContrast
+                                                            else ""))
+            print("legacy procedure:     {:.3f} s".format(legacy_time))
+            print("standard_procedure:   {:.3f} s".format(current_time))
+            print("speedup:              {:.1f}x".format(
+                                                    legacy_time/current_time))
+
+    # lut is built once per policy, frames keep uint16 directions
+    normalized = np.copy(color)
+    occupied = np.any(normalized != 0, axis=-1)
+    normalized[occupied] /= np.linalg.norm(normalized[occupied], axis=-1,
+                                           keepdims=True)
+    directions = direction_indices(normalized)
+    for policy in ('Standard', 'RGB policy'):
+        exact_time, (exact, _, _) = time_procedure(
+                                ColorPolicy.standard_procedure, repeats,
+                                outline, color, iterations, 1, xc, yc, zc,
+                                'all', vector_set, policy)
+        start = time.perf_counter()
+        lut = ColorPolicy.direction_lut(vector_set, policy)
+        lut_build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        looked_up = np.take(lut, directions, axis=0)
+        lookup_time = time.perf_counter() - start
+        # 8-bit framebuffer values, null cells are not drawn
+        exact_pixels = np.rint(np.clip(exact[occupied], 0, 1)*255)
+        lut_pixels = np.rint(np.clip(looked_up[occupied], 0, 1)*255)
+        print("{} lookup table".format(policy))
+        print("standard_procedure:   {:.3f} s".format(exact_time))
+        print("lut build:            {:.3f} s".format(lut_build_time))
+        print("lut lookup:           {:.3f} s".format(lookup_time))
+        print("color bytes:          {} vs {}".format(directions.nbytes,
+                                                      exact.nbytes))
+        print("max pixel difference: {:.0f}".format(
+                                np.abs(lut_pixels - exact_pixels).max()))
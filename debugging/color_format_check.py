@@ -0,0 +1,64 @@
+"""
+Compares compact color formats (ColorPolicy.COLOR_FORMATS) with the
+float32 path on frames of a directory of binary .omf/.ovf files.
+Colors are written to an 8-bit RGB framebuffer the way OpenGL does it
+(clamp, scale by 255, round), for float32 and for the decoded compact
+colors, and the largest per channel pixel difference is reported
+together with the color bytes of a frame
+
+usage: python3 debugging/color_format_check.py [directory] [iterations]
+"""
+import os
+import sys
+import glob
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+from cython_modules.cython_parse import binary_format_reader
+from processing.ColorPolicy import ColorPolicy
+
+
+def framebuffer_pixels(color):
+    """
+    8-bit framebuffer values of colors, alpha is dropped
+    """
+    return np.rint(np.clip(color[..., :3], 0, 1)*255).astype(np.uint8)
+
+
+def decode(packed):
+    """
+    float colors as seen by the GPU, normalized for unsigned bytes
+    """
+    if packed.dtype == np.uint8:
+        return packed[..., :3].astype(np.float32)/255
+    return packed[..., :3].astype(np.float32)
+
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else \
+                                    os.path.join('examples', '0200nm')
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    files = sorted(glob.glob(os.path.join(directory, '*.omf')) +
+                   glob.glob(os.path.join(directory, '*.ovf')))
+    if not files:
+        raise ValueError("No binary vector files in {}".format(directory))
+
+    frames = [binary_format_reader(files[i % len(files)])[1]
+              for i in range(iterations)]
+    color = np.array(frames, dtype=np.float32)
+    cells = color.shape[1]
+    vector_set = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+    print("iterations: {}, cells per iteration: {}".format(iterations, cells))
+    for policy in ('Standard', 'RGB'):
+        colored = np.copy(color)
+        ColorPolicy.color_frames(colored, cells, 1, 1, vector_set, policy)
+        reference = framebuffer_pixels(colored)
+        print("{} policy".format(policy))
+        for color_format in ColorPolicy.COLOR_FORMATS:
+            packed = ColorPolicy.pack_colors(colored, color_format)
+            pixels = framebuffer_pixels(decode(packed))
+            difference = np.abs(pixels.astype(np.int16) - reference).max()
+            print("{:8} {:8d} bytes per frame, max pixel difference {}".format(
+                    color_format, packed[0].nbytes, difference))
@@ -0,0 +1,95 @@
+"""
+color kernels of cython_modules/color_policy.pyx as they were before
+they were batched, kept verbatim as the reference of color_benchmark.py,
+compiled on import by pyximport
+"""
+import numpy as np
+import math
+
+cimport numpy as np
+cimport cython
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def multi_iteration_dot_product(np.ndarray[np.float32_t, ndim=2] color_iteration,
+                                np.ndarray[np.float32_t, ndim=2] vec_set):
+    """
+    dot product to be performed on an array of color matrices and 
+    a selected vector set (each vector for each of 3 dimensions)
+    """
+    cdef:
+        int i
+        int ci = color_iteration.shape[0]
+    for i in range(0, ci):
+        color_iteration[i] = [0.5*(np.dot(color_iteration[i], vector)+1) for vector in vec_set]
+    return color_iteration
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def multi_iteration_cross_color(np.ndarray[np.float32_t, ndim=2] color_iteration,
+                                np.ndarray[np.float32_t, ndim=1] user_vector,
+                                np.ndarray[np.float32_t, ndim=1] negative_color, 
+                                np.ndarray[np.float32_t, ndim=1] positive_color):
+    """
+    s is dot product
+    positive color is when s > 0
+    negative color is when s < 0
+    """
+    cdef:
+        float s
+        int i
+        int ci = color_iteration.shape[0]
+    white = np.array([1, 1, 1], np.float32)
+    for i in range(0, ci):
+        s = np.dot(color_iteration[i], user_vector)
+        abs_s = np.abs(s)
+        if s > 0:
+            color_iteration[i] = abs_s*positive_color + (1-abs_s)*white
+        else:
+            color_iteration[i] = abs_s*negative_color + (1-abs_s)*white
+    return color_iteration
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def multi_iteration_normalize(np.ndarray[np.float32_t, ndim=3] color_iterations):
+    """
+    normalization to be performed on an array of color matrices
+    """
+    cdef:
+        int i
+        int ci = color_iterations.shape[0]
+    for i in range(0, ci):
+        color_iterations[i] = color_iterations[i]/np.linalg.norm(color_iterations[i], 
+                                                    axis=1, keepdims=True)
+    #np.nan_to_num(color_iterations, copy=False)
+    #return color_iterations
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def hyper_contrast_calculation(np.ndarray[np.float32_t, ndim=3] color, xc, yc, zc):
+    """
+    this function increases contrast for a given color array
+    using linear contrast increase algorithm
+    @param color: normalized color array
+    @param xc: number of cells in x direction
+    @param yc: number of cells in y direction
+    @param zc: number of cells in z direction
+    """
+    cdef:
+        int i
+        int iteration
+        int max_it = len(color)
+    for iteration in range(0, max_it):
+        """
+        this is hyper contrast option, enabled via options
+        """
+        for i in range(0, zc):
+            mnR = np.mean(color[iteration, i*xc*yc:(i+1)*xc*yc, 0])
+            mnG = np.mean(color[iteration, i*xc*yc:(i+1)*xc*yc, 1])
+            mnB = np.mean(color[iteration, i*xc*yc:(i+1)*xc*yc, 2])
+            color[iteration, i*xc*yc:(i+1)*xc*yc, 0] -= mnR
+            color[iteration, i*xc*yc:(i+1)*xc*yc, 1] -= mnG
+            color[iteration, i*xc*yc:(i+1)*xc*yc, 2] -= mnB
+            color[iteration, i*xc*yc:(i+1)*xc*yc, 0] *= 10e5
+            color[iteration, i*xc*yc:(i+1)*xc*yc, 1] *= 10e5
+            color[iteration, i*xc*yc:(i+1)*xc*yc, 2] *= 10e5
@@ -0,0 +1,74 @@
+"""
+Compares the legacy per-value struct reader with the vectorized
+binary_format_reader on a directory of binary .omf/.ovf files
+
+usage: python3 debugging/parse_benchmark.py [directory] [repeats]
+"""
+import os
+import sys
+import glob
+import time
+import struct
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+from cython_modules.cython_parse import binary_format_reader, \
+                                        process_header, decode_byte_size
+
+
+def legacy_binary_format_reader(filename):
+    """
+    reference implementation - three struct.unpack calls per cell
+    """
+    header_part = ""
+    with open(filename, 'rb') as f:
+        x = f.readline()
+        while x != b'# End: Header\n':
+            header_part += str(x)
+            x = f.readline()
+        header = process_header(header_part)
+        byte_type = f.readline()
+        while byte_type == b'#\n':
+            byte_type = f.readline()
+        fmt, buff, val = decode_byte_size(byte_type)
+        struct_object = struct.Struct(fmt)
+        struct_object.unpack(f.read(buff))
+        k = int(header['xnodes']*header['ynodes']*header['znodes'])
+        data = np.array([(struct_object.unpack(f.read(buff))[0],
+                          struct_object.unpack(f.read(buff))[0],
+                          struct_object.unpack(f.read(buff))[0])
+                         for i in range(k)], dtype=np.float32)
+    return header, data
+
+
+def time_reader(reader, files, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = [reader(filename)[1] for filename in files]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else \
+                                    os.path.join('examples', '0200nm')
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    files = sorted(glob.glob(os.path.join(directory, '*.omf')) +
+                   glob.glob(os.path.join(directory, '*.ovf')))
+    if not files:
+        raise ValueError("No binary vector files in {}".format(directory))
+
+    legacy_time, legacy = time_reader(legacy_binary_format_reader, files,
+                                      repeats)
+    fast_time, fast = time_reader(binary_format_reader, files, repeats)
+    for a, b in zip(legacy, fast):
+        assert a.shape == b.shape and np.array_equal(a, b)
+
+    print("files: {}, cells per file: {}".format(len(files), len(fast[0])))
+    print("legacy struct reader: {:.3f} s".format(legacy_time))
+    print("vectorized reader:    {:.3f} s".format(fast_time))
+    print("speedup:              {:.1f}x".format(legacy_time/fast_time))
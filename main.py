@@ -7,6 +7,7 @@ else:
     bv = BuildVerifier()
     bv.cython_builds()
 
+import os
 import sys
 import threading
 
@@ -20,6 +21,13 @@ from Windows.ChooseWidget import ChooseWidget
 from Windows.PlayerWindow import PlayerWindow
 
 from processing.multiprocessing_parse import MultiprocessingParse
+from processing.shared_frames import SharedFrames
+from processing.streaming_loader import StreamingLoader
+from processing.frame_selection import FrameSelection
+from processing.read_plan import ReadPlan
+from processing.vism_archive import VismArchive
+from processing.live_tail import LiveTail
+from processing.compressed_input import is_archive, close_archives
 from multiprocessing import TimeoutError
 
 from Widgets.WidgetHandler import WidgetHandler
@@ -48,6 +56,9 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow, QtWidgets.QWidget):
         self.setupUi(self)
         # we cannot add menu actions from QT Designer level
         self.playerAction = self.menubar.addAction("Player")
+        self.exportAction = self.menuFile.addAction("Export Archive")
+        self.watchAction = self.menuFile.addAction("Watch Directory")
+        self.watchAction.setCheckable(True)
         self.setWindowTitle("ESE - Early Spins Environment")
         app = QtCore.QCoreApplication.instance()
         screen_resolution = app.desktop().screenGeometry()
@@ -64,6 +75,19 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow, QtWidgets.QWidget):
         # keeps all widgets in list of library object that handles Widgets
         self.panes = []
         self.playerWindow = None
+        self.loader = None
+        # frames of a streamed load already given to widgets
+        self.published_frames = 0
+        self.progressBar = None
+        # optional ReadPlan, cells outside of it are never read from disk,
+        # asked for with each loaded directory as the frame selection
+        self.read_plan = None
+        # optional FrameSelection, asked for with each loaded directory
+        self.frame_selection = None
+        # watch mode polls loaded directory for frames of running simulation
+        self.liveTail = None
+        self.watchTimer = QtCore.QTimer(self)
+        self.WATCH_INTERVAL = 2000  # ms
         self.makeGrid()  # create grid (4 Widgets) and stores them in arrays
         self.make1WindowGrid()  # shows default 1 widget Window
         self.events()  # create event listeners
@@ -75,6 +99,9 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow, QtWidgets.QWidget):
         # FILE SUBMENU
         self.actionLoad_Directory.triggered.connect(self.loadDirectoryWrapper)
         self.actionLoad_File.triggered.connect(self.loadFile)
+        self.exportAction.triggered.connect(self.exportArchiveWrapper)
+        self.watchAction.toggled.connect(self.watchDirectory)
+        self.watchTimer.timeout.connect(self.pollDirectory)
 
         # ANIMATION MENU
         self.playerAction.triggered.connect(self.showAnimationSettings)
@@ -157,6 +184,20 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow, QtWidgets.QWidget):
         fileLoaded = str(fileDialog.getOpenFileName(self, "Select File")[0])
         return fileLoaded
 
+    @MainContextDecorators.window_resize_fix
+    def promptFrameSelection(self):
+        """
+        asks which frames of the directory should be loaded
+        :return text typed by user, empty loads all frames
+        """
+        text, accepted = QtWidgets.QInputDialog.getText(self,
+                            "Select frames",
+                            "Leave empty to load all frames or type e.g.\n" +
+                            "stages=200..400, stride=10\n" +
+                            "time=0..5e-9, stride=2\n" +
+                            "layer=2, subsampling=4 to read fewer cells")
+        return text if accepted else ""
+
     def setScreenshotFolder(self):
         selected_dir = self.promptDirectory()
         if selected_dir is not None:
@@ -186,7 +227,11 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow, QtWidgets.QWidget):
                             QtWidgets.QMessageBox.No, self.refreshScreen, self.loadFile)
             return 0
 
-        if ".odt" in fileLoaded or ".txt" in fileLoaded:
+        if VismArchive.EXTENSION in fileLoaded or is_archive(fileLoaded):
+            # archives hold whole simulation directories
+            return self.streamDirectory(fileLoaded)
+
+        elif ".odt" in fileLoaded or ".txt" in fileLoaded:
             self.doh.passListObject(('plot_data', 'iterations'),
                                         *MultiprocessingParse.readFile(fileLoaded))
             self._BLOCK_ITERABLES_ = False
@@ -195,6 +240,7 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow, QtWidgets.QWidget):
         elif ".omf" in fileLoaded or ".ovf" in fileLoaded:
             self.doh.passListObject(('color_vectors', 'file_header'),
                                         *MultiprocessingParse.readFile(fileLoaded))
+            self.doh.setDataObject(None, 'read_plan')
             self._BLOCK_STRUCTURES_ = False
         else:
             msg = "Invalid file: {}.".format(fileLoaded)
@@ -224,50 +270,223 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow, QtWidgets.QWidget):
                             self.loadDirectoryWrapper, parent=self)
             return 0
         else:
-            try:
-                self.p = ThreadingWrapper(completeAction=None,
-                                          exceptionAction=self.raise_thread_exception, 
-                                          parent=self)
-                self.p.collapse_threads(self.loadDirectory, directory)
-                self.disablePanes()
-
-            except ValueError as e:
-                msg = "Invalid directory: {}. \
-                    Error Message {}\nDo you wish to reselect?".format(directory,
-                                                                        str(e))
-                x = PopUpWrapper("Invalid directory", msg, None,
-                                QtWidgets.QMessageBox.Yes,
-                                QtWidgets.QMessageBox.No,
-                                self.loadDirectoryWrapper,
-                                quit,
-                                parent=self)
-                to_return = None
-            except Exception as e:
-                print(e)
-                to_return = None
-            else:
-                self._BLOCK_ITERABLES_ = False
-                self._LOADED_FLAG_ = True
-                self._BLOCK_STRUCTURES_ = False
-                to_return = 1
-            return to_return
+            return self.streamDirectory(directory)
 
-    def loadDirectory(self, directory):
-        rawVectorData, header, plot_data, stages, trigger_list = \
-                            MultiprocessingParse.readFolder(directory)
+    def streamDirectory(self, directory):
+        """
+        starts StreamingLoader on a directory or a VISM archive
+        """
+        try:
+            self.read_plan, text = ReadPlan.from_string(
+                                            self.promptFrameSelection())
+            self.frame_selection = FrameSelection.from_string(text)
+            self.releaseLoader()
+            self.published_frames = 0
+            self.progressBar = ProgressBar(self,
+                                    msg="Indexing {}...".format(directory))
+            self.p = ThreadingWrapper(completeAction=self.loadDirectoryComplete,
+                                      exceptionAction=self.raise_thread_exception, 
+                                      progressAction=self.loadDirectoryProgress,
+                                      parent=self)
+            self.p.collapse_threads(self.loadDirectory, directory)
+            self.disablePanes()
+
+        except ValueError as e:
+            msg = "Invalid directory: {}. \
+                Error Message {}\nDo you wish to reselect?".format(directory,
+                                                                    str(e))
+            x = PopUpWrapper("Invalid directory", msg, None,
+                            QtWidgets.QMessageBox.Yes,
+                            QtWidgets.QMessageBox.No,
+                            self.loadDirectoryWrapper,
+                            quit,
+                            parent=self)
+            to_return = None
+        except Exception as e:
+            print(e)
+            to_return = None
+        else:
+            self._BLOCK_ITERABLES_ = False
+            self._LOADED_FLAG_ = True
+            self._BLOCK_STRUCTURES_ = False
+            to_return = 1
+        return to_return
 
-        self.doh.passListObject(('color_vectors', 'file_header',
-                                 'iterations'),
-                                rawVectorData, header, stages)
-        if plot_data is not None:
-            self.doh.setDataObject(plot_data, 'plot_data')
+    def exportArchiveWrapper(self):
+        """
+        packs a chosen simulation directory into a VISM archive
+        """
+        directory = self.promptDirectory()
+        if directory is None or directory.strip() == "":
+            return 0
+        path = self.promptArchiveFile(os.path.normpath(directory) +
+                                      VismArchive.EXTENSION)
+        if path is None or path.strip() == "":
+            return 0
+        self.progressBar = ProgressBar(self,
+                                       msg="Exporting {}...".format(directory))
+        self.p = ThreadingWrapper(completeAction=self.loadDirectoryComplete,
+                                  progressAction=self.exportArchiveProgress,
+                                  parent=self)
+        self.p.collapse_threads(self.exportArchive, directory, path)
+        return 1
+
+    def exportArchive(self, directory, path, progress_callback=None):
+        VismArchive.export(directory, path,
+                           progress_callback=lambda done, total:
+                                progress_callback((done, total)))
+
+    def exportArchiveProgress(self, progress):
+        done, total = progress
+        if self.progressBar is not None:
+            self.progressBar.realProgress(done, total,
+                                "Exported {}/{} frames".format(done, total))
+
+    @MainContextDecorators.window_resize_fix
+    def promptArchiveFile(self, default_path):
+        fileDialog = QtWidgets.QFileDialog()
+        path = str(fileDialog.getSaveFileName(self, "Save Archive",
+                                default_path,
+                                "VISM archive (*{})".format(
+                                                VismArchive.EXTENSION))[0])
+        return path
+
+    def loadDirectory(self, directory, progress_callback=None):
+        """
+        runs in a worker thread, frames are streamed in order and
+        loadDirectoryProgress publishes each loaded prefix
+        """
+        self.loader = StreamingLoader(directory, self.read_plan,
+                                      self.frame_selection)
+        # widgets apply only what is left of their options to the frames
+        self.doh.setDataObject(self.read_plan, 'read_plan')
+        if self.loader.plot_data is not None:
+            self.doh.setDataObject(self.loader.plot_data, 'plot_data')
             # successfully loaded plot_data into DOH
             self._BLOCK_PLOT_ITERABLES_ = False
         else:
             self._BLOCK_PLOT_ITERABLES_ = True
-        if trigger_list is not None:
-            self.doh.setDataObject(trigger_list, 'trigger')
-        self.enablePanes()
+        if self.loader.trigger_list is not None:
+            self.doh.setDataObject(self.loader.trigger_list, 'trigger')
+        self.loader.run(progress_callback)
+
+    def loadDirectoryProgress(self, progress):
+        """
+        receives StreamingLoader progress in the GUI thread
+        widgets built before the load finishes use frames loaded so far
+        """
+        done, total, bytes_read, bytes_total, eta = progress
+        if self.loader is None or self.loader.cancelled:
+            return
+        iterations = self.loader.stages if done == total else done
+        # progress may be handled after more frames have decoded
+        loaded = self.loader.loaded_vectors()[:done]
+        # widgets built so far hold the frames published before,
+        # they get only the frames loaded since
+        appended = loaded[self.published_frames:done]
+        self.published_frames = done
+        for pane in self.panes:
+            if pane.widget:
+                pane.widget.extend_data(appended, None,
+                                        self.loader.trigger_list)
+        self.doh.passListObject(('color_vectors', 'file_header',
+                                 'iterations'),
+                                loaded, self.loader.header, iterations)
+        if done == 1 or done == total:
+            # first frame is enough to build widgets
+            self.enablePanes()
+        if self.progressBar is not None:
+            msg = "Loaded {}/{} files, {:.1f}/{:.1f} MB".format(done, total,
+                                                bytes_read/1024**2,
+                                                bytes_total/1024**2)
+            if done < total and eta == eta:
+                msg += ", {:.0f} s left".format(eta)
+            self.progressBar.realProgress(done, total, msg)
+
+    def loadDirectoryComplete(self):
+        if self.progressBar is not None:
+            self.progressBar.close()
+            self.progressBar = None
+
+    def watchDirectory(self, enabled):
+        """
+        starts or stops polling of the loaded directory for new frames
+        """
+        self.watchTimer.stop()
+        self.liveTail = None
+        if not enabled:
+            return
+        try:
+            if self.loader is None or not self.loader.finished:
+                raise ValueError("Load a directory first")
+            self.liveTail = LiveTail(self.loader)
+        except ValueError as e:
+            x = PopUpWrapper(
+                title='Watch Directory',
+                msg='Watch mode unavailable: {}'.format(e),
+                more='',
+                yesMes=None, parent=self)
+            self.watchAction.setChecked(False)
+            return
+        self.watchTimer.start(self.WATCH_INTERVAL)
+
+    def pollDirectory(self):
+        """
+        takes in frames and plot rows written since the last poll,
+        widgets get only the appended data and keep playing
+        """
+        if self.liveTail is None or self.loader is None:
+            self.watchAction.setChecked(False)
+            return
+        known = self.loader.loaded
+        previous = self.loader.color_vectors
+        try:
+            new_frames, new_rows = self.liveTail.poll()
+        except (ValueError, OSError) as e:
+            print("Watch mode stopped: {}".format(e))
+            self.watchAction.setChecked(False)
+            return
+        if not new_frames and not new_rows:
+            return
+        loaded = self.loader.loaded_vectors()
+        self.doh.passListObject(('color_vectors', 'iterations'),
+                                loaded, self.loader.stages)
+        if self.loader.plot_data is not None:
+            self.doh.setDataObject(self.loader.plot_data, 'plot_data')
+        if self.loader.trigger_list is not None:
+            self.doh.setDataObject(self.loader.trigger_list, 'trigger')
+        appended = loaded[known:] if new_frames else None
+        moved = self.loader.color_vectors is not previous
+        del previous
+        try:
+            for pane in self.panes:
+                if pane.widget:
+                    if moved:
+                        # block grew, widgets drop views of the previous one
+                        pane.widget.replace_data(loaded[:known])
+                    pane.widget.extend_data(appended, self.loader.plot_data,
+                                            self.loader.trigger_list)
+        except Exception as e:
+            # an exception must not escape the timer slot
+            print("Watch mode stopped: {}".format(e))
+            self.watchAction.setChecked(False)
+            return
+        if moved:
+            SharedFrames.collect()
+        if self.playerWindow is not None and \
+                                    self.loader.trigger_list is not None:
+            self.playerWindow.passTriggerList(self.loader.trigger_list)
+
+    def releaseLoader(self):
+        """
+        frees shared memory of the previous load, also when it failed
+        or was replaced before loaded files were deleted
+        """
+        self.watchAction.setChecked(False)
+        if self.loader is not None:
+            self.loader.release()
+            self.loader = None
+        SharedFrames.collect()
 
     def enablePanes(self):
         for i in range(WidgetHandler.visibleCounter):
@@ -281,7 +500,11 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow, QtWidgets.QWidget):
         # clearing all widgets it's not a problem even if it does not exist
         for i in range(WidgetHandler.visibleCounter):
             self.deleteWidget(i)
+        self.releaseLoader()
         self.doh.removeDataObject('__all__')
+        # frames decoded by parse workers live in shared memory
+        SharedFrames.release_all()
+        close_archives()
 
         self._LOADED_FLAG_ = False
         self._BLOCK_STRUCTURES_ = True
@@ -334,9 +557,21 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow, QtWidgets.QWidget):
                                     parent = self)
             self.new.setHandler(self.choosingWidgetReceiver)
 
+    def showColorSettings(self, number):
+        """
+        Spawns options window of the widget in the pane filled with its
+        current options, if only colors change the widget is recolored
+        """
+        self.choosingWidgetReceiver((number, self.panes[number].alias))
+        self.window.load_options(self.panes[number].widget.options)
+
     def choosingWidgetReceiver(self, value):
         """Data receiver for choosingWidget action"""
-        self.panes[value[0]].clearBox()
+        if self.panes[value[0]].alias != value[1]:
+            self.panes[value[0]].clearBox()
+            self.panes[value[0]].alias = None
+        # otherwise the widget stays until options are known, it may
+        # only need new colors
         # value[0] stores widget number
         # value[1] stores widget name
         self.sp.swap_settings_type(value[1])
@@ -355,6 +590,19 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow, QtWidgets.QWidget):
         this allows to receive general type option structure that is passed
         on to the DataObjectHolder object that sends it to the right final object
         """
+        pane = self.panes[self.current_pane]
+        if pane.alias is not None:
+            # widget of the same type is in the pane
+            if options is None:
+                self.refreshScreen()
+                return
+            if pane.widget.recolor(options):
+                if self.playerWindow != None:
+                    self.refreshIterators()
+                self.refreshScreen()
+                return
+            pane.clearBox()
+            pane.alias = None
         if options is None:
             # delete widget
             self.deleteWidget(self.current_pane, null_delete=True)
@@ -379,6 +627,7 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow, QtWidgets.QWidget):
             self.deleteWidget(self.current_pane, null_delete=True)
             self.refreshScreen()
             return
+        pane.alias = self.current_widget_alias
         self.constructWidgetToolbar(self.panes[self.current_pane])
         # that fixes the problem of having not all slots filled in groupBox
 
@@ -395,6 +644,11 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow, QtWidgets.QWidget):
         self.toolbar = QtWidgets.QToolBar()
         self.toolbar = self.buildToolbar(pane.widget)
         if self.toolbar is not None:
+            if self.sp.widget_pane_handler[pane.alias]['object_type'] == \
+                                                                '3d_object':
+                number = self.panes.index(pane)
+                self.toolbar.addAction("Colors",
+                                lambda: self.showColorSettings(number))
             pane.layout.setMenuBar(self.toolbar)
             pane.layout.setContentsMargins(0, 0, 0, 0)
 
@@ -451,6 +705,7 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow, QtWidgets.QWidget):
         Therefore if cancel was pressed and no widget was created - hence
         null_delete, then do not call
         """
+        self.panes[number].alias = None
         if not null_delete: 
             self.panes[number].clearBox()
             self.panes[number].removeWidget(self.panes[number].widget)
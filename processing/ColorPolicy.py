@@ -3,74 +3,117 @@ from cython_modules.cython_parse import getLayerOutline, subsample
 from cython_modules.color_policy import multi_iteration_dot_product, \
                                         hyper_contrast_calculation, \
                                         multi_iteration_cross_color, \
-                                        multi_iteration_normalize
-from multiprocessing import Pool
-from processing.multiprocessing_parse import asynchronous_pool_order
+                                        multi_iteration_normalize, \
+                                        direction_grid, DIRECTION_RESOLUTION
 import scipy.signal
 from copy import deepcopy
 
 
 class ColorPolicy:      
+    # formats colors are kept in and uploaded with: dtype, components
+    # compact formats are RGBA so that each color stays 4-byte aligned
+    COLOR_FORMATS = {'float32': (np.float32, 3),
+                     'float16': (np.float16, 4),
+                     'uint8': (np.uint8, 4)}
+
     @staticmethod
-    def apply_vbo_format(color_array, k=24):
+    def pack_colors(color, color_format='float32'):
         """
-        transforms a given numpy array matrix representing vectors in space
-        into linear vbo matrix - to fit vertex buffer object
-        :param color_array: to be transformed, numpy array
-        :param k: indicates how many times should vertex be padded
+        converts float RGB colors to the format uploaded to the GPU
+        uint8 is normalized RGBA8 and float16 half-float RGBA, both opaque,
+        components are clamped to [0, 1] as OpenGL does with float colors
+        :param color: float32 array of shape (..., 3)
+        :param color_format: one of COLOR_FORMATS
+        :return array of shape (..., 3) float32 or (..., 4) compact
         """
-        output = asynchronous_pool_order(ColorPolicy.color_matrix_flatten, (k, ),
-                                            color_array)
-        return np.array(output, dtype='float32')
+        if color_format not in ColorPolicy.COLOR_FORMATS:
+            raise ValueError("Unknown color format {}, expected one of {}".format(
+                        color_format, ', '.join(ColorPolicy.COLOR_FORMATS)))
+        if color_format == 'float32':
+            return color
+        dtype, components = ColorPolicy.COLOR_FORMATS[color_format]
+        packed = np.empty(color.shape[:-1] + (components, ), dtype=dtype)
+        clamped = np.clip(color, 0, 1)
+        if color_format == 'uint8':
+            # same rounding as float colors written to an 8-bit framebuffer
+            clamped *= 255
+            np.rint(clamped, out=clamped)
+            packed[..., 3] = 255
+        else:
+            packed[..., 3] = 1
+        packed[..., :3] = clamped
+        return packed
 
     @staticmethod
-    def apply_vbo_interleave_format(vector_array, color_array):
-        output = asynchronous_pool_order(ColorPolicy.interleave,
-                                            (vector_array,), color_array)
-        return np.array(output, dtype='float32')
+    def expand_vbo_colors(color_iteration, k=24, out=None):
+        """
+        transforms colors of a single iteration, one per cell, into
+        linear vbo layout where each cell color is repeated for each
+        of its k vertices
+        colors are stored per cell and expanded only for the frame
+        being uploaded, so memory of all frames is not multiplied by k
+        :param color_iteration: colors of shape (N, C), any dtype
+        :param k: indicates how many times should vertex be padded
+        :param out: optional staging buffer of N*k*C values,
+                    reused between frames
+        :return flat array of N*k*C values
+        """
+        color_iteration = np.asarray(color_iteration)
+        cells, components = color_iteration.shape
+        if out is None:
+            out = np.empty(cells*k*components, dtype=color_iteration.dtype)
+        np.copyto(out.reshape(cells, k, components),
+                  color_iteration[:, np.newaxis, :], casting='unsafe')
+        return out
 
     @staticmethod
-    def interleave(color_iteration, vector_array):
+    def apply_vbo_interleave_format(vector_array, color_array, occupancy=None):
         """
         uses OpenGl interleaving techniques to construct VBO array
         in this case interleaving pattern is:
-        VVVCCCO where V is vertex coordinate, C is color coordinte and 
-        O is opacity
-        """
-        interleaved = []
-        for v, c in zip(vector_array, color_iteration):
-            # here add extra one for 4f visibility feature
-            if c.any():
-                interleaved.extend([*v, v[0]+c[0], v[1]+c[1], v[2]+c[2], 1])
-            else:
-                interleaved.extend([*v, v[0]+c[0], v[1]+c[1], v[2]+c[2], 0])
+        VVVACCCO where V is vertex coordinate, A is opacity of the vertex,
+        C is color coordinate (shifted by the vertex) and O is opacity
+        :param vector_array: padded outline of shape (N, 4)
+        :param color_array: colors of shape (iterations, N, 3)
+        :param occupancy: optional mask (iterations, N) of visible vectors,
+                          computed from colors if not given
+        :return float32 array of shape (iterations, N, 8)
+        """
+        vector_array = np.asarray(vector_array, dtype=np.float32)
+        color_array = np.asarray(color_array)
+        if occupancy is None:
+            occupancy = np.any(color_array, axis=-1)
+        interleaved = np.empty(color_array.shape[:-1] + (8,), dtype=np.float32)
+        interleaved[..., :4] = vector_array
+        np.add(vector_array[:, :3], color_array, out=interleaved[..., 4:7],
+               casting='unsafe')
+        interleaved[..., 7] = occupancy
         return interleaved
 
     @staticmethod
-    def color_matrix_flatten(vector, times):
-        return np.repeat(vector, times, axis=0).flatten()
-
-    @staticmethod
-    def pad_4f_vertices(color_iteration, vector_array):
+    def pad_4f_vertices(occupancy, vector_array):
         """
         this padding is used to add opacity for each vector in color matrix
         it is mostly used to hide null/NaN objects
+        :param occupancy: mask (N, ) of non-null vectors of an iteration
+        :param vector_array: outline of shape (N, 3)
+        :return float32 array (N, 4), null vectors are zeroed
         """
+        occupancy = np.asarray(occupancy)
+        vector_array = np.asarray(vector_array)
         try:
-            assert color_iteration.shape == vector_array.shape
+            assert occupancy.shape == (len(vector_array), )
         except AssertionError:
-            msg = "Color and vector dimensions must match. Not matching with" + \
-                    "color {} and vector {}".format(color_iteration.shape, 
+            msg = "Occupancy and vector dimensions must match. Not matching with" + \
+                    "occupancy {} and vector {}".format(occupancy.shape, 
                     vector_array.shape)
             raise ValueError(msg)
 
-        vector_array = vector_array.reshape(color_iteration.shape)
-        new_vector_list = np.zeros((vector_array.shape[0], 4))
-        for i in range(vector_array.shape[0]):
-            if color_iteration[i].any():
-                new_vector_list[i]= [*vector_array[i], 1.0]
-            else:
-                new_vector_list[i] = [0.0, 0.0, 0.0, 0.0]
+        vector_array = vector_array.reshape(len(occupancy), 3)
+        new_vector_list = np.empty((len(occupancy), 4), dtype=np.float32)
+        np.multiply(vector_array, occupancy[:, np.newaxis],
+                    out=new_vector_list[:, :3], casting='unsafe')
+        new_vector_list[:, 3] = occupancy
         return new_vector_list
 
     @staticmethod
@@ -78,7 +121,9 @@ class ColorPolicy:
                             picked_layer='all',
                             vector_set=[[1, 0, 0], [0, 1, 0], [0, 0, 1]],
                             color_policy_type='Standard',
-                            hyperContrast=False):
+                            hyperContrast=False,
+                            contrast_percentile=None,
+                            occupancy=False):
         """
         this function should be called whenever one of the following is needed:
         - sampling
@@ -87,10 +132,18 @@ class ColorPolicy:
         @param: vector_set - set of 3 vectors used to calculate R, G, B
                 components using dot product (valid if disableDot is False)
         @param: picked_layer - determines which layer or all to calculate
+        @param: contrast_percentile - if given, hyper contrast stretches
+                each layer by this percentile of deviations instead of
+                a fixed gain
+        @param: occupancy - if True, mask (iterations, N) of non-null
+                vectors is returned as the fourth value
         @return: dotted_color, outline, raw_color - return decimating factor,
                     color after dot product (or not) and layer(s) outline
         """
-        color = np.array(color)
+        # color may be a lazy FrameSequence, it is only materialized
+        # after layer picking and subsampling
+        if not hasattr(color, 'shape'):
+            color = np.array(color)
         outline = np.array(outline)
         expected_color_shape = (zc*xc*yc, 3) if iterations == 1 else (iterations, zc*xc*yc, 3)
         expected_outline_shape = (zc*xc*yc, 3)
@@ -109,88 +162,139 @@ class ColorPolicy:
                                                             outline.shape)
             raise AssertionError(msg)
 
+        cells, xc, yc, zc = ColorPolicy.cell_selection(xc, yc, zc,
+                                                       picked_layer,
+                                                       subsampling)
+        expected_color_shape = (iterations, zc*xc*yc, 3)
+        color = np.array(color[:, cells, :], dtype=np.float32, order='C')
+        outline = outline[cells]
+
+        original_color, occupancy_mask = ColorPolicy.color_frames(
+                                        color, xc, yc, zc, vector_set,
+                                        color_policy_type, hyperContrast,
+                                        contrast_percentile)
+        """
+        change that line below
+        it might happen that first iteration is not representative?
+        """
+        outline = ColorPolicy.pad_4f_vertices(occupancy_mask[0], outline)
+        # opacity has been added so change expected shapes
+        expected_outline_shape = (zc*xc*yc, 4)
+        # this should have shape (iterations, zc*yc*xc, 3)
         try:
-            assert subsampling >= 1
+            assert outline.shape == (zc*yc*xc, 4)
         except AssertionError:
-            msg = "Subsampling must be greater than or equal to one"
-            raise AssertionError(subsample)
+            msg = "invalid shape outline expected {} was {}".format(expected_outline_shape, 
+                                                                    outline.shape)
+            raise AssertionError(msg)
+        try:
+            assert original_color.shape == expected_color_shape
+        except AssertionError:
+            msg = "invalid color shape expected {} was {}".format(expected_color_shape, 
+                                                                original_color.shape)
+            raise AssertionError(msg)
+        try:
+            assert color.shape == expected_color_shape
+        except AssertionError:
+            msg = "invalid color shape expected {} was {}".format(expected_color_shape, 
+                                                                  color.shape)
+            raise AssertionError(msg)
+
+        if occupancy:
+            return color, outline, original_color, occupancy_mask
+        return color, outline, original_color
+
+    @staticmethod
+    def cell_selection(xc, yc, zc, picked_layer='all', subsampling=1):
         """
+        cells of a frame kept after layer picking and subsampling
         layer pick must be before subsampling because otherwise
         we might subsample (and thus remove) a layer that we 
         want to pick
+        :return cells (slice or index array), xc, yc, zc of kept cells
         """
+        try:
+            assert subsampling >= 1
+        except AssertionError:
+            msg = "Subsampling must be greater than or equal to one"
+            raise AssertionError(msg)
+        cells = slice(None)
+        total = xc*yc*zc
         if type(picked_layer) == int or zc == 1:
             # if single layer is picked modify memory data
             layer_thickness = xc*yc
             if zc != 1:
                 zc = 1
                 picked_layer = picked_layer*layer_thickness
-                color = color[:, picked_layer:picked_layer+layer_thickness, :]
-                outline = outline[picked_layer:picked_layer+layer_thickness]
-            expected_color_shape = (iterations, zc*xc*yc, 3)
-            expected_outline_shape = (zc*xc*yc, 3)
+                cells = slice(picked_layer, picked_layer+layer_thickness)
         if subsampling > 1:
             index_list = subsample(xc, yc, zc, subsample=subsampling)
             if xc > 1: xc = xc//subsampling if xc%subsampling == 0 else xc//subsampling +1
             if yc > 1: yc = yc//subsampling if yc%subsampling == 0 else yc//subsampling +1
             if zc > 1: zc = zc//subsampling if zc%subsampling == 0 else zc//subsampling +1
-            color = color[:, index_list, :]
-            outline = outline[index_list, :]
-            expected_color_shape = (iterations, zc*xc*yc, 3)
-            expected_outline_shape = (zc*xc*yc, 3)
+            cells = np.arange(total)[cells][np.asarray(index_list, dtype=np.int64)]
+        return cells, xc, yc, zc
 
+    @staticmethod
+    def color_frames(color, xc, yc, zc,
+                     vector_set=[[1, 0, 0], [0, 1, 0], [0, 0, 1]],
+                     color_policy_type='Standard', hyperContrast=False,
+                     contrast_percentile=None):
         """
-        change that line below
-        it might happen that first iteration is not representative?
+        normalizes and colors frames of already selected cells in place
+        :param color: float32 array (iterations, zc*yc*xc, 3) of raw
+                      vectors, overwritten with colors
+        :return original_color (normalized vectors), occupancy mask
         """
-        outline = ColorPolicy.pad_4f_vertices(color[0], outline)
-        # opacity has been added so change expected shapes
-        expected_outline_shape = (zc*xc*yc, 4)
-
+        # null vectors are left as zero vectors, occupancy_mask marks the others
+        occupancy_mask = multi_iteration_normalize(color, occupancy=True)
         # copy original color for arrows
-        multi_iteration_normalize(color)
         original_color = np.copy(color)
+        ColorPolicy.apply_color_policy(color, occupancy_mask, xc, yc, zc,
+                                       vector_set, color_policy_type,
+                                       hyperContrast, contrast_percentile)
+        return original_color, occupancy_mask
 
+    @staticmethod
+    def direction_lut(vector_set=[[1, 0, 0], [0, 1, 0], [0, 0, 1]],
+                      color_policy_type='Standard',
+                      resolution=DIRECTION_RESOLUTION):
+        """
+        colors of all directions of the octahedral grid, a frame is then
+        colored by lut[direction_indices(vectors)] whatever the policy
+        hyper contrast depends on other cells of a layer so it has no lut
+        :param resolution: grid side, the lut has resolution**2 entries
+        :return float32 array (resolution**2, 3)
+        """
+        lut = direction_grid(resolution)[np.newaxis]
+        ColorPolicy.apply_color_policy(lut, np.ones(lut.shape[:2], np.uint8),
+                                       len(lut[0]), 1, 1, vector_set,
+                                       color_policy_type)
+        return lut[0]
+
+    @staticmethod
+    def apply_color_policy(color, occupancy_mask, xc, yc, zc,
+                           vector_set=[[1, 0, 0], [0, 1, 0], [0, 0, 1]],
+                           color_policy_type='Standard', hyperContrast=False,
+                           contrast_percentile=None):
+        """
+        colors normalized vectors in place, this is the only step
+        to be repeated when color options change
+        :param color: float32 array (iterations, zc*yc*xc, 3) of normalized
+                      vectors, overwritten with colors
+        :param occupancy_mask: mask (iterations, zc*yc*xc) of non-null vectors
+        """
         if hyperContrast:
-            hyper_contrast_calculation(color, xc, yc, zc)
-        try:
-            assert color.shape == expected_color_shape
-        except AssertionError:
-            msg = "invalid shape color expected {} was {}".format(expected_color_shape, 
-                                                            color.shape)
-            raise AssertionError(msg)
+            hyper_contrast_calculation(color, xc, yc, zc,
+                                       percentile=contrast_percentile)
         # input is in form (iterations, zc*yc*xc, 3) and vectors are normalized        
         vector_set = np.array(vector_set).astype(np.float32)
-        # normalize all vectors
         if color_policy_type == 'Standard':
-            for i in range(0, iterations):
-                color[i, :, :] = multi_iteration_cross_color(color[i], 
-                                                                    vector_set[0],
-                                                                    vector_set[2],
-                                                                    vector_set[1])
+            # all iterations are colored in place by a single kernel call
+            multi_iteration_cross_color(color, vector_set[0], vector_set[2],
+                                        vector_set[1])
         else:
-            for i in range(0, iterations):
-                color[i, :, :] = multi_iteration_dot_product(color[i], vector_set)
-        color = np.array(color)
-        outline = np.array(outline)
-        # this should have shape (iterations, zc*yc*xc, 3)
-        try:
-            assert outline.shape == (zc*yc*xc, 4)
-        except AssertionError:
-            msg = "invalid shape outline expected {} was {}".format(expected_outline_shape, 
-                                                                    outline.shape)
-            raise AssertionError(msg)
-        try:
-            assert original_color.shape == expected_color_shape
-        except AssertionError:
-            msg = "invalid color shape expected {} was {}".format(expected_color_shape, 
-                                                                original_color.shape)
-            raise AssertionError(msg)
-        try:
-            assert color.shape == expected_color_shape
-        except AssertionError:
-            msg = "invalid color shape expected {} was {}".format(expected_color_shape, 
-                                                                  color.shape)
-            raise AssertionError(msg)
-
-        return color, outline, original_color
+            multi_iteration_dot_product(color, vector_set)
+        # empty cells stay without color
+        color[occupancy_mask == 0] = 0
+        return color
@@ -0,0 +1,403 @@
+import threading
+import traceback
+from collections import OrderedDict
+
+import numpy as np
+
+from cython_modules.color_policy import multi_iteration_normalize, \
+                                        direction_indices
+from processing.ColorPolicy import ColorPolicy
+
+
+class FrameView:
+    """
+    Read-only, sequence-like view of one per frame array of a ColorEngine,
+    widgets index it as they would an array of all frames:
+        color_vectors = engine.view('color')
+        color_vectors[i]    # colors of frame i, computed on demand
+    """
+    def __init__(self, engine, key):
+        self.engine = engine
+        self.key = key
+
+    def __len__(self):
+        return len(self.engine)
+
+    def __getitem__(self, i):
+        return self.engine.get(int(i), self.key)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class ColorEngine:
+    """
+    Lazy, per frame counterpart of ColorPolicy.standard_procedure.
+    Colors of a frame are computed when the frame is first requested,
+    so creating a widget costs a single frame whatever the frame count.
+    Computed frames are kept in an LRU cache bounded by their size in
+    bytes, frames next to the requested one are computed ahead by
+    a background thread. Color options can be changed with recolor,
+    cached frames then keep their normalized vectors and geometry and
+    only run the color policy again when next requested.
+    With color_lut, frames keep a uint16 direction index per cell instead
+    of colors and normalized vectors, colors are looked up in a table
+    built once per policy and vector set, so recoloring only swaps
+    the table, vectors are normalized again from raw frames if requested:
+        engine = ColorEngine(color_vectors, outline, xc, yc, zc, ...)
+        engine.outline                  # padded outline, (N, 4)
+        engine.get(i, 'color')          # 'original_color', 'occupancy'
+        engine.prewarm(i)               # e.g. when frame i is shown
+        engine.recolor(vector_set, 'RGB policy')
+    """
+    CACHE_BYTES = 256*1024*1024
+    # frames computed ahead, relative to the requested one
+    NEIGHBOURS = (1, 2, -1)
+
+    def __init__(self, color_vectors, outline, xc, yc, zc, subsampling=1,
+                 picked_layer='all',
+                 vector_set=[[1, 0, 0], [0, 1, 0], [0, 0, 1]],
+                 color_policy_type='Standard', hyperContrast=False,
+                 contrast_percentile=None, derive=None, cache_bytes=None,
+                 color_format='float32', derive_color=None,
+                 color_lut=False):
+        """
+        :param color_vectors: raw frames, array or FrameSequence of shape
+                              (iterations, zc*yc*xc, 3), only read on demand
+        :param outline: cell positions (zc*yc*xc, 3)
+        :param derive: optional function(entry, outline) returning a dict
+                       of further per frame arrays, e.g. vertex buffers,
+                       these are cached with the colors and kept
+                       when colors change
+        :param derive_color: as derive, for arrays that depend on
+                             the colors, e.g. line ends placed by color,
+                             computed again when colors change
+        :param color_lut: if True colors are looked up by direction in
+                          ColorPolicy.direction_lut, unless hyperContrast
+                          is set, which depends on other cells of a layer
+        :param cache_bytes: cache bound, CACHE_BYTES by default
+        :param color_format: format 'color' is kept in, one of
+                             ColorPolicy.COLOR_FORMATS, derive still
+                             gets float colors
+        other parameters are these of ColorPolicy.standard_procedure
+        """
+        outline = np.array(outline)
+        try:
+            assert outline.shape == (zc*yc*xc, 3)
+        except AssertionError:
+            msg = "invalid shape expected {} was {}".format((zc*yc*xc, 3),
+                                                            outline.shape)
+            raise AssertionError(msg)
+        self.cells, self.xc, self.yc, self.zc = ColorPolicy.cell_selection(
+                                        xc, yc, zc, picked_layer, subsampling)
+        self.vector_set = vector_set
+        self.color_policy_type = color_policy_type
+        self.hyperContrast = hyperContrast
+        self.contrast_percentile = contrast_percentile
+        self.derive = derive
+        self.derive_color = derive_color
+        self.color_lut = color_lut
+        if color_format not in ColorPolicy.COLOR_FORMATS:
+            raise ValueError("Unknown color format {}".format(color_format))
+        self.color_format = color_format
+        self.cache_bytes = ColorEngine.CACHE_BYTES if cache_bytes is None \
+                                                            else cache_bytes
+        # sources grow with extend, offsets are their first frame numbers
+        self._sources = []
+        self._offsets = []
+        self._frames = 0
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._inflight = {}
+        # color options generation each cached frame was colored with
+        self._generation = 0
+        self._painted = {}
+        self._lut = self._build_lut()
+        self._wanted = []
+        self._worker = None
+        self._lock = threading.Lock()
+        self.extend(color_vectors)
+        if not self._frames:
+            raise ValueError("No frames to color")
+        # first frame decides which cells are shown, as it did when
+        # all frames were colored at once
+        entry = self._colors(0)
+        self.outline = ColorPolicy.pad_4f_vertices(entry['occupancy'],
+                                                   outline[self.cells])
+        self._store(0, self._complete(0, entry), self._generation)
+
+    def __len__(self):
+        return self._frames
+
+    @property
+    def cached_bytes(self):
+        return self._cached_bytes
+
+    def view(self, key):
+        return FrameView(self, key)
+
+    def extend(self, color_vectors):
+        """
+        appends raw frames, e.g. written by a running simulation
+        """
+        if color_vectors is None or not len(color_vectors):
+            return
+        with self._lock:
+            self._sources.append(color_vectors)
+            self._offsets.append(self._frames)
+            self._frames += len(color_vectors)
+
+    def replace(self, color_vectors):
+        """
+        replaces raw frames by the same frames in another buffer, e.g.
+        after a growing shared block was reallocated, so that the previous
+        buffer can be freed, cached colors are kept
+        """
+        if len(color_vectors) != self._frames:
+            raise ValueError("Expected {} frames, got {}".format(
+                                            self._frames, len(color_vectors)))
+        with self._lock:
+            self._sources = [color_vectors]
+            self._offsets = [0]
+
+    def _raw(self, i):
+        source = np.searchsorted(self._offsets, i, side='right') - 1
+        # lazy sources read only the selected cells
+        frame = self._sources[source][i - self._offsets[source], self.cells]
+        # always a copy, frames are colored in place
+        return np.array(frame, dtype=np.float32, order='C')
+
+    def _build_lut(self):
+        """
+        :return float and color_format direction luts, each followed
+                by the color of empty cells, None if not used
+        """
+        if not self.color_lut or self.hyperContrast:
+            return None
+        lut = ColorPolicy.direction_lut(self.vector_set,
+                                        self.color_policy_type)
+        lut = np.concatenate((lut, np.zeros((1, 3), dtype=np.float32)))
+        return lut, ColorPolicy.pack_colors(lut, self.color_format)
+
+    @staticmethod
+    def _lookup(entry, lut):
+        color = np.take(lut, entry['direction'], axis=0)
+        color[entry['occupancy'] == 0] = lut[-1]
+        return color
+
+    def _colors(self, i):
+        color = self._raw(i)[np.newaxis]
+        if self._lut is not None:
+            occupancy = multi_iteration_normalize(color, occupancy=True)
+            return {'original_color': color[0], 'occupancy': occupancy[0]}
+        original_color, occupancy = ColorPolicy.color_frames(
+                                    color, self.xc, self.yc, self.zc,
+                                    self.vector_set, self.color_policy_type,
+                                    self.hyperContrast,
+                                    self.contrast_percentile)
+        return {'color': color[0], 'original_color': original_color[0],
+                'occupancy': occupancy[0]}
+
+    def _normalized(self, i):
+        """
+        normalized vectors of frame i read again from its raw frame,
+        these are not kept with color_lut
+        """
+        color = self._raw(i)
+        multi_iteration_normalize(color)
+        return color
+
+    def _complete(self, i, entry):
+        if self.derive is not None:
+            entry.update(self.derive(entry, self.outline))
+        return self._paint(i, entry)
+
+    def _paint(self, i, entry):
+        lut = self._lut
+        if lut is not None:
+            entry.pop('color', None)
+            if 'direction' not in entry:
+                entry['direction'] = direction_indices(entry['original_color'])
+            if self.derive_color is not None:
+                colored = dict(entry, color=ColorEngine._lookup(entry, lut[0]))
+                if 'original_color' not in colored:
+                    colored['original_color'] = self._normalized(i)
+                entry.update(self.derive_color(colored, self.outline))
+            # only directions are cached, derive has got the vectors
+            entry.pop('original_color', None)
+            return entry
+        entry.pop('direction', None)
+        if self.derive_color is not None:
+            entry.update(self.derive_color(entry, self.outline))
+        entry['color'] = ColorPolicy.pack_colors(entry['color'],
+                                                 self.color_format)
+        return entry
+
+    def _repaint(self, i, entry):
+        """
+        colors a cached frame again from its normalized vectors,
+        other arrays of the entry are shared with the old one
+        """
+        entry = dict(entry)
+        if self._lut is not None:
+            return self._paint(i, entry)
+        if 'original_color' not in entry:
+            # lut was switched off, vectors were not kept
+            entry['original_color'] = self._normalized(i)
+        color = np.copy(entry['original_color'])[np.newaxis]
+        ColorPolicy.apply_color_policy(color, entry['occupancy'][np.newaxis],
+                                       self.xc, self.yc, self.zc,
+                                       self.vector_set, self.color_policy_type,
+                                       self.hyperContrast,
+                                       self.contrast_percentile)
+        entry['color'] = color[0]
+        return self._paint(i, entry)
+
+    @staticmethod
+    def _entry_bytes(entry):
+        return sum(value.nbytes for value in entry.values())
+
+    def _store(self, i, entry, generation):
+        """
+        :return False if colors changed while the entry was computed
+        """
+        size = ColorEngine._entry_bytes(entry)
+        with self._lock:
+            if generation != self._generation:
+                return False
+            if self._painted.get(i) == generation:
+                return True
+            if i in self._cache:
+                self._cached_bytes -= ColorEngine._entry_bytes(self._cache[i])
+            self._cache[i] = entry
+            self._cache.move_to_end(i)
+            self._painted[i] = generation
+            self._cached_bytes += size
+            # the newest frame is kept even if it alone exceeds the bound
+            while self._cached_bytes > self.cache_bytes and \
+                                                        len(self._cache) > 1:
+                j, evicted = self._cache.popitem(last=False)
+                del self._painted[j]
+                self._cached_bytes -= ColorEngine._entry_bytes(evicted)
+            return True
+
+    def get(self, i, key):
+        """
+        :return per frame array key of frame i, colors kept as
+                directions are looked up, vectors not kept with
+                color_lut are normalized again
+        """
+        while True:
+            entry = self.frame(i)
+            lut = self._lut
+            if key == 'original_color' and key not in entry:
+                return self._normalized(i % len(self))
+            if key != 'color' or 'color' in entry:
+                return entry[key]
+            if lut is not None:
+                return ColorEngine._lookup(entry, lut[1])
+            # lut was dropped by recolor meanwhile
+
+    def frame(self, i):
+        """
+        :return dict of per frame arrays: 'color' in color_format or
+                'direction' (N, ) lut indices with color_lut,
+                'original_color' (N, 3) normalized vectors, not kept
+                with color_lut,
+                'occupancy' (N, ) and these added by derive
+        """
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Frame {} out of range {}".format(i, len(self)))
+        while True:
+            with self._lock:
+                entry = self._cache.get(i)
+                if entry is not None and \
+                                    self._painted[i] == self._generation:
+                    self._cache.move_to_end(i)
+                    return entry
+                pending = self._inflight.get(i)
+                if pending is None:
+                    pending = self._inflight[i] = threading.Event()
+                    break
+            # frame is being computed by another thread, wait for it
+            pending.wait()
+        try:
+            while True:
+                generation = self._generation
+                if entry is None:
+                    entry = self._complete(i, self._colors(i))
+                else:
+                    # only colors are outdated
+                    entry = self._repaint(i, entry)
+                if self._store(i, entry, generation):
+                    break
+        finally:
+            with self._lock:
+                del self._inflight[i]
+            pending.set()
+        return entry
+
+    def prewarm(self, i):
+        """
+        schedules neighbours of frame i to be computed in background,
+        requests of a previous frame that did not start yet are dropped
+        """
+        frames = len(self)
+        with self._lock:
+            self._wanted = [(i + offset) % frames
+                            for offset in ColorEngine.NEIGHBOURS]
+            self._wanted = [j for j in self._wanted
+                            if self._painted.get(j) != self._generation and
+                            j not in self._inflight]
+            if self._wanted and self._worker is None:
+                self._worker = threading.Thread(target=self._prewarm_worker,
+                                                daemon=True)
+                self._worker.start()
+
+    def _prewarm_worker(self):
+        while True:
+            with self._lock:
+                if not self._wanted:
+                    self._worker = None
+                    return
+                i = self._wanted.pop(0)
+            try:
+                self.frame(i)
+            except Exception:
+                traceback.print_exc()
+
+    def recolor(self, vector_set=[[1, 0, 0], [0, 1, 0], [0, 0, 1]],
+                color_policy_type='Standard', hyperContrast=False,
+                contrast_percentile=None, color_lut=False):
+        """
+        changes color options, parameters are these of the constructor
+        cached frames are colored again from their normalized vectors
+        when next requested, without reading or normalizing the data
+        and without recomputing arrays given by derive, with color_lut
+        only the lut is built again
+        """
+        with self._lock:
+            self.vector_set = vector_set
+            self.color_policy_type = color_policy_type
+            self.hyperContrast = hyperContrast
+            self.contrast_percentile = contrast_percentile
+            self.color_lut = color_lut
+            kept_directions = self._lut is not None
+            self._lut = self._build_lut()
+            if self._lut is None or not kept_directions or \
+                                            self.derive_color is not None:
+                self._generation += 1
+                self._wanted = []
+
+    def clear(self):
+        """
+        drops cached frames and pending background requests
+        """
+        with self._lock:
+            self._wanted = []
+            self._cache.clear()
+            self._painted.clear()
+            self._cached_bytes = 0
@@ -0,0 +1,217 @@
+"""
+Transparent reading of compressed simulation outputs.
+Supported are individually compressed files (m000.omf.gz, table.odt.xz)
+and members of .tar(.gz/.bz2/.xz) and .zip archives. A member is addressed
+as archive path and member name joined by MEMBER_SEPARATOR, e.g.
+    run.tar.gz::run/m000001.omf
+Everything is decompressed on the fly, nothing is unpacked to disk.
+Members of .zip and uncompressed .tar files are read with a single seek.
+A compressed tarball can only be read forward, so each process keeps its
+tarballs open and reading members in order (as pool chunks do) continues
+the stream instead of decompressing it again from the start.
+"""
+import io
+import os
+import bz2
+import gzip
+import lzma
+import tarfile
+import zipfile
+import threading
+
+
+MEMBER_SEPARATOR = '::'
+COMPRESSED_EXTENSIONS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz',
+                  '.txz')
+ZIP_EXTENSIONS = ('.zip',)
+# archive path -> (mtime_ns, open TarFile, members by name), per process
+_tarballs = {}
+_tarballs_lock = threading.RLock()
+
+
+class _ArchiveMember(io.BufferedReader):
+    """
+    member file that closes its archive when closed
+    """
+    def __init__(self, member, archive):
+        super().__init__(member)
+        self._archive = archive
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._archive.close()
+
+
+class _TarMember(io.BufferedReader):
+    """
+    member of a cached tarball, the tarball stays open for next members
+    """
+    def close(self):
+        try:
+            super().close()
+        finally:
+            _tarballs_lock.release()
+
+
+class _Borrowed(io.BufferedReader):
+    """
+    already opened file passed to a reader, left open when reader is done
+    """
+    def close(self):
+        pass
+
+
+def is_archive(path):
+    """
+    :return True for .tar(.gz/.bz2/.xz) and .zip files
+    """
+    return str(path).lower().endswith(TAR_EXTENSIONS + ZIP_EXTENSIONS) and \
+                                                        os.path.isfile(path)
+
+
+def split_member(path):
+    """
+    :return (archive path, member name) or (path, None) for plain files
+    """
+    path = str(path)
+    if MEMBER_SEPARATOR in path:
+        archive, member = path.rsplit(MEMBER_SEPARATOR, 1)
+        if is_archive(archive):
+            return archive, member
+    return path, None
+
+
+def member_path(archive, member):
+    return archive + MEMBER_SEPARATOR + member
+
+
+def logical_name(path):
+    """
+    file name with compression extension removed, e.g. m000.omf.gz -> m000.omf
+    used wherever the format is told from the extension
+    """
+    archive, member = split_member(path)
+    name = os.path.basename(member if member is not None else archive)
+    root, ext = os.path.splitext(name)
+    if ext.lower() in COMPRESSED_EXTENSIONS and \
+                                not name.lower().endswith(TAR_EXTENSIONS):
+        return root
+    return name
+
+
+def is_compressed(path):
+    """
+    :return True if the file cannot be mapped directly from disk
+    """
+    archive, member = split_member(path)
+    return member is not None or logical_name(path) != os.path.basename(path)
+
+
+def input_stat(path):
+    """
+    :return (size, mtime_ns) of a file, archive members report these of
+            the archive, so a modified archive invalidates all members
+    """
+    stat = os.stat(split_member(path)[0])
+    return stat.st_size, stat.st_mtime_ns
+
+
+def list_archive(archive):
+    """
+    :return list of (member name, uncompressed size) of regular files
+    """
+    if archive.lower().endswith(ZIP_EXTENSIONS):
+        with zipfile.ZipFile(archive) as z:
+            return [(info.filename, info.file_size) for info in z.infolist()
+                    if not info.is_dir()]
+    with tarfile.open(archive, 'r:*') as tar:
+        return [(info.name, info.size) for info in tar if info.isfile()]
+
+
+def iter_archive(archive, members):
+    """
+    opens given members in a single pass over the archive, compressed
+    tarballs are decompressed only once
+    :param members: set of member names
+    :return generator of (member name, opened binary file)
+    """
+    if archive.lower().endswith(ZIP_EXTENSIONS):
+        with zipfile.ZipFile(archive) as z:
+            for info in z.infolist():
+                if info.filename in members:
+                    with z.open(info) as f:
+                        yield info.filename, f
+        return
+    with tarfile.open(archive, 'r|*') as tar:
+        for info in tar:
+            if info.isfile() and info.name in members:
+                yield info.name, tar.extractfile(info)
+
+
+def open_input(source):
+    """
+    :param source: file path, archive member path or an opened binary file
+    :return binary file object decompressing on read
+    """
+    if hasattr(source, 'read'):
+        return _Borrowed(source)
+    archive, member = split_member(source)
+    if member is None:
+        ext = os.path.splitext(archive)[1].lower()
+        if ext in COMPRESSED_EXTENSIONS:
+            return COMPRESSED_EXTENSIONS[ext](archive, 'rb')
+        return open(archive, 'rb')
+    if archive.lower().endswith(ZIP_EXTENSIONS):
+        z = zipfile.ZipFile(archive)
+        try:
+            return _ArchiveMember(z.open(member), z)
+        except BaseException:
+            z.close()
+            raise
+    return _open_tar_member(archive, member)
+
+
+def _open_tar_member(archive, member):
+    """
+    opens a member of a cached tarball, members ahead of the last read
+    one are reached by continuing the stream
+    """
+    _tarballs_lock.acquire()
+    try:
+        mtime_ns = os.stat(archive).st_mtime_ns
+        cached = _tarballs.get(archive)
+        if cached is None or cached[0] != mtime_ns:
+            if cached is not None:
+                cached[1].close()
+            cached = (mtime_ns, tarfile.open(archive, 'r:*'), {})
+            _tarballs[archive] = cached
+        _, tar, members = cached
+        # members already passed are known, others are scanned for
+        info = members.get(member)
+        while info is None:
+            info = tar.next()
+            if info is None:
+                break
+            members[info.name] = info
+            if info.name != member:
+                info = None
+        if info is None or not info.isfile():
+            raise FileNotFoundError("{} not found in {}".format(member,
+                                                                archive))
+        return _TarMember(tar.extractfile(info))
+    except BaseException:
+        _tarballs_lock.release()
+        raise
+
+
+def close_archives():
+    """
+    closes tarballs kept open by this process
+    """
+    with _tarballs_lock:
+        for _, tar, _ in _tarballs.values():
+            tar.close()
+        _tarballs.clear()
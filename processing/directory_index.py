@@ -0,0 +1,308 @@
+import os
+import re
+import copy
+import json
+import hashlib
+
+import numpy as np
+
+from cython_modules.cython_parse import read_vector_header
+from processing.compressed_input import is_archive, list_archive, \
+                                        iter_archive, member_path, \
+                                        logical_name, is_compressed, \
+                                        input_stat
+from processing.parse_cache import ParseCache
+
+
+def natural_key(filename):
+    """
+    sort key that orders embedded numbers numerically, so that
+    m2.ovf goes before m10.ovf
+    """
+    return [int(part) if part.isdigit() else part.lower()
+            for part in re.split(r'(\d+)', filename)]
+
+
+class DirectoryIndex:
+    """
+    Single pass index of a simulation output directory.
+    The directory is listed once with os.scandir and only headers of vector
+    files are read. Per-file metadata is kept in a compact columnar table
+    and persisted under the parse cache directory (VISM_CACHE_DIR), so
+    that reopening the directory reads only headers of new or modified
+    files and data directories are never written to.
+    Files may be individually compressed (m000.omf.gz) and a .tar(.gz) or
+    .zip archive can take place of the directory, its members are then
+    indexed in a single pass over the archive.
+    """
+    INDEX_DIR = 'index'
+    INDEX_VERSION = 1
+    # vector file extension and the accompanying plot file
+    SUPPORTED_EXTENSIONS = [('.omf', '*.odt'), ('.ovf', 'table.txt')]
+    COLUMNS = ['name', 'size', 'mtime_ns', 'encoding', 'dtype',
+               'data_offset', 'stage', 'iteration', 'time',
+               'xnodes', 'ynodes', 'znodes', 'xbase', 'ybase', 'zbase']
+    STAGE_REGEX = re.compile(r'Stage:\s*(-?\d+)')
+    ITERATION_REGEX = re.compile(r'Iteration:\s*(-?\d+)')
+    TIME_REGEX = re.compile(r'Total simulation time:\s*([-+0-9.eE]+)')
+    FILENAME_REGEX = re.compile(r'-(\d+)-(\d+)\.omf$')
+    MUMAX_FILENAME_REGEX = re.compile(r'(\d+)\.ovf$')
+
+    def __init__(self, directory, persist=True):
+        self.directory = directory
+        self.archive = is_archive(directory)
+        self.extension = None
+        self.plot_file = None
+        self.header = None
+        self.table = None
+        self._scan(persist)
+
+    def _entries(self):
+        """
+        :return list of (name, path, size, mtime_ns) of directory files
+                or archive members
+        """
+        if self.archive:
+            mtime_ns = os.stat(self.directory).st_mtime_ns
+            return [(name, member_path(self.directory, name), size, mtime_ns)
+                    for name, size in list_archive(self.directory)]
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((entry.name, entry.path, stat.st_size,
+                                stat.st_mtime_ns))
+        return entries
+
+    def _scan(self, persist):
+        vector_files = {}
+        plot_files = {}
+        for entry in self._entries():
+            # compressed files are recognized by their inner extension
+            name = logical_name(entry[1])
+            for vector_ext, plot_pattern in \
+                                    DirectoryIndex.SUPPORTED_EXTENSIONS:
+                if name.endswith(vector_ext):
+                    vector_files.setdefault(vector_ext, []).append(entry)
+                elif (plot_pattern.startswith('*') and
+                        name.endswith(plot_pattern[1:])) or \
+                        name == plot_pattern:
+                    plot_files.setdefault(vector_ext, []).append(entry[1])
+        # NOTE: could be both .omf or .ovf but not mixed
+        for vector_ext, plot_pattern in DirectoryIndex.SUPPORTED_EXTENSIONS:
+            if vector_ext in vector_files:
+                self.extension = (vector_ext, plot_pattern)
+                break
+        if self.extension is None:
+            raise ValueError("Invalid Directory")
+        plot_candidates = plot_files.get(self.extension[0], [])
+        if len(plot_candidates) > 1:
+            raise ValueError("plot file extension conflict (too many)")
+        self.plot_file = plot_candidates[0] if plot_candidates else None
+
+        entries = sorted(vector_files[self.extension[0]],
+                         key=lambda entry: natural_key(entry[0]))
+        previous = self._load_persisted()
+        stale = [entry for entry in entries
+                 if entry[0] not in previous or
+                    previous[entry[0]]['size'] != entry[2] or
+                    previous[entry[0]]['mtime_ns'] != entry[3]]
+        read = dict(self._read_entries(stale))
+        rows = []
+        for i, (name, path, size, mtime_ns) in enumerate(entries):
+            if name in read:
+                row, header = read[name]
+                if i == 0:
+                    # header of the first file describes the whole set
+                    self.header = header
+            else:
+                row = previous[name]
+            rows.append(row)
+        if self.header is None:
+            self.header = self._persisted_header
+        if self.header is None:
+            self.header = read_vector_header(entries[0][1])[0]
+        self.table = {column: np.array([row[column] for row in rows])
+                      for column in DirectoryIndex.COLUMNS}
+        if persist and (read or len(previous) != len(rows)):
+            self._persist()
+
+    def _read_entries(self, entries):
+        """
+        reads headers of given entries, members of an archive are read
+        in a single pass so that a compressed tarball is decompressed once
+        :return generator of (name, (row, header))
+        """
+        if not self.archive:
+            for name, path, size, mtime_ns in entries:
+                yield name, DirectoryIndex._read_entry(path, (size, mtime_ns))
+            return
+        stats = {name: (size, mtime_ns)
+                 for name, path, size, mtime_ns in entries}
+        for name, f in iter_archive(self.directory, set(stats)):
+            yield name, DirectoryIndex._read_entry(f, stats[name], name)
+
+    @staticmethod
+    def _read_entry(path, stat=None, name=None):
+        """
+        reads a single vector file header into an index row
+        :param path: file path or an opened archive member
+        :param stat: (size, mtime_ns) pair
+        :param name: name of the row, basename of path by default
+        :return row dictionary, full header dictionary
+        """
+        if stat is None:
+            stat = input_stat(path)
+        header, encoding, dtype, offset = read_vector_header(path)
+        if name is None:
+            name = os.path.basename(path)
+        description = str(header.get('Desc', ''))
+        stage, iteration, time = -1, -1, np.nan
+        m = DirectoryIndex.STAGE_REGEX.search(description)
+        if m is not None:
+            stage = int(m.group(1))
+        m = DirectoryIndex.ITERATION_REGEX.search(description)
+        if m is not None:
+            iteration = int(m.group(1))
+        m = DirectoryIndex.TIME_REGEX.search(description)
+        if m is not None:
+            time = float(m.group(1))
+        m = DirectoryIndex.FILENAME_REGEX.search(logical_name(name))
+        if m is not None:
+            if stage < 0:
+                stage = int(m.group(1))
+            if iteration < 0:
+                iteration = int(m.group(2))
+        m = DirectoryIndex.MUMAX_FILENAME_REGEX.search(logical_name(name))
+        if m is not None and stage < 0:
+            stage = int(m.group(1))
+        row = {
+            'name': name,
+            'size': stat[0],
+            'mtime_ns': stat[1],
+            'encoding': encoding,
+            'dtype': dtype.str if dtype is not None else '',
+            'data_offset': offset,
+            'stage': stage,
+            'iteration': iteration,
+            'time': time,
+        }
+        for key in ('xnodes', 'ynodes', 'znodes'):
+            row[key] = int(header[key])
+        for key in ('xbase', 'ybase', 'zbase'):
+            row[key] = float(header[key])
+        return row, header
+
+    @staticmethod
+    def file_entry(path):
+        """
+        index row and header of a single file, used when a single file
+        is loaded
+        """
+        return DirectoryIndex._read_entry(path)
+
+    @property
+    def index_path(self):
+        """
+        persisted index file, named after the absolute directory path
+        """
+        key = hashlib.sha1(os.path.abspath(self.directory).encode('utf-8'))
+        return os.path.join(ParseCache.CACHE_DIR, DirectoryIndex.INDEX_DIR,
+                            key.hexdigest() + '.json')
+
+    def _load_persisted(self):
+        self._persisted_header = None
+        try:
+            with open(self.index_path, 'r') as f:
+                persisted = json.load(f)
+            if persisted.get('version') != DirectoryIndex.INDEX_VERSION or \
+                    persisted.get('extension') != list(self.extension):
+                return {}
+            self._persisted_header = persisted['header']
+            columns = persisted['files']
+            columns['time'] = [np.nan if t is None else t
+                               for t in columns['time']]
+            return {name: {column: columns[column][i]
+                           for column in DirectoryIndex.COLUMNS}
+                    for i, name in enumerate(columns['name'])}
+        except (OSError, ValueError, KeyError, IndexError):
+            return {}
+
+    def _persist(self):
+        persisted = {
+            'version': DirectoryIndex.INDEX_VERSION,
+            'extension': list(self.extension),
+            'header': self.header,
+            'files': {column: [None if isinstance(v, float) and np.isnan(v)
+                               else v for v in self.table[column].tolist()]
+                      for column in DirectoryIndex.COLUMNS}
+        }
+        tmp_path = self.index_path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(persisted, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            # an unwritable cache is fine, index is rebuilt
+            pass
+
+    def subset(self, positions):
+        """
+        :param positions: positions of files to keep
+        :return index of the given files only, it is never persisted
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        subset = copy.copy(self)
+        subset.table = {column: values[positions]
+                        for column, values in self.table.items()}
+        return subset
+
+    def __len__(self):
+        return len(self.table['name'])
+
+    @property
+    def files(self):
+        if self.archive:
+            return [member_path(self.directory, name)
+                    for name in self.table['name']]
+        return [os.path.join(self.directory, name)
+                for name in self.table['name']]
+
+    @property
+    def is_compressed(self):
+        """
+        compressed files cannot be mapped, they are decoded in workers
+        """
+        return self.archive or any(is_compressed(name)
+                                   for name in self.table['name'])
+
+    @property
+    def is_binary(self):
+        return bool(len(self)) and \
+                        str(self.table['encoding'][0]).startswith('Binary')
+
+    @property
+    def cells(self):
+        return int(self.table['xnodes'][0]*self.table['ynodes'][0]*
+                   self.table['znodes'][0])
+
+    @property
+    def driver(self):
+        """
+        OOMMF driver name e.g. Oxs_MinDriver, deduced from header title
+        """
+        title = str(self.header.get('Title', ''))
+        return title.split('::')[0] if '::' in title else None
+
+    def column(self, name):
+        return self.table[name]
+
+    def frame_sources(self):
+        """
+        :return list of (filename, data_offset, dtype) for FrameSequence
+        """
+        return [(filename, int(offset), np.dtype(dtype))
+                for filename, offset, dtype in zip(self.files,
+                                                   self.table['data_offset'],
+                                                   self.table['dtype'])]
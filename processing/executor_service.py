@@ -0,0 +1,173 @@
+import os
+import time
+import atexit
+import threading
+from multiprocessing import Pool, TimeoutError, resource_tracker
+
+
+class CancelledError(Exception):
+    pass
+
+
+def _call(task):
+    func, objects, args = task
+    return [func(obj, *args) for obj in objects]
+
+
+class ExecutorService:
+    """
+    Long-lived process pool shared by parsing, color calculation
+    and plotting. The pool is created on first use and reused by all
+    subsequent calls, so worker processes are not leaked on every request.
+    Configuration (also through environment):
+        VISM_WORKERS - number of worker processes, cpu count by default
+        VISM_CHUNK_SIZE - number of objects sent to a worker at once,
+                          chosen automatically by default
+        VISM_TIMEOUT - seconds without any finished object after which
+                       a call is considered stalled
+    """
+    WORKERS = int(os.environ.get('VISM_WORKERS', 0)) or os.cpu_count() or 1
+    CHUNK_SIZE = int(os.environ.get('VISM_CHUNK_SIZE', 0)) or None
+    TIMEOUT = float(os.environ.get('VISM_TIMEOUT', 60))
+    # how often waiting calls check for cancellation
+    POLL_INTERVAL = 0.1
+
+    _pool = None
+    _generation = 0
+    _lock = threading.RLock()
+
+    @staticmethod
+    def configure(workers=None, chunk_size=None, timeout=None):
+        """
+        changes executor settings, pool is recreated if worker count changes
+        """
+        with ExecutorService._lock:
+            if workers is not None and workers != ExecutorService.WORKERS:
+                ExecutorService.WORKERS = workers
+                ExecutorService.shutdown()
+            if chunk_size is not None:
+                ExecutorService.CHUNK_SIZE = chunk_size
+            if timeout is not None:
+                ExecutorService.TIMEOUT = timeout
+
+    @staticmethod
+    def pool():
+        with ExecutorService._lock:
+            if ExecutorService._pool is None:
+                # workers must share the resource tracker of this process,
+                # otherwise each of them reports shared memory blocks it
+                # attached to as leaked when it exits
+                resource_tracker.ensure_running()
+                ExecutorService._pool = Pool(ExecutorService.WORKERS)
+            return ExecutorService._pool
+
+    @staticmethod
+    def chunk_size(length):
+        if ExecutorService.CHUNK_SIZE is not None:
+            return ExecutorService.CHUNK_SIZE
+        # few chunks per worker balances load and transfer overhead
+        return max(1, length // (4*ExecutorService.WORKERS))
+
+    @staticmethod
+    def imap(func, object_list, args=(), chunk_size=None, timeout=None):
+        """
+        lazily yields func(obj, *args) for each obj in object_list in order
+        :param func: picklable (module level or static) function
+        :param object_list: sequence of objects to be processed
+        :param args: additional non-iterative parameters of func
+        :param chunk_size: objects per task, chunk_size() if None
+        :param timeout: maximum time in seconds between two consecutive
+                        finished chunks, TIMEOUT if None
+        Exceptions raised in workers are propagated to the caller,
+        multiprocessing.TimeoutError is raised if no progress is made
+        and CancelledError if cancel() was called in the meantime
+        A stalled call is only abandoned by its caller, the shared pool
+        and other running calls are left alone, chunks of the call not
+        yet handed to the pool are skipped
+        """
+        length = len(object_list)
+        if timeout is None:
+            timeout = ExecutorService.TIMEOUT
+        if chunk_size is None:
+            chunk_size = ExecutorService.chunk_size(length)
+        generation = ExecutorService._generation
+        abandoned = threading.Event()
+
+        def tasks():
+            # read by the task handler thread of the pool, stops
+            # feeding the pool once the call is abandoned
+            for i in range(0, length, chunk_size):
+                if abandoned.is_set():
+                    return
+                yield func, object_list[i:i+chunk_size], args
+
+        # chunks are formed here, Pool.imap with chunksize > 1 returns
+        # a plain generator that cannot be waited on with a timeout
+        results = ExecutorService.pool().imap(_call, tasks())
+        for _ in range(0, length, chunk_size):
+            last_progress = time.monotonic()
+            while True:
+                if generation != ExecutorService._generation:
+                    raise CancelledError("Function {} cancelled".format(
+                                                            func.__name__))
+                try:
+                    result = results.next(
+                                    timeout=ExecutorService.POLL_INTERVAL)
+                    break
+                except TimeoutError:
+                    if time.monotonic() - last_progress >= timeout:
+                        abandoned.set()
+                        raise TimeoutError("Function {}: no progress for {} s"\
+                                            .format(func.__name__, timeout))
+            for item in result:
+                yield item
+
+    @staticmethod
+    def map(func, object_list, args=(), chunk_size=None, timeout=None,
+            progress_callback=None):
+        """
+        parallel equivalent of [func(obj, *args) for obj in object_list]
+        :param progress_callback: optional function called with
+                                  (done, total) after each finished object
+        see imap for the remaining parameters
+        """
+        output_list = []
+        total = len(object_list)
+        for result in ExecutorService.imap(func, object_list, args,
+                                           chunk_size, timeout):
+            output_list.append(result)
+            if progress_callback is not None:
+                progress_callback(len(output_list), total)
+        return output_list
+
+    @staticmethod
+    def cancel():
+        """
+        cancels all running calls, worker processes are terminated
+        and a fresh pool is created on next use
+        """
+        with ExecutorService._lock:
+            ExecutorService._generation += 1
+            if ExecutorService._pool is not None:
+                ExecutorService._pool.terminate()
+                ExecutorService._pool.join()
+                ExecutorService._pool = None
+
+    @staticmethod
+    def shutdown(wait=True):
+        """
+        closes the pool
+        :param wait: if True workers finish pending tasks first,
+                     otherwise they are terminated
+        """
+        if not wait:
+            ExecutorService.cancel()
+            return
+        with ExecutorService._lock:
+            if ExecutorService._pool is not None:
+                ExecutorService._pool.close()
+                ExecutorService._pool.join()
+                ExecutorService._pool = None
+
+
+atexit.register(ExecutorService.shutdown, wait=False)
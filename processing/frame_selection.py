@@ -0,0 +1,77 @@
+import numpy as np
+
+
+class FrameSelection:
+    """
+    Describes which frames of a simulation directory are loaded:
+        stage_range - (first, last) stage numbers, inclusive
+        time_window - (start, end) total simulation time in s, inclusive
+        stride - every n-th of the frames left after range filtering
+    Stage numbers and times come from the DirectoryIndex, frames without
+    a known stage are numbered by their position in the directory.
+    """
+    def __init__(self, stage_range=None, stride=1, time_window=None):
+        if int(stride) < 1:
+            raise ValueError("Frame stride must be a positive integer")
+        self.stage_range = stage_range
+        self.stride = int(stride)
+        self.time_window = time_window
+
+    @staticmethod
+    def from_string(text):
+        """
+        parses selection typed in the directory dialog, e.g.
+            stages=200..400, stride=10
+            time=0..5e-9
+        :return FrameSelection or None if text is empty
+        """
+        text = text.strip()
+        if not text:
+            return None
+        options = {}
+        for part in text.split(','):
+            if '=' not in part:
+                raise ValueError("Expected key=value, got {}".format(part))
+            key, value = (item.strip() for item in part.split('=', 1))
+            if key in ('stages', 'time'):
+                if '..' not in value:
+                    raise ValueError("Expected range start..end for "
+                                     "{}".format(key))
+                start, end = value.split('..')
+                cast = int if key == 'stages' else float
+                options['stage_range' if key == 'stages' else 'time_window'] = \
+                                            (cast(start), cast(end))
+            elif key == 'stride':
+                options['stride'] = int(value)
+            else:
+                raise ValueError("Unknown frame selection key {}".format(key))
+        return FrameSelection(**options)
+
+    @property
+    def is_full(self):
+        return self.stage_range is None and self.time_window is None and \
+                    self.stride == 1
+
+    def positions(self, index):
+        """
+        :param index: DirectoryIndex of the whole directory
+        :return sorted positions of selected files in the index
+        """
+        positions = np.arange(len(index))
+        if self.stage_range is not None:
+            stages = np.array(index.column('stage'), dtype=np.int64)
+            stages = np.where(stages >= 0, stages, positions)
+            first, last = self.stage_range
+            positions = positions[(stages >= first) & (stages <= last)]
+        if self.time_window is not None:
+            times = np.array(index.column('time'), dtype=np.float64)
+            if np.isnan(times).all():
+                raise ValueError("Headers do not record simulation time, "
+                                 "use stage range instead")
+            start, end = self.time_window
+            times = times[positions]
+            positions = positions[(times >= start) & (times <= end)]
+        positions = positions[::self.stride]
+        if not len(positions):
+            raise ValueError("No frames left after selection")
+        return positions
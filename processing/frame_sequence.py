@@ -0,0 +1,150 @@
+import numpy as np
+from collections import OrderedDict
+from cython_modules.cython_parse import binary_data_layout
+from processing.read_plan import ReadPlan
+
+
+class FrameSequence:
+    """
+    Lazy, read-only sequence of vector frames backed by binary files.
+    Each frame is exposed through np.memmap so that only frames (and cells)
+    that are actually requested are read from disk. Behaves like
+    an array of shape (frames, N, 3) and dtype float32:
+        len(seq), seq[i], seq[i:j], seq[:, index_list, :], np.array(seq)
+    With a ReadPlan selection only the planned cells are exposed and read.
+    """
+    MAX_OPEN_MAPS = 64
+
+    def __init__(self, sources, cells, selection=None):
+        """
+        :param sources: list of (filename, data_offset, dtype) tuples,
+                        one per frame
+        :param cells: number of cells (vectors) in each file
+        :param selection: optional ReadPlan.selection() of cells to expose
+        """
+        self.sources = list(sources)
+        self.file_cells = int(cells)
+        self.selection = selection
+        self.cells = self.file_cells if selection is None else \
+                                        ReadPlan.selected_cells(selection)
+        self._maps = OrderedDict()
+
+    @staticmethod
+    def from_files(files, read_plan=None):
+        """
+        builds the sequence reading only headers of given files
+        :param files: list of binary .omf or .ovf filenames
+        :param read_plan: optional ReadPlan, cells outside are never read
+        :return FrameSequence, header of the first file (planned)
+        """
+        sources = []
+        first_header = None
+        cells = None
+        for filename in files:
+            header, offset, dtype = binary_data_layout(filename)
+            k = int(header['xnodes']*header['ynodes']*header['znodes'])
+            if first_header is None:
+                first_header = header
+                cells = k
+            elif k != cells:
+                raise ValueError("Inconsistent number of cells in {}".format(
+                                                                    filename))
+            sources.append((filename, offset, dtype))
+        if read_plan is None:
+            return FrameSequence(sources, cells), first_header
+        return FrameSequence(sources, cells,
+                             read_plan.selection(first_header)), \
+                    read_plan.header(first_header)
+
+    def extend(self, sources):
+        """
+        appends frames in place, e.g. files written by a running simulation
+        :param sources: list of (filename, data_offset, dtype) tuples
+        """
+        self.sources.extend(sources)
+
+    @property
+    def shape(self):
+        return (len(self.sources), self.cells, 3)
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float32)
+
+    @property
+    def ndim(self):
+        return 3
+
+    @property
+    def nbytes(self):
+        return len(self.sources)*self.cells*3*self.dtype.itemsize
+
+    def __len__(self):
+        return len(self.sources)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.frame(i)
+
+    def __getstate__(self):
+        # memory maps are not picklable, they are reopened lazily
+        state = self.__dict__.copy()
+        state['_maps'] = OrderedDict()
+        return state
+
+    def _map(self, i):
+        if i in self._maps:
+            self._maps.move_to_end(i)
+            return self._maps[i]
+        filename, offset, dtype = self.sources[i]
+        mapped = np.memmap(filename, dtype=dtype, mode='r', offset=offset,
+                           shape=(self.file_cells, 3))
+        self._maps[i] = mapped
+        # bound the number of open file mappings
+        while len(self._maps) > FrameSequence.MAX_OPEN_MAPS:
+            self._maps.popitem(last=False)
+        return mapped
+
+    def frame(self, i, cells=slice(None)):
+        """
+        reads a single frame
+        :param i: frame number
+        :param cells: optional cell selection (slice or index list)
+        :return float32 array of shape (N, 3) or (len(cells), 3)
+        """
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Frame {} out of range {}".format(i, len(self)))
+        # strided selection, only pages holding selected cells are read
+        selected = ReadPlan.select(self._map(i), self.selection)
+        return np.array(selected[cells], dtype=np.float32)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        frames, rest = key[0], key[1:]
+        cells = rest[0] if rest else slice(None)
+        components = rest[1:]
+        if isinstance(frames, (int, np.integer)):
+            output = self.frame(int(frames), cells)
+            return output[(slice(None), *components)] if components \
+                                                        else output
+        if isinstance(frames, slice) and not rest:
+            # slicing over frames stays lazy
+            return FrameSequence(self.sources[frames], self.file_cells,
+                                 self.selection)
+        frame_numbers = range(len(self))[frames] \
+                                if isinstance(frames, slice) else frames
+        output = np.array([self.frame(int(i), cells) for i in frame_numbers],
+                          dtype=np.float32)
+        return output[(slice(None), slice(None), *components)] \
+                                            if components else output
+
+    def __array__(self, dtype=None, copy=None):
+        output = np.empty(self.shape, dtype=np.float32)
+        for i in range(len(self)):
+            output[i] = ReadPlan.select(self._map(i), self.selection)
+        if dtype is not None:
+            output = output.astype(dtype, copy=False)
+        return output
@@ -0,0 +1,220 @@
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from processing.multiprocessing_parse import MultiprocessingParse
+from processing.directory_index import DirectoryIndex
+from processing.executor_service import ExecutorService
+from processing.frame_sequence import FrameSequence
+from processing.shared_frames import SharedFrames, decode_into_shared
+from processing.compressed_input import is_compressed, open_input, \
+                                        input_stat
+from processing.parse_cache import evict_cache
+
+
+class PlotTail:
+    """
+    Follows rows appended to a plot file (.odt or table.txt).
+    Only bytes past the last complete line seen are parsed.
+    """
+    def __init__(self, filename, plot_data):
+        self.filename = filename
+        self.columns = list(plot_data.columns)
+        self.separator = '\t' if filename.endswith('.txt') else r'\s+'
+        self.offset = self._complete_size(0)
+
+    def _complete_size(self, start):
+        """
+        :return offset just past the last newline in the file
+        """
+        with open(self.filename, 'rb') as f:
+            f.seek(start)
+            data = f.read()
+        end = data.rfind(b'\n')
+        return start if end < 0 else start + end + 1
+
+    def read_new_rows(self):
+        """
+        :return DataFrame of rows appended since last call, may be empty
+        """
+        size = os.path.getsize(self.filename)
+        if size < self.offset:
+            raise ValueError("{} was truncated".format(self.filename))
+        end = self._complete_size(self.offset)
+        if end == self.offset:
+            return pd.DataFrame(columns=self.columns, dtype=np.float64)
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offset)
+            chunk = f.read(end - self.offset).decode('utf-8')
+        self.offset = end
+        rows = pd.read_csv(io.StringIO(chunk), sep=self.separator,
+                           comment='#', header=None, names=self.columns,
+                           dtype=np.float64, engine='c',
+                           float_precision='round_trip')
+        return rows
+
+
+class LiveTail:
+    """
+    Watch mode of a directory loaded by StreamingLoader. Each poll()
+    picks up vector files and plot rows written since the previous one,
+    parses only these and extends the loader frame store, plot data and
+    trigger list. A file is taken only once it is completely written.
+    The directory is indexed again only if its mtime or the stat of the
+    file being written changed since the previous poll.
+    """
+    # text frames are kept in a shared block with room for growth
+    GROWTH = 2
+
+    def __init__(self, loader):
+        """
+        :param loader: finished StreamingLoader of a directory
+        """
+        if not isinstance(loader.index, DirectoryIndex) or \
+                                                        loader.index.archive:
+            raise ValueError("Only simulation directories can be watched")
+        if loader.frame_selection is not None and \
+                                        not loader.frame_selection.is_full:
+            raise ValueError("Watch mode requires all frames to be loaded")
+        self.loader = loader
+        self.plot_tail = None
+        if loader.index.plot_file is not None and \
+                loader.plot_data is not None and \
+                not is_compressed(loader.index.plot_file):
+            self.plot_tail = PlotTail(loader.index.plot_file,
+                                      loader.plot_data)
+        self.capacity = len(loader.color_vectors)
+        # (directory mtime, stat of the first incomplete file) seen by
+        # the last scan that left no complete file behind
+        self._stamp = None
+
+    @staticmethod
+    def file_complete(index, i, cells):
+        """
+        checks whether i-th file of the index has been written completely
+        """
+        path = index.files[i]
+        if is_compressed(path):
+            # truncated compressed stream fails to decompress
+            try:
+                with open_input(path) as f:
+                    while f.read(1 << 22):
+                        pass
+                return True
+            except (EOFError, OSError, ValueError):
+                return False
+        if str(index.column('encoding')[i]).startswith('Binary'):
+            itemsize = np.dtype(str(index.column('dtype')[i])).itemsize
+            return os.path.getsize(path) >= \
+                    int(index.column('data_offset')[i]) + 3*cells*itemsize
+        with open(path, 'rb') as f:
+            f.seek(max(0, os.path.getsize(path) - 256))
+            return b'End: Segment' in f.read()
+
+    def poll(self):
+        """
+        :return number of new frames, number of new plot rows
+        """
+        loader = self.loader
+        new_rows = 0
+        plot_data = loader.plot_data
+        if self.plot_tail is not None:
+            rows = self.plot_tail.read_new_rows()
+            new_rows = len(rows)
+            if new_rows:
+                plot_data = pd.concat([plot_data, rows], ignore_index=True)
+        stamp = self._directory_stamp()
+        rescanned = stamp is None or stamp != self._stamp
+        index = loader.index
+        if rescanned:
+            try:
+                index = DirectoryIndex(loader.directory)
+            except (ValueError, KeyError, OSError):
+                # header of a file being written could not be read yet
+                stamp = None
+        known = len(loader.index)
+        names = index.column('name')
+        if list(names[:known]) != list(loader.index.column('name')):
+            raise ValueError("Files of {} changed, reload the directory".format(
+                                                            loader.directory))
+        complete = known
+        cells = loader.index.cells
+        pending = None
+        while complete < len(index):
+            # stat is taken first, so that a write after the check is seen
+            pending = (index.files[complete],
+                       input_stat(index.files[complete]))
+            if not LiveTail.file_complete(index, complete, cells):
+                break
+            pending = None
+            complete += 1
+        index = index.subset(np.arange(complete))
+        try:
+            stages, trigger_list = MultiprocessingParse.align_plot_data(
+                                                            index, plot_data)
+        except ValueError:
+            stages, trigger_list = 0, []
+        if trigger_list is not None and len(trigger_list) < len(index):
+            # plot file lags behind vector files, frames wait for it
+            if len(trigger_list) >= known:
+                index = index.subset(np.arange(len(trigger_list)))
+            else:
+                index = loader.index
+            stages, trigger_list = MultiprocessingParse.align_plot_data(
+                                                            index, plot_data)
+        if rescanned:
+            if stamp is not None and len(index) == complete:
+                self._stamp = (stamp[0], pending)
+            else:
+                # complete files wait for plot rows, next poll scans again
+                self._stamp = None
+        new_frames = len(index) - known
+        if new_frames:
+            self._extend_frames(index, known)
+        loader.index = index
+        loader.plot_data = plot_data
+        loader.stages = stages
+        loader.trigger_list = trigger_list
+        loader.sizes = [int(size) for size in index.column('size')]
+        loader.bytes_total = loader.bytes_read = sum(loader.sizes)
+        loader.total = loader.loaded = len(index)
+        return new_frames, new_rows
+
+    def _directory_stamp(self):
+        """
+        :return directory mtime and the file being written with its stat,
+                equal to the last stamp if no file was added or written
+                since, None if it cannot be taken
+        """
+        pending = self._stamp[1] if self._stamp is not None else None
+        try:
+            if pending is not None:
+                pending = (pending[0], input_stat(pending[0]))
+            return (os.stat(self.loader.directory).st_mtime_ns, pending)
+        except OSError:
+            return None
+
+    def _extend_frames(self, index, known):
+        loader = self.loader
+        new_files = index.files[known:]
+        if isinstance(loader.color_vectors, FrameSequence):
+            loader.color_vectors.extend(index.frame_sources()[known:])
+            return
+        needed = len(index)
+        if needed > self.capacity:
+            # grow geometrically so that copying is amortized
+            self.capacity = max(needed, LiveTail.GROWTH*self.capacity)
+            block, frames = SharedFrames.allocate(self.capacity,
+                                                  loader.color_vectors.shape[1])
+            frames[:known] = loader.color_vectors[:known]
+            old_block = loader._block
+            loader._block, loader.color_vectors = block, frames
+            SharedFrames.release(old_block)
+        ExecutorService.map(decode_into_shared,
+                            [(known + i, filename)
+                             for i, filename in enumerate(new_files)],
+                            (loader._block.name, loader.color_vectors.shape,
+                             index.is_binary, loader.selection))
+        evict_cache()
@@ -1,37 +1,20 @@
 import numpy as np
 import os
 import glob
-from multiprocessing import Pool
 from cython_modules.cython_parse import *
-from binaryornot.check import is_binary
+from processing.frame_sequence import FrameSequence
+from processing.directory_index import DirectoryIndex
+from processing.executor_service import ExecutorService
+from processing.shared_frames import SharedFrames, decode_into_shared
+from processing.read_plan import ReadPlan
+from processing.vism_archive import VismArchive
+from processing.parse_cache import cached_getPlotData, evict_cache
+from processing.trigger_alignment import TriggerAlignment
 import re
 
-def asynchronous_pool_order(func, args, object_list, timeout=20):
-    """
-    This function parallelizes by multiprocessing a given function.
-    It operates by iterating a list - object_list and passes each object
-    to a new process of function along with additional args with args
-    :param func: function that is to be multiprocessed
-    :param args: are the additional parameters to the functions (non-iterative)
-    if none pass () - an empty tuple
-    :param object_list: is the objects that are iterated
-    :param timeout: is the timeout for getting value in multiprocessing
-    """
-    pool = Pool()
-    output_list = []
-    multiple_results = [pool.apply_async(func, (object_list[i], *args))
-                        for i in range(len(object_list))]
-    for result in multiple_results:
-        try:
-            output_list.append(result.get(timeout=timeout))
-        except TimeoutError:
-            print("Function {}: timeout {}".format(func.__name__,
-                                                        timeout))
-    return output_list
-
 class MultiprocessingParse:
     @staticmethod
-    def compose_trigger_list(files, plot_data):
+    def compose_trigger_list(files, plot_data, index=None):
         """
         Creates a trigger list.
         Because the number of entries in plot data file is not always (or rarely)
@@ -39,145 +22,181 @@ class MultiprocessingParse:
         Thus, for each file, there are multiple plot datapoints assigned.
         How many and when the change will be activated is dependent on
         the trigger list
+        :param index: optional DirectoryIndex, if given iteration numbers
+                      are taken from it instead of matching filenames
         """
         if files[0].endswith('.ovf'):
-            file_len = len(files)
-            return MultiprocessingParse.mumax_trigger_list(file_len, plot_data)
+            return TriggerAlignment.align(plot_data, index, mumax=True,
+                                          frames=len(files))[0]
+        try:
+            return TriggerAlignment.align(plot_data, index)[0]
+        except ValueError:
+            pass
         # TODO: FIND A DRIVER NAMES AND IMPLEMENT THEM IF THERE ARE OTHERS
-        driver_class = 'MinDriver'
-        match_string = '(^.*)(Oxs_' + driver_class + \
-                            '-Magnetization-)([0-9]{2})(-)(.*)(.omf)'
-        regex = re.compile(match_string)
+        for driver_class in ('MinDriver', 'TimeDriver'):
+            regex = re.compile('(^.*)(Oxs_' + driver_class +
+                               '-Magnetization-)([0-9]{2})(-)(.*)(.omf)')
+            if regex.search(os.path.basename(files[0])) is not None:
+                break
+        column_name = 'Oxs_' + driver_class + '::Iteration'
         st = []
-        # probe file
-        filename = files[0]
-        column_name = None
-        try:
-            m = regex.search(os.path.basename(filename))
-            if m is None:
-                raise AttributeError
-            column_name = 'Oxs_' + driver_class +'::Iteration'
-        except AttributeError:
-            driver_class = 'TimeDriver'
-            match_string = '(^.*)(Oxs_' + driver_class + \
-                                '-Magnetization-)([0-9]{2})(-)(.*)(.omf)'
-            column_name = 'Oxs_' + driver_class +'::Iteration'
-            regex = re.compile(match_string)
         for filename in files:
             m = regex.search(os.path.basename(filename))
             if m is not None:
                 st.append(int(m.groups()[4]))
             else:
                 print("Regex trigger list mismatch {}".format(filename))
-        trigger_list = plot_data.index[plot_data[column_name].isin(st)]
-        try:
-            assert len(files) == len(trigger_list)
-        except AssertionError:
-            # duplicates appeared, take first and drop rest
-            unique_stages = plot_data[column_name][~plot_data[column_name]\
-                                                    .duplicated(keep='first')]
-            trigger_list = unique_stages.index[unique_stages.isin(st)]
-        return trigger_list
+        return MultiprocessingParse.match_iterations(plot_data, column_name,
+                                                     st, len(files))
+
+    @staticmethod
+    def match_iterations(plot_data, column_name, st, file_len):
+        """
+        finds plot data rows of iterations at which the files were saved,
+        first row is taken if an iteration is duplicated
+        """
+        return TriggerAlignment.align(plot_data,
+                                      iterations=(column_name, st),
+                                      frames=file_len)[0]
 
     @staticmethod
     def mumax_trigger_list(file_len, pl_data):
         print("Warning: Mumax format is not fully supported, see documention" + \
                 " on how it is currently handled/implemented")
-        time_col = '# t (s)'
-        # time interval per .ovf file
-        time_interval = np.max(pl_data[time_col])/file_len
-        times_list = [time_interval*i for i in range(file_len)]
-        trigger_list = []
-        for time in times_list:
-            # matches closest time
-            trigger_list.append(pl_data[time_col]\
-                    .index[(pl_data[time_col]-time).abs().argsort()[0]])
-        return trigger_list
+        return TriggerAlignment.align(pl_data, mumax=True,
+                                      frames=file_len)[0]
 
     @staticmethod
     def guess_file_type(directory):
-        supported_extensions = [('.omf', '*.odt'), ('.ovf', 'table.txt')]
-        voted_extension = None
-        files_in_directory = os.listdir(directory)
-        # NOTE: decide what extension is found in directory
-        # could be both .omf or .ovf but not mixed
-        # omit .odt files if not really specified
-        for filename in files_in_directory:
-            for file_ext in supported_extensions:
-                if filename.endswith(file_ext[0]):
-                    voted_extension = file_ext
-                    break
-            if voted_extension is not None:
-                break
-
-        # loop may end and the value may still be None,
-        # this means invalid directory
-        # tbh I am not sure but it helps fix issue
-        if voted_extension is None:
-            raise ValueError("Invalid Directory")
-        print("SUPPORTED EXTENSION DETECTED {}".format(voted_extension))
-        files_in_directory = [os.path.join(directory, filename)
-                              for filename in files_in_directory
-                              if filename.endswith(voted_extension[0])]
-        files_in_directory = sorted(files_in_directory)
-        return files_in_directory, voted_extension
+        """
+        :return sorted vector files in directory and a tuple of
+                (vector extension, plot file pattern)
+        """
+        index = DirectoryIndex(directory)
+        print("SUPPORTED EXTENSION DETECTED {}".format(index.extension))
+        return index.files, index.extension
 
     @staticmethod
-    def readFile(path):
+    def readFile(path, read_plan=None):
         """
         Function loads one selected file.
         :param path: path to file which user wants to load (String)
+        :param read_plan: optional ReadPlan limiting cells that are read
         :return: depends on filetype:
             if .odt - odt_data, stages
             if .omf || .ovf - rawVectorData, header
         """
         if ".odt" in path or ".txt" in path:
-            odt_data, stages = getPlotData(path)
+            odt_data, stages = cached_getPlotData(path)
             return odt_data, stages
 
         elif ".omf" in path or ".ovf" in path:
             rawVectorData = None
-            if is_binary(path):
-                headers, rawVectorData = MultiprocessingParse.readBinary([path])
-                header = headers[0]
-            elif not is_binary(path):
-                rawVectorData = MultiprocessingParse.readText([path])
-                header = getFileHeader(path)
+            row, header = DirectoryIndex.file_entry(path)
+            if row['encoding'].startswith('Binary'):
+                _, rawVectorData = MultiprocessingParse.readBinary([path],
+                                                        read_plan, header)
             else:
-                raise RuntimeError("multiprocessing_parse.py readFile:" +\
-                                                    " Can't detect encoding!")
+                rawVectorData = MultiprocessingParse.readText([path],
+                                                        read_plan, header)
+            if read_plan is not None:
+                header = read_plan.header(header)
             return rawVectorData, header
         else:
             raise ValueError("Invalid file! Must have .odt, .omf " + \
                                                         "or .ovf extension!")
 
     @staticmethod
-    def readFolder(directory, multipleFileHeaders=False):
+    def readFolder(directory, multipleFileHeaders=False, read_plan=None,
+                   frame_selection=None):
         """
         dumps process-ready format from directory
-        Returns raw numpy array of vectors, file_header_files and odt data for
-        2d plotting
-        :param directory
+        Returns vectors, file_header_files and odt data for 2d plotting.
+        Directory is scanned once by DirectoryIndex, binary files are not
+        read here, vectors are returned as a lazy FrameSequence that maps
+        each file on demand
+        :param directory: directory or VISM archive (.vism) file
+        :param read_plan: optional ReadPlan, only planned cells are read
+                          and the returned header describes them
+        :param frame_selection: optional FrameSelection, only selected
+                                files are read
         :return rawVectorData, file_headers, getPlotData
         """
+        index, header, plot_data, stages, trigger_list = \
+                            MultiprocessingParse.readFolderMetadata(directory,
+                                                            frame_selection)
+        if isinstance(index, VismArchive):
+            # frames are decompressed lazily, in workers when materialized
+            rawVectorData = index.select_cells(
+                        MultiprocessingParse.selection(read_plan, header))
+        elif not index.is_binary:
+            rawVectorData = MultiprocessingParse.readText(index.files,
+                                                          read_plan, header)
+        elif index.is_compressed:
+            # compressed files cannot be mapped, workers decompress them
+            _, rawVectorData = MultiprocessingParse.readBinary(index.files,
+                                                               read_plan,
+                                                               header)
+        else:
+            rawVectorData = FrameSequence(index.frame_sources(), index.cells,
+                                          MultiprocessingParse.selection(
+                                                        read_plan, header))
+        if read_plan is not None:
+            header = read_plan.header(header)
+        return rawVectorData, header, plot_data, stages, trigger_list
 
-        files_in_directory, ext = MultiprocessingParse.guess_file_type(
-                                                                    directory)
-        test_file = os.path.join(directory, files_in_directory[0])
+    @staticmethod
+    def selection(read_plan, header):
+        return read_plan.selection(header) if read_plan is not None else None
 
+    @staticmethod
+    def readFolderMetadata(directory, frame_selection=None):
+        """
+        everything readFolder returns but the vectors themselves
+        :param directory
+        :param frame_selection: optional FrameSelection, trigger list
+                                and stages are computed for the whole
+                                directory and then reduced to selected files
+        :return DirectoryIndex (of selected files), file_header, plot_data,
+                stages, trigger_list
+                for a VISM archive the archive takes place of the index
+        """
+        if VismArchive.is_archive(directory):
+            archive = VismArchive(directory)
+            return MultiprocessingParse.select_frames(archive, archive.header,
+                                                      archive.plot_data,
+                                                      archive.stages,
+                                                      archive.trigger_list,
+                                                      frame_selection)
+        index = DirectoryIndex(directory)
+        plot_data = None
+        if index.plot_file is not None:
+            plot_data, _ = cached_getPlotData(index.plot_file)
+        stages, trigger_list = MultiprocessingParse.align_plot_data(index,
+                                                                plot_data)
+
+        header = index.header
+        if not header:
+            raise ValueError("no .omf or .ovf file has been found")
+        return MultiprocessingParse.select_frames(index, header, plot_data,
+                                                  stages, trigger_list,
+                                                  frame_selection)
+
+    @staticmethod
+    def align_plot_data(index, plot_data):
+        """
+        matches plot data rows to indexed vector files
+        :param index: DirectoryIndex
+        :param plot_data: DataFrame or None
+        :return stages, trigger_list (None if rows match files one to one)
+        """
+        files_in_directory = index.files
         stages = len(files_in_directory)
-        plot_file = glob.glob(os.path.join(directory, ext[1]))
-        # look for .odt  or .txt in current directory
-        if len(plot_file) > 1:
-            raise ValueError("plot file extension conflict (too many)")
-        elif not plot_file or plot_file is None:
-            plot_data = None
-            plot_file = None
 
         # NOTE: this should recognize both .omf and .ovf files
         trigger_list = None
-        if plot_file is not None:
-            plot_data, stages0 = getPlotData(plot_file[0])
+        if plot_data is not None:
+            stages0 = len(plot_data)
             print(stages0, stages)
             if stages0 != stages:
                 if stages0 > stages:
@@ -192,7 +211,8 @@ class MultiprocessingParse:
                     """
                     trigger_list = MultiprocessingParse.\
                                         compose_trigger_list(files_in_directory,
-                                                                    plot_data)
+                                                             plot_data,
+                                                             index=index)
                     stages = len(trigger_list)
                 elif stages0 < stages:
                     """
@@ -200,40 +220,40 @@ class MultiprocessingParse:
                     video frames per one data plot
                     """
                     raise ValueError("Odt cannot have fewer stages that files")
-        else:
-            plot_data = None
+        return stages, trigger_list
 
-        if not is_binary(test_file):
-            rawVectorData = MultiprocessingParse.readText(files_in_directory)
-            file_for_header = glob.glob(os.path.join(directory, '*' + ext[0]))
-            # virtually any will do
-            if not file_for_header:
-                raise ValueError("no .omf  or .ovf file has been found")
-            header = getFileHeader(file_for_header[0])
-        else:
-            headers, rawVectorData = MultiprocessingParse.readBinary(
-                                                        files_in_directory)
-            header = headers[0]
-            if not header:
-                raise ValueError("no .omf or .ovf file has been found")
-        return rawVectorData, header, plot_data, stages, trigger_list
+    @staticmethod
+    def select_frames(index, header, plot_data, stages, trigger_list,
+                      frame_selection):
+        """
+        reduces index (DirectoryIndex or VismArchive), stages and trigger
+        list to the frames picked by frame_selection
+        """
+        if frame_selection is not None and not frame_selection.is_full:
+            positions = frame_selection.positions(index)
+            if trigger_list is not None:
+                trigger_list = [trigger_list[i] for i in positions]
+            elif plot_data is not None:
+                # plot rows matched files one to one
+                trigger_list = [plot_data.index[i] for i in positions]
+            index = index.subset(positions)
+            stages = len(positions)
+        return index, header, plot_data, stages, trigger_list
 
     @staticmethod
-    def readBinary(files_in_directory):
+    def readBinary(files_in_directory, read_plan=None, header=None):
         """
         :param files_in_directory: is a list of binary filenames
                                    in a directory
-        :return numpy array of vectors form .omf files
+        :param read_plan: optional ReadPlan, files are read with strides
+        :param header: header of the files, e.g. from DirectoryIndex
+        :return list of headers, numpy array of vectors form .omf files
+                 the array is a view of a shared memory block
         """
-        output = asynchronous_pool_order(binary_format_reader, (),
-                                                        files_in_directory,
-                                                        timeout=20)
-        output = np.array(output)
-        headers = output[:, 0]
-        rawVectorData = output[:, 1]
-        # test this solution, turn dtype object to float64
-        rawVectorData = np.array([x for x in rawVectorData], dtype=np.float32)
-
+        headers, rawVectorData = MultiprocessingParse.read_into_shared(
+                                                files_in_directory, binary=True,
+                                                read_plan=read_plan,
+                                                header=header)
         if rawVectorData is None or headers is None:
             raise TypeError("\nNo vectors created")
 
@@ -241,18 +261,54 @@ class MultiprocessingParse:
         return headers, rawVectorData
 
     @staticmethod
-    def readText(files_in_directory):
+    def readText(files_in_directory, read_plan=None, header=None):
         """
         :param files_in_directory: is a list of text filenames in a directory
+        :param read_plan: optional ReadPlan, only planned cells are kept
+        :param header: header of the files, e.g. from DirectoryIndex
         :return numpy array of vectors form .omf files
+                 the array is a view of a shared memory block
         """
-        # use multiprocessing
-        rawVectorData = []
-        rawVectorData = asynchronous_pool_order(getRawVectors, (),
-                                                        files_in_directory,
-                                                        timeout=20)
-        if not rawVectorData:
+        if not files_in_directory:
             raise TypeError("\nNo vectors created")
-        rawVectorData = np.array(rawVectorData, dtype=np.float32)
+        _, rawVectorData = MultiprocessingParse.read_into_shared(
+                                            files_in_directory, binary=False,
+                                            read_plan=read_plan,
+                                            header=header)
         assert rawVectorData.dtype == np.float32
         return rawVectorData
+
+    @staticmethod
+    def read_into_shared(files_in_directory, binary, read_plan=None,
+                         header=None):
+        """
+        workers decode files directly into a preallocated shared memory
+        block, only headers are sent back through the pool
+        :param files_in_directory: list of vector files of the same size
+        :param binary: True if files are binary
+        :param read_plan: optional ReadPlan, only planned cells are stored
+        :param header: header of the files, the first file is read
+                       if it is not given
+        :return list of headers, array of shape (frames, N, 3)
+        """
+        if header is None:
+            header = read_vector_header(files_in_directory[0])[0]
+        selection = MultiprocessingParse.selection(read_plan, header)
+        if selection is None:
+            cells = int(header['xnodes']*header['ynodes']*header['znodes'])
+        else:
+            cells = ReadPlan.selected_cells(selection)
+        block, rawVectorData = SharedFrames.allocate(len(files_in_directory),
+                                                     cells)
+        try:
+            headers = ExecutorService.map(decode_into_shared,
+                                          list(enumerate(files_in_directory)),
+                                          (block.name, rawVectorData.shape,
+                                           binary, selection))
+        except BaseException:
+            del rawVectorData
+            SharedFrames.release(block)
+            raise
+        # workers only store, the cache is trimmed once per load
+        evict_cache()
+        return headers, rawVectorData
@@ -0,0 +1,221 @@
+import os
+import json
+import hashlib
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from cython_modules.cython_parse import binary_format_reader, \
+                                        getRawVectors, getPlotData, \
+                                        getFileHeader
+from processing.compressed_input import split_member, member_path, \
+                                        input_stat
+
+
+class ParseCache:
+    """
+    Persistent on-disk cache of parsed simulation files.
+    Each entry is a .npy file with decoded data plus a .json sidecar
+    with headers and metadata. Entries are keyed by path, size and
+    modification time (in ns) of the source file, so a modified file gets
+    a new key and is never served from cache, a hit does not read
+    the source at all. Stores do not evict, evict() is called once
+    a load is done.
+    Configuration (also visible to worker processes):
+        VISM_CACHE_DIR - cache directory
+        VISM_CACHE_SIZE - maximum cache size in megabytes
+        VISM_CACHE - set to 0 to disable caching
+    """
+    CACHE_DIR = os.environ.get('VISM_CACHE_DIR',
+                               os.path.join(os.path.expanduser('~'),
+                                            '.vism_cache'))
+    MAX_SIZE = int(float(os.environ.get('VISM_CACHE_SIZE', 4096))*1024**2)
+    ENABLED = os.environ.get('VISM_CACHE', '1') != '0'
+
+    def __init__(self, cache_dir=None, max_size=None):
+        self.cache_dir = cache_dir if cache_dir is not None \
+                                            else ParseCache.CACHE_DIR
+        self.max_size = max_size if max_size is not None \
+                                            else ParseCache.MAX_SIZE
+
+    @staticmethod
+    def source(filename):
+        """
+        :return absolute path of a file or an archive member
+        """
+        archive, member = split_member(filename)
+        if member is None:
+            return os.path.abspath(filename)
+        return member_path(os.path.abspath(archive), member)
+
+    @staticmethod
+    def file_key(filename, kind):
+        """
+        :param filename: source file path
+        :param kind: type of parsed content, e.g. 'vectors' or 'table'
+        :return key identifying a file by its path, size and mtime
+        """
+        size, mtime_ns = input_stat(filename)
+        identity = "{}|{}|{}|{}".format(kind, ParseCache.source(filename),
+                                        size, mtime_ns)
+        return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+    def _entry_paths(self, key):
+        return (os.path.join(self.cache_dir, key + '.npy'),
+                os.path.join(self.cache_dir, key + '.json'))
+
+    def lookup(self, filename, kind):
+        """
+        :return (data path, sidecar dictionary) or None if there is no
+                valid entry
+        """
+        if not ParseCache.ENABLED:
+            return None
+        try:
+            data_path, meta_path = self._entry_paths(
+                                    ParseCache.file_key(filename, kind))
+            if not (os.path.isfile(data_path) and os.path.isfile(meta_path)):
+                return None
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            # touch the entry, eviction removes least recently used first
+            os.utime(meta_path)
+            return data_path, meta
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def load(self, filename, kind):
+        """
+        :return (data array, sidecar dictionary) or None if there is no
+                valid entry, e.g. it was evicted after lookup
+        """
+        entry = self.lookup(filename, kind)
+        if entry is None:
+            return None
+        data_path, meta = entry
+        try:
+            return np.load(data_path), meta
+        except (OSError, ValueError):
+            return None
+
+    def store(self, filename, kind, data, meta):
+        """
+        stores data array and sidecar metadata for a given file
+        write is atomic so concurrent workers never see partial entries
+        """
+        if not ParseCache.ENABLED:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            data_path, meta_path = self._entry_paths(
+                                    ParseCache.file_key(filename, kind))
+            meta = dict(meta)
+            meta['source'] = ParseCache.source(filename)
+            self._atomic_write(data_path, lambda f: np.save(f, data))
+            self._atomic_write(meta_path,
+                               lambda f: f.write(json.dumps(meta).encode()))
+        except OSError as e:
+            print("Parse cache write failed for {}: {}".format(filename, e))
+
+    def _atomic_write(self, path, writer):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                writer(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def evict(self):
+        """
+        removes least recently used entries until cache fits in max_size
+        scans the whole cache directory, so it is called once per load
+        rather than after each store
+        """
+        if not ParseCache.ENABLED or not os.path.isdir(self.cache_dir):
+            return
+        entries = {}
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            key, ext = os.path.splitext(entry.name)
+            if ext not in ('.npy', '.json'):
+                continue
+            stat = entry.stat()
+            size, last_used = entries.get(key, (0, 0))
+            if ext == '.json':
+                last_used = stat.st_mtime
+            entries[key] = (size + stat.st_size, last_used)
+            total += stat.st_size
+        for key, (size, _) in sorted(entries.items(),
+                                     key=lambda item: item[1][1]):
+            if total <= self.max_size:
+                break
+            for path in self._entry_paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+    def clear(self):
+        if os.path.isdir(self.cache_dir):
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(('.npy', '.json', '.tmp')):
+                    os.remove(entry.path)
+
+
+"""
+cached counterparts of parsing functions, these are module level
+so that they can be sent to the pool workers
+"""
+def cached_binary_format_reader(filename):
+    cache = ParseCache()
+    entry = cache.load(filename, 'vectors')
+    if entry is not None:
+        rawVectorData, meta = entry
+        return meta['header'], rawVectorData
+    header, rawVectorData = binary_format_reader(filename)
+    cache.store(filename, 'vectors', rawVectorData, {'header': header})
+    return header, rawVectorData
+
+
+def cached_getRawVectors(filename):
+    cache = ParseCache()
+    entry = cache.load(filename, 'vectors')
+    if entry is not None:
+        return entry[0]
+    rawVectorData = np.asarray(getRawVectors(filename), dtype=np.float32)
+    cache.store(filename, 'vectors', rawVectorData,
+                {'header': getFileHeader(filename)})
+    return rawVectorData
+
+
+def cached_getPlotData(filename, columns=None):
+    """
+    full table is cached, columns are selected from the cached table
+    """
+    cache = ParseCache()
+    entry = cache.load(filename, 'table')
+    if entry is not None:
+        table, meta = entry
+        df = pd.DataFrame(table, columns=meta['columns'])
+        stages = meta['stages']
+    else:
+        df, stages = getPlotData(filename)
+        numeric = all(np.issubdtype(dtype, np.number) for dtype in df.dtypes)
+        if numeric:
+            cache.store(filename, 'table', df.to_numpy(dtype=np.float64),
+                        {'columns': list(df.columns), 'stages': int(stages)})
+    if columns is not None:
+        df = df[list(columns)]
+    return df, stages
+
+
+def evict_cache():
+    """
+    trims the cache to its size limit, called when a load is done
+    """
+    ParseCache().evict()
@@ -0,0 +1,144 @@
+import numpy as np
+
+
+class ReadPlan:
+    """
+    Describes which cells of each vector file are read:
+        layer - single z layer or None for all layers
+        stride - take every n-th cell, int or (x, y, z) tuple
+        box - sub-box ((x0, x1), (y0, y1), (z0, z1)) in cells, end exclusive,
+              None in place of a range or a bound means the whole extent
+    Cells are kept in file order (x fastest, then y, then z), so a planned
+    frame is an ordinary frame of a smaller mesh described by header().
+    """
+    def __init__(self, layer=None, stride=1, box=None):
+        self.layer = layer
+        if isinstance(stride, int):
+            stride = (stride, stride, stride)
+        if len(stride) != 3 or min(stride) < 1:
+            raise ValueError("Stride must be a positive int or a 3-tuple")
+        self.stride = tuple(int(s) for s in stride)
+        self.box = box if box is not None else (None, None, None)
+        if len(self.box) != 3:
+            raise ValueError("Box must have x, y and z ranges")
+
+    @staticmethod
+    def from_options(subsampling=1, layer='all'):
+        """
+        plan equivalent to widget subsampling and layer options
+        """
+        return ReadPlan(layer=layer if type(layer) == int else None,
+                        stride=max(1, int(subsampling)))
+
+    @staticmethod
+    def from_string(text):
+        """
+        parses cell keys of the text typed in the directory dialog, e.g.
+            layer=2, subsampling=4, stages=200..400
+        :return ReadPlan or None if there are no cell keys,
+                text of the remaining keys
+        """
+        options = {}
+        rest = []
+        for part in text.split(','):
+            key, _, value = (item.strip() for item in part.partition('='))
+            if key == 'layer':
+                options['layer'] = int(value)
+            elif key == 'subsampling':
+                options['subsampling'] = int(value)
+            elif part.strip():
+                rest.append(part.strip())
+        plan = ReadPlan.from_options(**options) if options else None
+        return plan, ', '.join(rest)
+
+    def remaining(self, subsampling=1, layer='all'):
+        """
+        widget options are given for the whole mesh, frames read with
+        the plan are already reduced
+        :return subsampling and layer left to apply to planned frames
+        """
+        # widget subsampling is the same in x, y and z
+        subsampling = max(1, int(subsampling)//self.stride[0])
+        if self.layer is not None:
+            # the only layer read
+            layer = 0
+        return subsampling, layer
+
+    @property
+    def is_full(self):
+        return self.layer is None and self.stride == (1, 1, 1) and \
+                    all(extent is None for extent in self.box)
+
+    @staticmethod
+    def grid_shape(header):
+        return (int(header['znodes']), int(header['ynodes']),
+                int(header['xnodes']))
+
+    def slices(self, header):
+        """
+        :return (z, y, x) slices of the mesh grid
+        """
+        zc, yc, xc = ReadPlan.grid_shape(header)
+        output = []
+        for nodes, extent, step in zip((xc, yc, zc), self.box, self.stride):
+            start, stop = extent if extent is not None else (None, None)
+            start, stop, _ = slice(start, stop).indices(nodes)
+            if start >= stop:
+                raise ValueError("Empty read box {}".format(self.box))
+            output.append(slice(start, stop, step))
+        if self.layer is not None:
+            z = output[2]
+            if not z.start <= self.layer < z.stop:
+                raise ValueError("Layer {} out of range {}-{}".format(
+                                                self.layer, z.start, z.stop))
+            output[2] = slice(self.layer, self.layer + 1, 1)
+        return tuple(reversed(output))
+
+    def selection(self, header):
+        """
+        compact, picklable description of the plan for a given mesh,
+        used by FrameSequence and parse workers, None if plan is full
+        """
+        if self.is_full:
+            return None
+        return ReadPlan.grid_shape(header), self.slices(header)
+
+    @staticmethod
+    def select(frame, selection):
+        """
+        :param frame: array of shape (N, 3) in file order
+        :param selection: as returned from selection()
+        :return selected cells of shape (M, 3), a view if possible
+        """
+        if selection is None:
+            return frame
+        grid, slices = selection
+        return frame.reshape(*grid, 3)[slices].reshape(-1, 3)
+
+    @staticmethod
+    def selected_cells(selection):
+        grid, slices = selection
+        return int(np.prod([len(range(*s.indices(n)))
+                            for s, n in zip(slices, grid)]))
+
+    def cell_index(self, header):
+        """
+        :return flat indices of selected cells in file order
+        """
+        zc, yc, xc = ReadPlan.grid_shape(header)
+        index = np.arange(zc*yc*xc).reshape(zc, yc, xc)
+        return index[self.slices(header)].ravel()
+
+    def header(self, header):
+        """
+        :return header of the mesh made of the selected cells
+        """
+        planned = dict(header)
+        for axis, s in zip('zyx', self.slices(header)):
+            planned[axis + 'nodes'] = float(len(range(s.start, s.stop,
+                                                      s.step)))
+            # outlines are spaced by base, strided cells are further apart
+            for key in (axis + 'base', axis + 'stepsize'):
+                if key in planned:
+                    planned[key] = float(planned[key])*s.step
+        return planned
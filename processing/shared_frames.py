@@ -0,0 +1,147 @@
+import atexit
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from cython_modules.cython_parse import binary_data_layout
+from processing.parse_cache import cached_binary_format_reader, \
+                                   cached_getRawVectors
+from processing.read_plan import ReadPlan
+from processing.compressed_input import is_compressed
+
+
+def attach_shared(name):
+    """
+    attaches to an existing block without registering it with the
+    resource tracker of the calling process, the owner is responsible
+    for unlinking
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # track parameter is available since python 3.13
+        return shared_memory.SharedMemory(name=name)
+
+
+def decode_into_shared(frame, name, shape, binary, selection=None):
+    """
+    worker side - decodes a single vector file straight into
+    a frame of the shared block, only the header is sent back
+    :param frame: (frame number in the shared block, vector file) pair
+    :param name: name of the shared memory block
+    :param shape: shape of the whole block (frames, N, 3)
+    :param binary: True for binary files, False for text files
+    :param selection: optional ReadPlan.selection(), only these cells
+                      are stored, binary files are read with strides
+    :return file header for binary files, None otherwise
+    """
+    index, filename = frame
+    block = attach_shared(name)
+    try:
+        frames = np.ndarray(shape, dtype=np.float32, buffer=block.buf)
+        if binary and selection is not None and not is_compressed(filename):
+            header, offset, dtype = binary_data_layout(filename)
+            vectors = np.memmap(filename, dtype=dtype, mode='r',
+                                offset=offset,
+                                shape=(int(np.prod(selection[0])), 3))
+        elif binary:
+            header, vectors = cached_binary_format_reader(filename)
+        else:
+            header, vectors = None, cached_getRawVectors(filename)
+        if selection is not None:
+            if vectors.shape[0] != np.prod(selection[0]):
+                raise ValueError("Inconsistent number of cells in {}".format(
+                                                                    filename))
+            vectors = ReadPlan.select(vectors, selection)
+        if vectors.shape != shape[1:]:
+            raise ValueError("Inconsistent number of cells in {}".format(
+                                                                    filename))
+        frames[index] = vectors
+        del frames, vectors
+    finally:
+        block.close()
+    return header
+
+
+class SharedFrames:
+    """
+    Registry of shared memory blocks holding decoded vector frames.
+    Parse workers write frames in place and the GUI process works on
+    a zero-copy view of the block. Blocks stay alive until released,
+    when a new load or a grown block replaces them or loaded files
+    are deleted.
+    """
+    _blocks = []
+    # unlinked blocks whose views were still referenced on release
+    _unclosed = []
+    _lock = threading.Lock()
+
+    @staticmethod
+    def allocate(frames, cells):
+        """
+        :return (shared memory block, float32 view of shape (frames, cells, 3))
+        """
+        shape = (frames, cells, 3)
+        size = max(1, int(np.prod(shape))*np.dtype(np.float32).itemsize)
+        block = shared_memory.SharedMemory(create=True, size=size)
+        with SharedFrames._lock:
+            SharedFrames._blocks.append(block)
+        # frombuffer holds the buffer export for as long as any view of
+        # the block lives, so that closing the block fails instead of
+        # unmapping memory under the views
+        frames = np.frombuffer(block.buf, dtype=np.float32,
+                               count=int(np.prod(shape))).reshape(shape)
+        return block, frames
+
+    @staticmethod
+    def release(block):
+        """
+        unlinks the block, memory is returned to the system once
+        the last view of it is gone
+        """
+        with SharedFrames._lock:
+            if block in SharedFrames._blocks:
+                SharedFrames._blocks.remove(block)
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+        SharedFrames._close(block)
+
+    @staticmethod
+    def _close(block):
+        try:
+            block.close()
+        except BufferError:
+            # views are still referenced, closing is retried later
+            with SharedFrames._lock:
+                if block not in SharedFrames._unclosed:
+                    SharedFrames._unclosed.append(block)
+            return False
+        with SharedFrames._lock:
+            if block in SharedFrames._unclosed:
+                SharedFrames._unclosed.remove(block)
+        return True
+
+    @staticmethod
+    def collect():
+        """
+        closes released blocks whose views were dropped since,
+        their memory is returned to the system
+        """
+        with SharedFrames._lock:
+            unclosed = list(SharedFrames._unclosed)
+        for block in unclosed:
+            SharedFrames._close(block)
+
+    @staticmethod
+    def release_all():
+        with SharedFrames._lock:
+            blocks = list(SharedFrames._blocks)
+        for block in blocks:
+            SharedFrames.release(block)
+        SharedFrames.collect()
+
+
+atexit.register(SharedFrames.release_all)
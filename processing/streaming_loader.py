@@ -0,0 +1,159 @@
+import time
+import threading
+
+from processing.multiprocessing_parse import MultiprocessingParse
+from processing.executor_service import ExecutorService
+from processing.frame_sequence import FrameSequence
+from processing.shared_frames import SharedFrames, decode_into_shared
+from processing.read_plan import ReadPlan
+from processing.vism_archive import VismArchive
+from processing.parse_cache import evict_cache
+
+
+class StreamingLoader:
+    """
+    Loads a simulation directory frame by frame, in order.
+    Metadata (header, plot data, trigger list) is available right after
+    construction, vectors become available as they decode, so that widgets
+    can be built on the first frame and played over the loaded prefix:
+        loader = StreamingLoader(directory)
+        loader.run(progress_callback)   # usually in a worker thread
+        loader.loaded_vectors()         # frames decoded so far
+    Binary directories are mapped lazily by FrameSequence and VISM archives
+    are decompressed on demand, both are complete at once. Text and
+    compressed directories are decoded into a shared memory block.
+    """
+    def __init__(self, directory, read_plan=None, frame_selection=None):
+        """
+        :param directory: simulation output directory
+        :param read_plan: optional ReadPlan, only planned cells are read
+        :param frame_selection: optional FrameSelection, only selected
+                                files are read
+        """
+        self.directory = directory
+        self.frame_selection = frame_selection
+        self.index, self.header, self.plot_data, self.stages, \
+            self.trigger_list = MultiprocessingParse.readFolderMetadata(
+                                                directory, frame_selection)
+        self.selection = MultiprocessingParse.selection(read_plan,
+                                                        self.header)
+        if read_plan is not None:
+            self.header = read_plan.header(self.header)
+        cells = self.index.cells if self.selection is None else \
+                                    ReadPlan.selected_cells(self.selection)
+        self.total = len(self.index)
+        self.sizes = [int(size) for size in self.index.column('size')]
+        self.bytes_total = sum(self.sizes)
+        self.loaded = 0
+        self.bytes_read = 0
+        self.cancelled = False
+        self._block = None
+        # block is freed by run() if released while frames decode
+        self._running = False
+        self._released = False
+        self._lock = threading.Lock()
+        self.lazy = isinstance(self.index, VismArchive) or \
+                        (self.index.is_binary and not self.index.is_compressed)
+        if isinstance(self.index, VismArchive):
+            self.files = None
+            self.color_vectors = self.index.select_cells(self.selection)
+        elif self.lazy:
+            self.files = self.index.files
+            self.color_vectors = FrameSequence(self.index.frame_sources(),
+                                               self.index.cells,
+                                               self.selection)
+        else:
+            self.files = self.index.files
+            self._block, self.color_vectors = SharedFrames.allocate(
+                                                self.total, cells)
+
+    @property
+    def finished(self):
+        return self.loaded == self.total
+
+    def loaded_vectors(self):
+        """
+        :return zero-copy view of frames decoded so far
+        """
+        return self.color_vectors[:self.loaded]
+
+    def progress(self, start_time):
+        """
+        :return (files done, files total, bytes read, bytes total,
+                 estimated seconds left)
+        """
+        elapsed = time.perf_counter() - start_time
+        if self.bytes_read:
+            eta = elapsed*(self.bytes_total - self.bytes_read)/self.bytes_read
+        else:
+            eta = float('nan')
+        return (self.loaded, self.total, self.bytes_read, self.bytes_total,
+                eta)
+
+    def run(self, progress_callback=None):
+        """
+        decodes all frames in order
+        :param progress_callback: called with progress() tuple after
+                                  each decoded frame
+        """
+        start_time = time.perf_counter()
+        if self.lazy:
+            # frames are mapped or decompressed on demand
+            self.loaded = self.total
+            self.bytes_read = self.bytes_total
+            if progress_callback is not None:
+                progress_callback(self.progress(start_time))
+            return self.color_vectors
+        with self._lock:
+            if self._released:
+                return self.color_vectors
+            self._running = True
+        try:
+            # one file per task so that frames arrive as soon as they decode
+            for _ in ExecutorService.imap(decode_into_shared,
+                                          list(enumerate(self.files)),
+                                          (self._block.name,
+                                           self.color_vectors.shape,
+                                           self.index.is_binary,
+                                           self.selection),
+                                          chunk_size=1):
+                if self.cancelled:
+                    break
+                self.bytes_read += self.sizes[self.loaded]
+                self.loaded += 1
+                if progress_callback is not None:
+                    progress_callback(self.progress(start_time))
+        finally:
+            with self._lock:
+                self._running = False
+                released = self._released
+            if released:
+                self._free()
+        # workers only store, the cache is trimmed once per load
+        evict_cache()
+        return self.color_vectors
+
+    def cancel(self):
+        """
+        stops decoding, already decoded frames stay available
+        """
+        self.cancelled = True
+
+    def release(self):
+        """
+        stops decoding and frees the shared block, called when another
+        load replaces this one, views of the block must not be used after
+        """
+        self.cancel()
+        with self._lock:
+            self._released = True
+            if self._running:
+                # workers still write into the block, run() frees it
+                return
+        self._free()
+
+    def _free(self):
+        block, self._block = self._block, None
+        if block is not None:
+            self.color_vectors = None
+            SharedFrames.release(block)
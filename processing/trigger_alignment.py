@@ -0,0 +1,135 @@
+import numpy as np
+
+
+class TriggerAlignment:
+    """
+    Aligns vector files with rows of the plot table (.odt or table.txt).
+    Frame keys (iteration, stage or simulation time of each file) are
+    looked up in the sorted plot column with np.searchsorted, so a whole
+    directory is aligned in O((files + rows) log rows):
+        trigger, (starts, ends) = TriggerAlignment.align(plot_data, index)
+    trigger[i] is the plot row position of frame i, rows starts[i]
+    to ends[i] (exclusive) are the datapoints shown up to frame i.
+    """
+    MUMAX_TIME_COLUMN = '# t (s)'
+
+    @staticmethod
+    def _sorted(column):
+        column = np.asarray(column, dtype=np.float64)
+        # stable sort keeps equal keys in row order, first match = first row
+        order = np.argsort(column, kind='stable')
+        return order, column[order]
+
+    @staticmethod
+    def match_exact(column, keys, last=False):
+        """
+        :param column: plot column values, e.g. iteration numbers
+        :param keys: value of each frame
+        :param last: match last row with the key instead of the first one
+        :return row position of each frame, -1 where the key is missing
+        """
+        order, values = TriggerAlignment._sorted(column)
+        keys = np.asarray(keys, dtype=np.float64)
+        if not len(values):
+            return np.full(len(keys), -1, dtype=np.int64)
+        if last:
+            positions = np.searchsorted(values, keys, side='right') - 1
+        else:
+            positions = np.searchsorted(values, keys, side='left')
+        positions = np.clip(positions, 0, len(values) - 1)
+        found = values[positions] == keys
+        return np.where(found, order[positions], -1).astype(np.int64)
+
+    @staticmethod
+    def match_nearest(column, keys):
+        """
+        :param column: plot column values, e.g. simulation time
+        :param keys: value of each frame
+        :return position of the row closest to each frame, earlier row
+                wins a tie
+        """
+        order, values = TriggerAlignment._sorted(column)
+        keys = np.asarray(keys, dtype=np.float64)
+        right = np.searchsorted(values, keys, side='left')
+        left = np.clip(right - 1, 0, len(values) - 1)
+        right = np.clip(right, 0, len(values) - 1)
+        take_left = np.abs(keys - values[left]) <= np.abs(values[right] - keys)
+        return order[np.where(take_left, left, right)].astype(np.int64)
+
+    @staticmethod
+    def row_ranges(trigger, rows):
+        """
+        :param trigger: plot row position of each frame
+        :param rows: number of plot rows
+        :return starts, ends - rows between the previous and current frame
+        """
+        trigger = np.asarray(trigger, dtype=np.int64)
+        ends = np.minimum(trigger + 1, rows)
+        starts = np.concatenate(([0], ends[:-1]))
+        return np.minimum(starts, ends), ends
+
+    @staticmethod
+    def frame_keys(plot_data, index=None, iterations=None, mumax=False,
+                   frames=None):
+        """
+        picks the alignment mode available for this directory
+        :param iterations: iteration numbers parsed from filenames,
+                           used when index has none
+        :return mode ('exact', 'last' or 'nearest'), plot column, frame keys
+        """
+        if mumax:
+            column = plot_data[TriggerAlignment.MUMAX_TIME_COLUMN].values
+            if index is not None and np.isfinite(index.column('time')).all():
+                return 'nearest', column, index.column('time')
+            # headers without time, files assumed evenly spaced in time
+            return 'nearest', column, np.arange(frames)*np.max(column)/frames
+        driver = index.driver if index is not None else None
+        if driver is not None:
+            column_name = driver + '::Iteration'
+            if column_name in plot_data and \
+                                    (index.column('iteration') >= 0).all():
+                return 'exact', plot_data[column_name].values, \
+                                            index.column('iteration')
+            column_name = driver + '::Stage'
+            if column_name in plot_data and \
+                                    (index.column('stage') >= 0).all():
+                # file of a stage is saved when the stage ends
+                return 'last', plot_data[column_name].values, \
+                                            index.column('stage')
+            column_name = driver + '::Simulation time'
+            if column_name in plot_data and \
+                                    np.isfinite(index.column('time')).all():
+                return 'nearest', plot_data[column_name].values, \
+                                            index.column('time')
+        if iterations is not None:
+            column, keys = iterations
+            if column in plot_data:
+                return 'exact', plot_data[column].values, keys
+        raise ValueError("Cannot align plot data with vector files")
+
+    @staticmethod
+    def align(plot_data, index=None, iterations=None, mumax=False,
+              frames=None):
+        """
+        :param plot_data: plot table DataFrame
+        :param index: optional DirectoryIndex of aligned files
+        :param iterations: optional (plot column, iteration of each file)
+        :param mumax: mumax table.txt, matched by simulation time
+        :param frames: number of files, needed only without index
+        :return trigger (row positions of frames whose key was found),
+                (starts, ends) row ranges of each frame
+        """
+        mode, column, keys = TriggerAlignment.frame_keys(plot_data, index,
+                                                         iterations, mumax,
+                                                         frames)
+        if mode == 'nearest':
+            trigger = TriggerAlignment.match_nearest(column, keys)
+        else:
+            trigger = TriggerAlignment.match_exact(column, keys,
+                                                   last=mode == 'last')
+            missing = trigger < 0
+            if missing.any():
+                print("Plot data rows not found for {} files".format(
+                                                            missing.sum()))
+                trigger = trigger[~missing]
+        return trigger, TriggerAlignment.row_ranges(trigger, len(plot_data))
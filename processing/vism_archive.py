@@ -0,0 +1,361 @@
+import io
+import os
+import copy
+import sys
+import json
+import lzma
+import zlib
+import struct
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from processing.executor_service import ExecutorService
+from processing.shared_frames import SharedFrames, attach_shared
+from processing.read_plan import ReadPlan
+from processing.parse_cache import cached_binary_format_reader, \
+                                   cached_getRawVectors, evict_cache
+
+
+def shuffle_bytes(frame):
+    """
+    groups n-th bytes of all float32 values together, exponents and high
+    mantissa bytes of neighbouring cells are similar and compress better
+    """
+    return np.ascontiguousarray(
+                frame.astype('<f4').view(np.uint8).reshape(-1, 4).T).tobytes()
+
+
+def unshuffle_bytes(data, cells):
+    return np.ascontiguousarray(np.frombuffer(data, dtype=np.uint8)\
+                .reshape(4, -1).T).view('<f4').reshape(cells, 3)
+
+
+def compress_frame(frame, codec, level, shuffle):
+    data = shuffle_bytes(frame) if shuffle else \
+                                    frame.astype('<f4').tobytes()
+    if codec == 'zlib':
+        return zlib.compress(data, level)
+    elif codec == 'lzma':
+        return lzma.compress(data, preset=level)
+    elif codec == 'none':
+        return data
+    raise ValueError("Unknown codec {}".format(codec))
+
+
+def decompress_frame(data, codec, shuffle, cells):
+    if codec == 'zlib':
+        data = zlib.decompress(data)
+    elif codec == 'lzma':
+        data = lzma.decompress(data)
+    elif codec != 'none':
+        raise ValueError("Unknown codec {}".format(codec))
+    if shuffle:
+        return unshuffle_bytes(data, cells)
+    return np.frombuffer(data, dtype='<f4').reshape(cells, 3)
+
+
+def pack_frame(filename, binary, cells, codec, level, shuffle):
+    """
+    worker side - reads a single vector file and compresses it
+    """
+    if binary:
+        vectors = cached_binary_format_reader(filename)[1]
+    else:
+        vectors = cached_getRawVectors(filename)
+    if vectors.shape != (cells, 3):
+        raise ValueError("Inconsistent number of cells in {}".format(filename))
+    return compress_frame(vectors, codec, level, shuffle)
+
+
+def unpack_into_shared(frame, name, shape, path, codec, shuffle, cells,
+                       selection=None):
+    """
+    worker side - decompresses a single archived frame into
+    the shared frame block
+    :param frame: (position in the shared block, (offset, length)) pair
+    :param cells: number of cells of archived frames
+    :param selection: optional ReadPlan.selection() of stored cells
+    """
+    position, (offset, length) = frame
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(length)
+    block = attach_shared(name)
+    try:
+        frames = np.ndarray(shape, dtype=np.float32, buffer=block.buf)
+        frames[position] = ReadPlan.select(decompress_frame(data, codec,
+                                                            shuffle, cells),
+                                           selection)
+        del frames
+    finally:
+        block.close()
+
+
+class VismArchive:
+    """
+    Single file container of a simulation directory. Layout:
+        MAGIC
+        frame 0, frame 1, ... - each compressed independently
+        plot table            - compressed csv, optional
+        metadata json         - header, codec, trigger list, frame offsets
+        trailer               - metadata offset and length, MAGIC
+    Any frame is read with a single seek through the offset index.
+    Instances behave like a lazy, read-only array of shape (frames, N, 3),
+    with a ReadPlan selection only the planned cells are exposed.
+    """
+    MAGIC = b'VISMARC1'
+    VERSION = 1
+    EXTENSION = '.vism'
+    TRAILER = struct.Struct('<QQ')
+    CODECS = ('zlib', 'lzma', 'none')
+    INDEX_COLUMNS = ('stage', 'iteration', 'time')
+
+    def __init__(self, path, selection=None):
+        """
+        :param path: archive filename
+        :param selection: optional ReadPlan.selection() of cells to expose
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(VismArchive.MAGIC)) != VismArchive.MAGIC:
+                raise ValueError("{} is not a VISM archive".format(path))
+            f.seek(-(VismArchive.TRAILER.size + len(VismArchive.MAGIC)),
+                   os.SEEK_END)
+            offset, length = VismArchive.TRAILER.unpack(
+                                        f.read(VismArchive.TRAILER.size))
+            if f.read(len(VismArchive.MAGIC)) != VismArchive.MAGIC:
+                raise ValueError("Truncated VISM archive {}".format(path))
+            f.seek(offset)
+            self.meta = json.loads(f.read(length).decode('utf-8'))
+            if self.meta['version'] != VismArchive.VERSION:
+                raise ValueError("Unsupported VISM archive version {}".format(
+                                                        self.meta['version']))
+            self.plot_data = None
+            if self.meta['plot_data'] is not None:
+                plot_offset, plot_length = self.meta['plot_data']
+                f.seek(plot_offset)
+                table = zlib.decompress(f.read(plot_length)).decode('utf-8')
+                self.plot_data = pd.read_csv(io.StringIO(table),
+                                             float_precision='round_trip')
+        self.header = self.meta['header']
+        self.codec = self.meta['codec']
+        self.shuffle = self.meta['shuffle']
+        self.file_cells = int(self.meta['cells'])
+        self.selection = selection
+        self.cells = self.file_cells if selection is None else \
+                                        ReadPlan.selected_cells(selection)
+        self.offsets = [tuple(entry) for entry in self.meta['offsets']]
+        self.stages = self.meta['stages']
+        self.trigger_list = self.meta['trigger_list']
+        self.table = {column: np.array([np.nan if value is None else value
+                                        for value in values])
+                      for column, values in self.meta['index'].items()}
+        self.table['size'] = np.array([length for _, length in self.offsets])
+
+    def column(self, name):
+        return self.table[name]
+
+    def subset(self, positions):
+        """
+        :return lazy archive view of the given frames only
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        subset = copy.copy(self)
+        subset.offsets = [self.offsets[i] for i in positions]
+        subset.table = {column: values[positions]
+                        for column, values in self.table.items()}
+        return subset
+
+    def select_cells(self, selection):
+        """
+        :param selection: ReadPlan.selection() or None for all cells
+        :return lazy archive view exposing only selected cells
+        """
+        planned = copy.copy(self)
+        planned.selection = selection
+        planned.cells = self.file_cells if selection is None else \
+                                        ReadPlan.selected_cells(selection)
+        return planned
+
+    @staticmethod
+    def export(directory, path, codec='zlib', level=6, shuffle=True,
+               frame_selection=None, progress_callback=None):
+        """
+        packs a simulation directory into a single archive
+        :param directory: simulation output directory
+        :param path: archive filename
+        :param codec: one of CODECS
+        :param level: compression level (zlib level or lzma preset)
+        :param shuffle: float32 byte shuffle before compression
+        :param frame_selection: optional FrameSelection of exported frames
+        :param progress_callback: called with (frames done, frames total)
+        """
+        # imported here, multiprocessing_parse opens archives natively
+        from processing.multiprocessing_parse import MultiprocessingParse
+        if codec not in VismArchive.CODECS:
+            raise ValueError("Unknown codec {}".format(codec))
+        index, header, plot_data, stages, trigger_list = \
+            MultiprocessingParse.readFolderMetadata(directory,
+                                                    frame_selection)
+        files = index.files
+        offsets = []
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(VismArchive.MAGIC)
+                # frames are compressed in workers and written in order
+                for i, data in enumerate(ExecutorService.imap(pack_frame,
+                                                files,
+                                                (index.is_binary, index.cells,
+                                                 codec, level, shuffle))):
+                    offsets.append((f.tell(), len(data)))
+                    f.write(data)
+                    if progress_callback is not None:
+                        progress_callback(i + 1, len(files))
+                plot_entry = None
+                if plot_data is not None:
+                    table = zlib.compress(plot_data.to_csv(index=False)\
+                                                            .encode('utf-8'))
+                    plot_entry = (f.tell(), len(table))
+                    f.write(table)
+                meta = {
+                    'version': VismArchive.VERSION,
+                    'codec': codec,
+                    'shuffle': bool(shuffle),
+                    'cells': index.cells,
+                    'header': header,
+                    'names': [str(name) for name in index.column('name')],
+                    # enough of the directory index for FrameSelection
+                    'index': {column: [None if np.isnan(value) else value
+                                       for value in index.column(column)\
+                                                    .astype(float).tolist()]
+                              for column in VismArchive.INDEX_COLUMNS},
+                    'stages': int(stages),
+                    'trigger_list': None if trigger_list is None else
+                                        [int(i) for i in trigger_list],
+                    'plot_data': plot_entry,
+                    'offsets': offsets
+                }
+                encoded = json.dumps(meta).encode('utf-8')
+                meta_offset = f.tell()
+                f.write(encoded)
+                f.write(VismArchive.TRAILER.pack(meta_offset, len(encoded)))
+                f.write(VismArchive.MAGIC)
+            os.replace(tmp_path, path)
+            evict_cache()
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    @staticmethod
+    def is_archive(path):
+        return str(path).endswith(VismArchive.EXTENSION) and \
+                                                    os.path.isfile(path)
+
+    @property
+    def shape(self):
+        return (len(self.offsets), self.cells, 3)
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float32)
+
+    @property
+    def ndim(self):
+        return 3
+
+    @property
+    def nbytes(self):
+        return len(self.offsets)*self.cells*3*self.dtype.itemsize
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.frame(i)
+
+    def frame(self, i):
+        """
+        decompresses a single frame in the calling process
+        """
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Frame {} out of range {}".format(i, len(self)))
+        offset, length = self.offsets[i]
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        return np.array(ReadPlan.select(decompress_frame(data, self.codec,
+                                                         self.shuffle,
+                                                         self.file_cells),
+                                        self.selection), dtype=np.float32)
+
+    def read_frames(self, frames=None):
+        """
+        decompresses frames in worker processes into shared memory
+        :param frames: frame numbers, all if None
+        :return float32 array of shape (len(frames), N, 3)
+        """
+        if frames is None:
+            frames = range(len(self))
+        frames = list(frames)
+        block, output = SharedFrames.allocate(len(frames), self.cells)
+        try:
+            ExecutorService.map(unpack_into_shared,
+                                [(position, self.offsets[i])
+                                 for position, i in enumerate(frames)],
+                                (block.name, output.shape, self.path,
+                                 self.codec, self.shuffle, self.file_cells,
+                                 self.selection))
+        except BaseException:
+            del output
+            SharedFrames.release(block)
+            raise
+        return output
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        frames, rest = key[0], key[1:]
+        if isinstance(frames, (int, np.integer)):
+            output = self.frame(int(frames))
+            return output[rest] if rest else output
+        if isinstance(frames, slice) and not rest:
+            # slicing over frames stays lazy
+            return self.subset(range(len(self))[frames])
+        frame_numbers = range(len(self))[frames] \
+                                if isinstance(frames, slice) else frames
+        output = self.read_frames(frame_numbers)
+        return output[(slice(None), *rest)] if rest else output
+
+    def __array__(self, dtype=None, copy=None):
+        output = self.read_frames()
+        if dtype is not None:
+            output = output.astype(dtype, copy=False)
+        return output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Packs a simulation "
+                                     "directory into a VISM archive")
+    parser.add_argument('directory')
+    parser.add_argument('output', nargs='?', default=None)
+    parser.add_argument('--codec', default='zlib',
+                        choices=VismArchive.CODECS)
+    parser.add_argument('--level', type=int, default=6)
+    parser.add_argument('--no-shuffle', action='store_true')
+    args = parser.parse_args()
+    output = args.output or os.path.normpath(args.directory) + \
+                                                    VismArchive.EXTENSION
+    VismArchive.export(args.directory, output, codec=args.codec,
+                       level=args.level, shuffle=not args.no_shuffle,
+                       progress_callback=lambda done, total: print(
+                            "\r{}/{}".format(done, total), end='',
+                            file=sys.stderr))
+    print("\n{}: {:.1f} MB".format(output, os.path.getsize(output)/1024**2))
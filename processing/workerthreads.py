@@ -11,15 +11,20 @@ import time
 import signal
 
 class ThreadingWrapper:
-    def __init__(self, completeAction=None, exceptionAction=None, parent=None):
+    def __init__(self, completeAction=None, exceptionAction=None,
+                 progressAction=None, parent=None):
         """
         Creates a wrapper around GUI Thread management that displays 
         loading spinner
+        if progressAction is given, the threaded function receives
+        progress_callback keyword and each tuple it is called with is
+        passed to progressAction in the GUI thread
         """
         self.threadPool = QThreadPool()
         self.thread_worker = QThread()
         self.exceptionAction = exceptionAction
         self.completeAction = completeAction
+        self.progressAction = progressAction
         """
         part below sets up loading bar
         """
@@ -51,6 +56,10 @@ class ThreadingWrapper:
         self.worker = Worker(func, *args, **kwargs)
         self.worker.signals.exception.connect(self.thread_exception)
         self.worker.signals.finished.connect(self.thread_complete)
+        if self.progressAction:
+            self.worker.signals.progress.connect(self.progressAction)
+            self.worker.kwargs['progress_callback'] = \
+                                            self.worker.signals.progress.emit
         self.threadPool.start(self.worker)
 
         self.movie_screen.show()
@@ -76,6 +85,7 @@ class ThreadingWrapper:
 class ExceptionWorker(QObject):
     finished = pyqtSignal()
     exception = pyqtSignal(tuple)
+    progress = pyqtSignal(tuple)
 
 
 class ThreadWorker(QObject):
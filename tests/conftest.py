@@ -0,0 +1,54 @@
+import glob
+import os
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+# keep parse cache and directory indices of test runs out of home directory,
+# the variable has to be set before processing modules are imported
+os.environ.setdefault('VISM_CACHE_DIR', tempfile.mkdtemp(prefix='vism_test_'))
+
+import numpy as np
+import pytest
+
+
+EXAMPLE_DIR = os.path.join(ROOT, 'examples', '0200nm')
+TEXT_DIR = os.path.join(ROOT, 'test_folder')
+# frames of the example directory used by color tests
+FRAMES = 4
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """
+    fresh parse cache directory for a single test
+    """
+    pytest.importorskip('cython_modules.cython_parse')
+    from processing.parse_cache import ParseCache
+    path = str(tmp_path / 'cache')
+    monkeypatch.setattr(ParseCache, 'CACHE_DIR', path)
+    return path
+
+
+@pytest.fixture(scope='session')
+def example():
+    """
+    first FRAMES frames of the example directory
+    :return (vectors, outline, (xc, yc, zc))
+    """
+    cython_parse = pytest.importorskip('cython_modules.cython_parse')
+    files = sorted(glob.glob(os.path.join(EXAMPLE_DIR, '*.omf')))[:FRAMES]
+    header = cython_parse.binary_format_reader(files[0])[0]
+    vectors = np.array([cython_parse.binary_format_reader(f)[1]
+                        for f in files], dtype=np.float32)
+    dimensions = tuple(int(header[key])
+                       for key in ('xnodes', 'ynodes', 'znodes'))
+    return vectors, np.array(cython_parse.getLayerOutline(header)), \
+           dimensions
+
+
+def engine_for(example, **kwargs):
+    from processing.color_engine import ColorEngine
+    vectors, outline, (xc, yc, zc) = example
+    return ColorEngine(vectors, outline, xc, yc, zc, **kwargs)
@@ -0,0 +1,169 @@
+import numpy as np
+import pytest
+
+from conftest import FRAMES, engine_for
+
+pytest.importorskip('cython_modules.color_policy')
+from processing.ColorPolicy import ColorPolicy
+from processing.color_engine import ColorEngine
+
+VECTOR_SET = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+
+
+def reference(example, subsampling=1, picked_layer='all',
+              color_policy_type='Standard', hyperContrast=False):
+    vectors, outline, (xc, yc, zc) = example
+    return ColorPolicy.standard_procedure(outline, np.copy(vectors),
+                                          len(vectors), subsampling,
+                                          xc, yc, zc, picked_layer,
+                                          VECTOR_SET, color_policy_type,
+                                          hyperContrast)
+
+
+@pytest.mark.parametrize('policy', ['Standard', 'RGB policy'])
+@pytest.mark.parametrize('hyperContrast', [False, True])
+@pytest.mark.parametrize('subsampling, picked_layer', [
+    (1, 'all'),
+    (2, 'all'),
+    (2, 5),
+])
+def test_get_matches_standard_procedure(example, policy, hyperContrast,
+                                        subsampling, picked_layer):
+    color, outline, original_color = reference(example, subsampling,
+                                               picked_layer, policy,
+                                               hyperContrast)
+    engine = engine_for(example, subsampling=subsampling,
+                        picked_layer=picked_layer, vector_set=VECTOR_SET,
+                        color_policy_type=policy, hyperContrast=hyperContrast)
+    np.testing.assert_array_equal(engine.outline, outline)
+    # frames are computed out of order, as a scrubbing slider would
+    for i in (2, 0, 3, 1):
+        np.testing.assert_array_equal(engine.get(i, 'color'), color[i])
+        np.testing.assert_array_equal(engine.get(i, 'original_color'),
+                                      original_color[i])
+
+
+def test_cache_stays_within_bound(example):
+    engine = engine_for(example)
+    frame_bytes = engine.cached_bytes
+    engine = engine_for(example, cache_bytes=2*frame_bytes)
+    color = reference(example)[0]
+    for i in list(range(FRAMES)) + [0]:
+        np.testing.assert_array_equal(engine.get(i, 'color'), color[i])
+        assert engine.cached_bytes <= engine.cache_bytes
+    # least recently used frames were evicted
+    assert list(engine._cache) == [FRAMES - 1, 0]
+
+
+def test_prewarm_computes_neighbours(example):
+    engine = engine_for(example)
+    engine.prewarm(0)
+    worker = engine._worker
+    if worker is not None:
+        worker.join(timeout=60)
+    expected = {(0 + offset) % FRAMES for offset in ColorEngine.NEIGHBOURS}
+    assert expected <= set(engine._cache)
+
+
+def test_recolor_matches_fresh_engine(example):
+    calls = []
+
+    def derive(entry, outline):
+        calls.append(1)
+        return {'positions': outline[:, :3]}
+
+    engine = engine_for(example, derive=derive)
+    for i in range(FRAMES):
+        engine.get(i, 'color')
+    derived = len(calls)
+    generation = engine._generation
+    engine.recolor(VECTOR_SET, 'RGB policy', hyperContrast=True)
+    assert engine._generation == generation + 1
+    fresh = engine_for(example, color_policy_type='RGB policy',
+                       hyperContrast=True)
+    for i in range(FRAMES):
+        np.testing.assert_array_equal(engine.get(i, 'color'),
+                                      fresh.get(i, 'color'))
+    # cached frames are colored again, derived arrays are kept
+    assert len(calls) == derived
+
+
+def test_recolor_derives_color_arrays_again(example):
+    def derive_color(entry, outline):
+        return {'mean_color': entry['color'].mean(axis=0)}
+
+    engine = engine_for(example, derive_color=derive_color)
+    before = engine.get(1, 'mean_color')
+    engine.recolor(VECTOR_SET, 'RGB policy')
+    fresh = engine_for(example, color_policy_type='RGB policy')
+    np.testing.assert_array_equal(engine.get(1, 'mean_color'),
+                                  fresh.get(1, 'color').mean(axis=0))
+    assert not np.array_equal(engine.get(1, 'mean_color'), before)
+
+
+@pytest.mark.parametrize('policy', ['Standard', 'RGB policy'])
+def test_lut_colors_within_two_levels(example, policy):
+    color = reference(example, color_policy_type=policy)[0]
+    engine = engine_for(example, color_policy_type=policy, color_lut=True,
+                        color_format='uint8')
+    for i in range(FRAMES):
+        occupied = engine.get(i, 'occupancy') != 0
+        exact = np.rint(np.clip(color[i][occupied], 0, 1)*255)
+        looked_up = engine.get(i, 'color')[occupied, :3].astype(np.float64)
+        assert np.abs(looked_up - exact).max() <= 2
+
+
+def test_lut_recolor_swaps_table_only(example):
+    engine = engine_for(example, color_lut=True)
+    for i in range(FRAMES):
+        engine.get(i, 'color')
+    generation = engine._generation
+    engine.recolor(VECTOR_SET, 'RGB policy', color_lut=True)
+    # directions stay cached, only the table changed
+    assert engine._generation == generation
+    fresh = engine_for(example, color_policy_type='RGB policy',
+                       color_lut=True)
+    for i in range(FRAMES):
+        np.testing.assert_array_equal(engine.get(i, 'color'),
+                                      fresh.get(i, 'color'))
+
+
+@pytest.mark.parametrize('color_lut', [False, True])
+def test_recolor_toggles_lut(example, color_lut):
+    engine = engine_for(example, color_lut=not color_lut)
+    for i in range(FRAMES):
+        engine.get(i, 'color')
+    engine.recolor(VECTOR_SET, 'Standard', color_lut=color_lut)
+    fresh = engine_for(example, color_lut=color_lut)
+    for i in range(FRAMES):
+        np.testing.assert_array_equal(engine.get(i, 'color'),
+                                      fresh.get(i, 'color'))
+
+
+def test_lut_frames_keep_directions_only(example):
+    engine = engine_for(example, color_lut=True)
+    cells = example[0].shape[1]
+    for i in range(FRAMES):
+        entry = engine.frame(i)
+        assert set(entry) == {'direction', 'occupancy'}
+        assert entry['direction'].dtype == np.uint16
+    # uint16 direction and uint8 occupancy per cell
+    assert engine.cached_bytes == FRAMES*cells*3
+    fresh = engine_for(example)
+    np.testing.assert_array_equal(engine.get(2, 'original_color'),
+                                  fresh.get(2, 'original_color'))
+
+
+def test_lut_derive_color_gets_vectors(example):
+    def derive_color(entry, outline):
+        return {'ends': entry['original_color'] + entry['color']}
+
+    engine = engine_for(example, color_lut=True, derive_color=derive_color)
+    fresh = engine_for(example)
+    expected = fresh.get(1, 'original_color') + \
+               np.take(ColorPolicy.direction_lut(VECTOR_SET, 'Standard'),
+                       engine.frame(1)['direction'], axis=0)
+    occupied = engine.get(1, 'occupancy') != 0
+    np.testing.assert_array_equal(engine.get(1, 'ends')[occupied],
+                                  expected[occupied])
+    assert 'original_color' not in engine.frame(1)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from conftest import FRAMES, engine_for
+
+pytest.importorskip('cython_modules.color_policy')
+from processing.ColorPolicy import ColorPolicy
+
+
+@pytest.mark.parametrize('policy', ['Standard', 'RGB policy'])
+@pytest.mark.parametrize('hyperContrast', [False, True])
+def test_compact_colors_within_one_lsb(example, policy, hyperContrast):
+    exact = engine_for(example, color_policy_type=policy,
+                       hyperContrast=hyperContrast)
+    rgba8 = engine_for(example, color_policy_type=policy,
+                       hyperContrast=hyperContrast, color_format='uint8')
+    half = engine_for(example, color_policy_type=policy,
+                      hyperContrast=hyperContrast, color_format='float16')
+    for i in range(FRAMES):
+        # values as OpenGL clamps float colors
+        color = np.clip(exact.get(i, 'color'), 0, 1).astype(np.float64)
+        packed = rgba8.get(i, 'color')
+        assert packed.dtype == np.uint8
+        assert np.abs(packed[:, :3]/255 - color).max() <= 1/255
+        assert (packed[:, 3] == 255).all()
+        packed = half.get(i, 'color')
+        assert packed.dtype == np.float16
+        # one unit in the last place of float16 in [0.5, 1]
+        assert np.abs(packed[:, :3].astype(np.float64) - color).max() <= \
+                                                                    2.0**-11
+        assert (packed[:, 3] == 1).all()
+
+
+@pytest.mark.parametrize('color_format, reduction', [
+    ('float32', 1),
+    ('float16', 1.5),
+    ('uint8', 3),
+])
+def test_color_bytes_per_frame(example, color_format, reduction):
+    cells = example[0].shape[1]
+    packed = ColorPolicy.pack_colors(np.zeros((cells, 3), dtype=np.float32),
+                                     color_format)
+    # 51200 cells of the example take 614400 bytes as float32 RGB
+    assert packed.nbytes*reduction == cells*3*4
+
+
+def test_color_options_are_widget_options():
+    from Widgets.AnimatedWidget import AnimatedWidget
+    widget = AnimatedWidget()
+    options = [True, 1, 'all', 1, [[1, 0, 0]]*3, 'Standard', False]
+    widget.shareData(options=options)
+    widget.receivedOptions()
+    assert widget.color_format == 'float32'
+    assert widget.color_lut is False
+    widget.shareData(options=options + ['uint8', True, 16])
+    widget.receivedOptions()
+    assert widget.color_format == 'uint8' and widget.color_lut
+    assert widget.resolution == 16
@@ -0,0 +1,45 @@
+import os
+import glob
+import shutil
+
+import pytest
+
+from conftest import EXAMPLE_DIR
+
+pytest.importorskip('cython_modules.cython_parse')
+from processing.directory_index import DirectoryIndex
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    directory = tmp_path / 'data'
+    directory.mkdir()
+    for filename in sorted(glob.glob(os.path.join(EXAMPLE_DIR, '*.omf')))[:3]:
+        shutil.copy(filename, str(directory))
+    return str(directory)
+
+
+def test_index_is_kept_in_cache_dir(cache_dir, data_dir):
+    before = sorted(os.listdir(data_dir))
+    index = DirectoryIndex(data_dir)
+    assert sorted(os.listdir(data_dir)) == before
+    assert index.index_path.startswith(cache_dir)
+    assert os.path.isfile(index.index_path)
+
+
+def test_reopen_reads_only_new_files(cache_dir, data_dir, monkeypatch):
+    DirectoryIndex(data_dir)
+    read = []
+    read_entry = DirectoryIndex._read_entry
+    def counting_read_entry(path, stat=None, name=None):
+        read.append(path)
+        return read_entry(path, stat, name)
+    monkeypatch.setattr(DirectoryIndex, '_read_entry',
+                        staticmethod(counting_read_entry))
+    index = DirectoryIndex(data_dir)
+    assert read == []
+    assert len(index) == 3
+    shutil.copy(sorted(glob.glob(os.path.join(EXAMPLE_DIR, '*.omf')))[3],
+                data_dir)
+    index = DirectoryIndex(data_dir)
+    assert len(read) == 1 and len(index) == 4
@@ -0,0 +1,57 @@
+import threading
+import time
+from multiprocessing import TimeoutError
+
+import pytest
+
+from processing.executor_service import ExecutorService, CancelledError
+
+
+def slow(x):
+    time.sleep(2)
+    return x
+
+
+def square(x):
+    return x*x
+
+
+@pytest.fixture
+def two_workers():
+    workers = ExecutorService.WORKERS
+    ExecutorService.configure(workers=2)
+    yield
+    ExecutorService.configure(workers=workers)
+
+
+def test_stalled_call_leaves_other_calls_running(two_workers):
+    pool = ExecutorService.pool()
+    generation = ExecutorService._generation
+    results = {}
+
+    def other_call():
+        results['other'] = ExecutorService.map(square, list(range(20)),
+                                               chunk_size=1, timeout=30)
+
+    # started while the stalled call occupies a worker
+    thread = threading.Timer(0.2, other_call)
+    thread.start()
+    with pytest.raises(TimeoutError):
+        next(ExecutorService.imap(slow, [0], timeout=0.5))
+    thread.join(timeout=30)
+    assert results['other'] == [x*x for x in range(20)]
+    assert ExecutorService.pool() is pool
+    assert ExecutorService._generation == generation
+
+
+def test_worker_errors_are_propagated():
+    with pytest.raises(TypeError):
+        ExecutorService.map(square, [1, 'a', 3], chunk_size=1)
+    assert ExecutorService.map(square, [1, 2, 3]) == [1, 4, 9]
+
+
+def test_cancel_stops_running_calls(two_workers):
+    iterator = ExecutorService.imap(slow, [0, 1], chunk_size=1, timeout=30)
+    threading.Timer(0.3, ExecutorService.cancel).start()
+    with pytest.raises(CancelledError):
+        list(iterator)
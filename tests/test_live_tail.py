@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+pytest.importorskip('cython_modules.cython_parse')
+import processing.live_tail as live_tail
+from processing.live_tail import LiveTail
+from processing.streaming_loader import StreamingLoader
+from test_shared_frames import TEXT_FRAME, NAME, add_frames
+
+
+def count_scans(monkeypatch):
+    """
+    counts directory scans done by LiveTail
+    """
+    counter = []
+    class CountingIndex(live_tail.DirectoryIndex):
+        def __init__(self, *args, **kwargs):
+            counter.append(args)
+            super().__init__(*args, **kwargs)
+    monkeypatch.setattr(live_tail, 'DirectoryIndex', CountingIndex)
+    return counter
+
+
+def test_unchanged_directory_is_not_scanned(tmp_path, cache_dir,
+                                            monkeypatch):
+    directory = str(tmp_path)
+    add_frames(directory, 0, 2)
+    loader = StreamingLoader(directory)
+    loader.run()
+    tail = LiveTail(loader)
+    scans = count_scans(monkeypatch)
+    assert tail.poll() == (0, 0)
+    assert len(scans) == 1
+    assert tail.poll() == (0, 0)
+    assert len(scans) == 1
+
+    # a file being written is scanned again only when it changes
+    with open(TEXT_FRAME, 'rb') as f:
+        content = f.read()
+    path = os.path.join(directory, NAME.format(2, 2))
+    with open(path, 'wb') as f:
+        f.write(content[:len(content)//2])
+    assert tail.poll() == (0, 0)
+    assert len(scans) == 2
+    assert tail.poll() == (0, 0)
+    assert len(scans) == 2
+    with open(path, 'wb') as f:
+        f.write(content)
+    assert tail.poll() == (1, 0)
+    assert len(scans) == 3
+    assert len(loader.loaded_vectors()) == 3
+    loader.release()
@@ -0,0 +1,68 @@
+import os
+import glob
+import shutil
+
+import numpy as np
+import pytest
+
+from conftest import EXAMPLE_DIR
+
+pytest.importorskip('cython_modules.cython_parse')
+from cython_modules.cython_parse import binary_format_reader
+from processing.parse_cache import ParseCache, cached_binary_format_reader
+
+
+@pytest.fixture
+def omf_file(tmp_path):
+    source = sorted(glob.glob(os.path.join(EXAMPLE_DIR, '*.omf')))[0]
+    return shutil.copy(source, str(tmp_path / 'frame.omf'))
+
+
+def test_hit_does_not_read_source(cache_dir, omf_file, monkeypatch):
+    header, vectors = cached_binary_format_reader(omf_file)
+    assert ParseCache().lookup(omf_file, 'vectors') is not None
+
+    def fail(*args, **kwargs):
+        raise AssertionError("source was parsed on a cache hit")
+    monkeypatch.setattr('processing.parse_cache.binary_format_reader', fail)
+    real_open = open
+    def guarded_open(path, *args, **kwargs):
+        assert os.path.abspath(str(path)) != os.path.abspath(omf_file)
+        return real_open(path, *args, **kwargs)
+    monkeypatch.setattr('builtins.open', guarded_open)
+    cached_header, cached_vectors = cached_binary_format_reader(omf_file)
+    assert cached_header == header
+    np.testing.assert_array_equal(cached_vectors, vectors)
+
+
+def test_modified_file_misses(cache_dir, omf_file):
+    cached_binary_format_reader(omf_file)
+    stat = os.stat(omf_file)
+    os.utime(omf_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert ParseCache().lookup(omf_file, 'vectors') is None
+
+
+def test_evicted_entry_falls_back_to_parsing(cache_dir, omf_file,
+                                             monkeypatch):
+    cache = ParseCache()
+    cached_binary_format_reader(omf_file)
+    data_path, meta = cache.lookup(omf_file, 'vectors')
+    lookup = ParseCache.lookup
+
+    def evicting_lookup(self, filename, kind):
+        entry = lookup(self, filename, kind)
+        # another process evicts the entry right after lookup
+        os.remove(data_path)
+        return entry
+    monkeypatch.setattr(ParseCache, 'lookup', evicting_lookup)
+    header, vectors = cached_binary_format_reader(omf_file)
+    np.testing.assert_array_equal(vectors, binary_format_reader(omf_file)[1])
+
+
+def test_store_does_not_evict(cache_dir, omf_file):
+    cache = ParseCache(max_size=1)
+    cache.store(omf_file, 'vectors', np.zeros(4, dtype=np.float32), {})
+    assert cache.lookup(omf_file, 'vectors') is not None
+    cache.evict()
+    assert cache.lookup(omf_file, 'vectors') is None
+    assert not glob.glob(os.path.join(cache_dir, '*.npy'))
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from conftest import EXAMPLE_DIR, TEXT_DIR
+
+pytest.importorskip('cython_modules.color_policy')
+from cython_modules.cython_parse import getLayerOutline
+from processing.ColorPolicy import ColorPolicy
+from processing.multiprocessing_parse import MultiprocessingParse
+from processing.read_plan import ReadPlan
+from processing.streaming_loader import StreamingLoader
+
+
+def colors(vectors, header, subsampling, layer, policy):
+    xc, yc, zc = (int(header[key]) for key in ('xnodes', 'ynodes', 'znodes'))
+    vectors = np.asarray(vectors)
+    color, outline, original_color = ColorPolicy.standard_procedure(
+                            getLayerOutline(header), vectors, len(vectors),
+                            subsampling, xc, yc, zc, layer,
+                            color_policy_type=policy)
+    return color, original_color
+
+
+def test_from_string_keeps_frame_keys():
+    plan, rest = ReadPlan.from_string("layer=2, stages=1..5, subsampling=4")
+    assert plan.layer == 2 and plan.stride == (4, 4, 4)
+    assert rest == "stages=1..5"
+    assert ReadPlan.from_string("stride=2") == (None, "stride=2")
+
+
+@pytest.mark.parametrize('directory, subsampling, layer', [
+    (TEXT_DIR, 2, 3),
+    (TEXT_DIR, 1, 2),
+    (TEXT_DIR, 3, 'all'),
+    (EXAMPLE_DIR, 4, 'all'),
+])
+@pytest.mark.parametrize('policy', ['Standard', 'RGB policy'])
+def test_planned_load_matches_full_read(cache_dir, directory, subsampling,
+                                        layer, policy):
+    full, header, *_ = MultiprocessingParse.readFolder(directory)
+    expected = colors(full, header, subsampling, layer, policy)
+
+    plan = ReadPlan.from_options(subsampling, layer)
+    loader = StreamingLoader(directory, plan)
+    loader.run()
+    remaining_subsampling, remaining_layer = plan.remaining(subsampling,
+                                                            layer)
+    assert remaining_subsampling == 1
+    planned = colors(loader.loaded_vectors(), loader.header,
+                     remaining_subsampling, remaining_layer, policy)
+    for result, reference in zip(planned, expected):
+        np.testing.assert_array_equal(result, reference)
+    loader.release()
+
+
+def test_widget_options_are_not_applied_twice():
+    from Widgets.AnimatedWidget import AnimatedWidget
+    widget = AnimatedWidget()
+    widget.shareData(options=[False, 4, 3, 1, [[1, 0, 0]]*3, 'Standard',
+                              False],
+                     read_plan=ReadPlan.from_options(4, 3))
+    widget.receivedOptions()
+    assert (widget.subsampling, widget.layer) == (1, 0)
+    widget.shareData(read_plan=None)
+    widget.receivedOptions()
+    assert (widget.subsampling, widget.layer) == (4, 3)
@@ -0,0 +1,63 @@
+import os
+import glob
+import shutil
+
+import numpy as np
+import pytest
+
+from conftest import TEXT_DIR
+
+pytest.importorskip('cython_modules.color_policy')
+from processing.shared_frames import SharedFrames
+from processing.streaming_loader import StreamingLoader
+from processing.live_tail import LiveTail
+from processing.color_engine import ColorEngine
+
+TEXT_FRAME = glob.glob(os.path.join(TEXT_DIR, '*.omf'))[0]
+NAME = 'm-Oxs_TimeDriver-Magnetization-{:02d}-{:07d}.omf'
+
+
+def add_frames(directory, start, count):
+    for i in range(start, start + count):
+        shutil.copy(TEXT_FRAME, os.path.join(directory, NAME.format(i, i)))
+
+
+@pytest.fixture
+def text_dir(tmp_path, cache_dir):
+    directory = str(tmp_path / 'text')
+    os.mkdir(directory)
+    add_frames(directory, 0, 2)
+    return directory
+
+
+def test_release_frees_block(text_dir):
+    loader = StreamingLoader(text_dir)
+    loader.run()
+    block = loader._block
+    loader.release()
+    assert block not in SharedFrames._blocks
+    assert block not in SharedFrames._unclosed
+
+
+def test_grown_block_is_freed_once_views_move(text_dir):
+    loader = StreamingLoader(text_dir)
+    loader.run()
+    engine = ColorEngine(loader.loaded_vectors(), np.zeros((35*35*5, 3)),
+                         35, 35, 5)
+    tail = LiveTail(loader)
+    old_block = loader._block
+    add_frames(text_dir, 2, 1)
+    assert tail.poll()[0] == 1
+    assert loader._block is not old_block
+    # engine still maps the previous block
+    assert old_block in SharedFrames._unclosed
+    loaded = loader.loaded_vectors()
+    engine.replace(loaded[:2])
+    engine.extend(loaded[2:])
+    SharedFrames.collect()
+    assert old_block not in SharedFrames._unclosed
+    fresh = ColorEngine(loaded, np.zeros((35*35*5, 3)), 35, 35, 5)
+    for i in range(3):
+        np.testing.assert_array_equal(engine.get(i, 'color'),
+                                      fresh.get(i, 'color'))
+    loader.release()